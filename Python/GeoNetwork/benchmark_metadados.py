@@ -0,0 +1,216 @@
+#Matheus Dias de Aviz
+#Benchmark do pipeline CSV -> XML (MGB 2.0) com CSV sintético (mesmas colunas de tb_mgb2_metadata.cvs)
+#Fases medidas registro a registro num processo: leitura do CSV, preenchimento do template, serialização,
+#gravação (pasta/ZIP de saida_metadados.py) e inserção (SQLite no lugar do PostgreSQL, mesmo upsert da v2)
+#Também mede a v1 completa (gerar_metadados_xml, com o pool de processos) de ponta a ponta
+#Resultado em JSON (uma linha por execução) para acompanhar regressões
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from lxml import etree as ET
+
+from saida_metadados import abrir_saida
+from template_compilado import TemplateCompilado
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PASTA, "v1_local"))
+sys.path.insert(0, os.path.join(PASTA, "..", "MSSQL"))
+from csvToXML_metadata_v1 import gerar_metadados_xml
+from metricas_centroide import pico_rss_mb
+
+COLUNAS = [
+    'LanguageCode', 'characterSet', 'hierarchyLevel', 'contact_individualName', 'contact_organisationName',
+    'contact_positionName', 'contact_phone', 'contact_deliveryPoint', 'contact_city', 'contact_administrativeArea',
+    'contact_postalCode', 'contact_country', 'contact_email', 'contact_role',
+    'MD_Keywords1', 'MD_Keywords2', 'MD_Keywords3', 'MD_Keywords4', 'dateStamp', 'title', 'date_creation', 'abstract',
+    'status_codeListValue', 'MD_SpatialRepresentationTypeCode_codeListValue', 'spatialResolution_denominator',
+    'topicCategory', 'westBoundLongitude', 'eastBoundLongitude', 'southBoundLatitude', 'northBoundLatitude',
+]
+ORGANIZACOES = ["Companhia Paulista", "Secretaria de Meio Ambiente", "Instituto Geográfico", "Prefeitura Municipal"]
+CIDADES = ["São Paulo", "Campinas", "Santos", "Sorocaba", "Ribeirão Preto", "Bauru"]
+TEMAS = ["environment", "boundaries", "imageryBaseMapsEarthCover", "inlandWaters", "transportation", "planningCadastre"]
+STATUS = ["completed", "onGoing", "underDevelopment"]
+
+# --- CSV SINTÉTICO ---
+def gerar_csv_sintetico(caminho, n_registros, semente=42, tamanho_bloco=100000):
+    # Gravado em blocos (1M linhas de uma vez ocupam alguns GB em objetos Python); 0 a 4 palavras-chave por linha
+    rng = np.random.default_rng(semente)
+    with open(caminho, "w", encoding="utf-8", newline="") as f:
+        f.write(";".join(COLUNAS) + "\n")
+        for inicio in range(0, n_registros, tamanho_bloco):
+            n = min(tamanho_bloco, n_registros - inicio)
+            ids = np.arange(inicio, inicio + n)
+            org = rng.integers(0, len(ORGANIZACOES), n)
+            n_palavras = rng.integers(0, 5, n)
+            oeste = np.round(rng.uniform(-53.1, -45.0, n), 4)
+            sul = np.round(rng.uniform(-25.3, -20.5, n), 4)
+            bloco = pd.DataFrame({
+                'LanguageCode': 'por', 'characterSet': 'utf8', 'hierarchyLevel': 'dataset',
+                'contact_individualName': [f"Responsável {i % 997}" for i in ids],
+                'contact_organisationName': np.array(ORGANIZACOES)[org],
+                'contact_positionName': 'Analista',
+                'contact_phone': [f"+55 11 {3000 + i % 6000:04d}-{i % 10000:04d}" for i in ids],
+                'contact_deliveryPoint': [f"Rua {i % 500}, {i % 2000}" for i in ids],
+                'contact_city': np.array(CIDADES)[rng.integers(0, len(CIDADES), n)],
+                'contact_administrativeArea': 'São Paulo',
+                'contact_postalCode': [f"{1000 + i % 90000:05d}-000" for i in ids],
+                'contact_country': 'Brasil',
+                'contact_email': [f"contato{i % 997}@sp.gov.br" for i in ids],
+                'contact_role': 'author',
+                'MD_Keywords1': np.where(n_palavras >= 1, "Cartografia", ""),
+                'MD_Keywords2': np.where(n_palavras >= 2, "Limites", ""),
+                'MD_Keywords3': np.where(n_palavras >= 3, "Hidrografia", ""),
+                'MD_Keywords4': np.where(n_palavras >= 4, "São Paulo", ""),
+                'dateStamp': '2025-08-29T11:07:43Z',
+                'title': [f"Camada sintética {i}" for i in ids],
+                'date_creation': np.where(rng.random(n) < 0.5, "2025-08-01T12:00:00-03:00", "2025-08-01"),
+                'abstract': [f"Resumo descritivo da camada sintética {i}, gerada para o benchmark." for i in ids],
+                'status_codeListValue': np.array(STATUS)[rng.integers(0, len(STATUS), n)],
+                'MD_SpatialRepresentationTypeCode_codeListValue': 'vector',
+                'spatialResolution_denominator': rng.choice(['1000', '5000', '10000', '25000'], n),
+                'topicCategory': np.array(TEMAS)[rng.integers(0, len(TEMAS), n)],
+                'westBoundLongitude': oeste, 'eastBoundLongitude': np.round(oeste + rng.uniform(0.01, 2.0, n), 4),
+                'southBoundLatitude': sul, 'northBoundLatitude': np.round(sul + rng.uniform(0.01, 2.0, n), 4),
+            }, columns=COLUNAS)
+            bloco.to_csv(f, sep=";", index=False, header=False)
+
+# --- FASES, REGISTRO A REGISTRO ---
+def medir_fases(csv_path, template_path, pasta_saida, formato_saida, arquivo_banco, tamanho_chunk=20000, tamanho_lote=1000):
+    tempos = {"leitura": 0.0, "preenchimento": 0.0, "serializacao": 0.0, "gravacao": 0.0, "insercao": 0.0}
+    relogio = time.perf_counter
+
+    inicio = relogio()
+    template = TemplateCompilado(template_path, data_adaptativa=True)
+    tempos["compilacao_template"] = relogio() - inicio
+
+    if os.path.exists(arquivo_banco):
+        os.remove(arquivo_banco)
+    banco = sqlite3.connect(arquivo_banco)
+    banco.execute("CREATE TABLE registros (id TEXT PRIMARY KEY, conteudo_xml TEXT)")
+    upsert = ("INSERT INTO registros (id, conteudo_xml) VALUES (?, ?) "
+              "ON CONFLICT (id) DO UPDATE SET conteudo_xml = excluded.conteudo_xml")
+    saida = abrir_saida(pasta_saida, {"formato_saida": formato_saida})
+
+    n_registros = 0
+    lote = []
+    leitor = pd.read_csv(csv_path, sep=';', header=0, dtype=str, chunksize=tamanho_chunk)
+    while True:
+        inicio = relogio()
+        chunk = next(leitor, None)
+        if chunk is None:
+            tempos["leitura"] += relogio() - inicio
+            break
+        chunk = chunk.fillna('')
+        chunk = chunk.loc[chunk['LanguageCode'] != '']
+        linhas = list(zip(chunk.index, chunk.to_dict('records')))
+        tempos["leitura"] += relogio() - inicio
+
+        for index, row in linhas:
+            t0 = relogio()
+            file_identifier, root = template.preencher(row)
+            t1 = relogio()
+            xml = ET.tostring(root, pretty_print=True, xml_declaration=True, encoding='utf-8')
+            t2 = relogio()
+            saida.gravar(file_identifier, f"metadado_{index}.xml", xml)
+            t3 = relogio()
+            lote.append((file_identifier, xml.decode('utf-8')))
+            if len(lote) >= tamanho_lote:
+                banco.executemany(upsert, lote)
+                banco.commit()
+                lote = []
+            t4 = relogio()
+            tempos["preenchimento"] += t1 - t0
+            tempos["serializacao"] += t2 - t1
+            tempos["gravacao"] += t3 - t2
+            tempos["insercao"] += t4 - t3
+        n_registros += len(linhas)
+
+    inicio = relogio()
+    if lote:
+        banco.executemany(upsert, lote)
+        banco.commit()
+    banco.close()
+    tempos["insercao"] += relogio() - inicio
+    inicio = relogio()
+    saida.fechar()
+    tempos["gravacao"] += relogio() - inicio
+
+    total = sum(tempos.values())
+    return {
+        "registros": n_registros,
+        "formato_saida": formato_saida,
+        "segundos": round(total, 3),
+        "registros_por_s": round(n_registros / total, 1) if total > 0 else None,
+        "fases_s": {fase: round(segundos, 3) for fase, segundos in tempos.items()},
+        "us_por_registro": {fase: round(segundos / n_registros * 1e6, 1) for fase, segundos in tempos.items()} if n_registros else {},
+        "saida_mb": round(saida.bytes / 1e6, 1),
+    }
+
+def medir_v1(csv_path, template_path, pasta_saida, config):
+    # gerar_metadados_xml de ponta a ponta (pool de processos + saída); o print por registro vai para o devnull
+    inicio = time.perf_counter()
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        gerar_metadados_xml(csv_path, template_path, pasta_saida, config)
+    return time.perf_counter() - inicio
+
+def executar_benchmark(n_registros, pasta_trabalho, template_path, formatos=("arquivos", "zip"), config_v1=None):
+    print(f"\n--- BENCHMARK COM {n_registros} REGISTROS ---")
+    os.makedirs(pasta_trabalho, exist_ok=True)
+    csv_path = os.path.join(pasta_trabalho, f"sintetico_{n_registros}.csv")
+    inicio = time.perf_counter()
+    gerar_csv_sintetico(csv_path, n_registros)
+    print(f"CSV sintético gerado em {time.perf_counter() - inicio:.1f} s ({os.path.getsize(csv_path) / 1e6:.1f} MB)")
+
+    fases = []
+    for formato in formatos:
+        pasta_saida = os.path.join(pasta_trabalho, f"saida_{formato}")
+        shutil.rmtree(pasta_saida, ignore_errors=True)
+        resultado = medir_fases(csv_path, template_path, pasta_saida, formato, os.path.join(pasta_trabalho, "banco.sqlite"))
+        fases.append(resultado)
+        print(f"Fases ({formato}): {resultado['registros_por_s']:,.0f} registros/s | µs por registro: {resultado['us_por_registro']}")
+        shutil.rmtree(pasta_saida, ignore_errors=True)
+
+    v1 = {}
+    config_v1 = config_v1 or {}
+    for formato in formatos:
+        pasta_saida = os.path.join(pasta_trabalho, f"v1_{formato}")
+        shutil.rmtree(pasta_saida, ignore_errors=True)
+        segundos = medir_v1(csv_path, template_path, pasta_saida, {**config_v1, "formato_saida": formato})
+        v1[formato] = {"segundos": round(segundos, 3), "registros_por_s": round(n_registros / segundos, 1)}
+        print(f"v1 completa ({formato}, {config_v1.get('n_processos', os.cpu_count())} processos): "
+              f"{n_registros / segundos:,.0f} registros/s")
+        shutil.rmtree(pasta_saida, ignore_errors=True)
+
+    os.remove(csv_path)
+    os.remove(os.path.join(pasta_trabalho, "banco.sqlite"))
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "n_registros": n_registros,
+        "plataforma": {"python": platform.python_version(), "sistema": platform.platform(), "cpus": os.cpu_count()},
+        "fases": fases,
+        "v1_completa": v1,
+        "pico_rss_mb": pico_rss_mb(),
+    }
+
+if __name__ == "__main__":
+    ESCALAS = [1000, 10000, 100000]  # até 1000000 (alguns GB de XML em disco no formato "arquivos")
+    PASTA_TRABALHO = os.path.join(PASTA, "benchmark_tmp")
+    CAMINHO_TEMPLATE = os.path.join(PASTA, "tamplate_mgb20.xml")
+    ARQUIVO_RESULTADOS = os.path.join(PASTA, "benchmark_metadados.jsonl")
+    CONFIG_V1 = {"n_processos": os.cpu_count() or 1, "tamanho_chunk": 20000, "tamanho_lote": 500}
+
+    for n_registros in ESCALAS:
+        resultado = executar_benchmark(n_registros, PASTA_TRABALHO, CAMINHO_TEMPLATE, config_v1=CONFIG_V1)
+        with open(ARQUIVO_RESULTADOS, "a", encoding="utf-8") as f:
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    shutil.rmtree(PASTA_TRABALHO, ignore_errors=True)
+    print(f"✅ Resultados anexados em {ARQUIVO_RESULTADOS}")
@@ -0,0 +1,132 @@
+#Matheus Dias de Aviz
+#Geração CSV -> XML (MGB 2.0) em blocos e em paralelo
+#O CSV é lido em chunks (pd.read_csv com chunksize) e cada chunk vira lotes de registros enviados a um pool de processos
+#Cada processo compila o template uma vez e devolve o XML já serializado em bytes; a ordem do CSV é mantida
+#Erros ficam presos ao registro (o lote segue) e o número de lotes em andamento é limitado (memória constante)
+#Validação XSD opcional dentro dos workers: inválidos saem com o erro (e o XML) para o arquivo de rejeitados
+#Identificadores estáveis: coluna de id do CSV ou uuid5 da chave natural (sem os dois, uuid4 a cada execução)
+import itertools
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from lxml import etree as ET
+
+from template_compilado import TemplateCompilado
+from validacao_xsd import XSD_GMD, PASTA_CACHE_XSD, compilar_schema, erros_validacao
+
+CONFIG_GERACAO = {
+    "n_processos": os.cpu_count() or 1,  # 1 = tudo no processo principal
+    "tamanho_chunk": 20000,              # linhas do CSV lidas por vez
+    "tamanho_lote": 500,                 # registros por tarefa do pool
+    "lotes_por_processo": 4,             # lotes em andamento por processo (limita a memória)
+    "pretty_print": True,
+    "coluna_id": None,                   # coluna do CSV com o fileIdentifier (usada quando preenchida)
+    "chave_natural": None,               # ex.: ["title", "contact_organisationName"] -> uuid5 estável
+    "validar_xsd": False,                # valida cada registro contra o schema ISO 19139 (ver validacao_xsd.py)
+    "xsd_url": XSD_GMD,
+    "pasta_cache_xsd": PASTA_CACHE_XSD,
+}
+
+# Namespace fixo dos uuid5: a mesma chave gera o mesmo identificador em qualquer execução
+NAMESPACE_MGB = uuid.uuid5(uuid.NAMESPACE_URL, "mgb20/fileIdentifier")
+
+_template = None
+_schema = None
+
+def _iniciar_worker(template_path, data_adaptativa, xsd=None):
+    # xsd: (url, pasta do cache) ou None para não validar
+    global _template, _schema
+    _template = TemplateCompilado(template_path, data_adaptativa)
+    _schema = compilar_schema(*xsd) if xsd else None
+
+def gerador_identificadores(row, coluna_id=None, chave_natural=None):
+    # Primeira chamada: fileIdentifier; seguintes: uuid dos blocos de contato, derivados dele
+    if coluna_id and row.get(coluna_id):
+        file_identifier = str(row[coluna_id])
+    elif chave_natural:
+        file_identifier = str(uuid.uuid5(NAMESPACE_MGB, "|".join(str(row.get(c, '')) for c in chave_natural)))
+    else:
+        return lambda: str(uuid.uuid4())
+    contador = itertools.count()
+    def proximo():
+        n = next(contador)
+        return file_identifier if n == 0 else str(uuid.uuid5(NAMESPACE_MGB, f"{file_identifier}|{n}"))
+    return proximo
+
+def _gerar_lote(lote, pretty_print=True, coluna_id=None, chave_natural=None):
+    # lote: [(índice no CSV, dict da linha)] -> ([(índice, título, fileIdentifier, xml em bytes ou None, erro ou None)],
+    #                                           segundos gastos na validação XSD)
+    resultado = []
+    segundos_validacao = 0.0
+    for index, row in lote:
+        try:
+            file_identifier, root = _template.preencher(row, gerador_identificadores(row, coluna_id, chave_natural))
+            erro = None
+            if _schema is not None:
+                inicio = time.time()
+                erro = erros_validacao(_schema, root)
+                segundos_validacao += time.time() - inicio
+            xml = ET.tostring(root, pretty_print=pretty_print, xml_declaration=True, encoding='utf-8')
+            resultado.append((index, row.get('title', ''), file_identifier, xml, erro))
+        except Exception as e:
+            resultado.append((index, row.get('title', ''), None, None, f"{type(e).__name__}: {e}"))
+    return resultado, segundos_validacao
+
+def ler_lotes(csv_path, tamanho_chunk, tamanho_lote):
+    # Linhas válidas (LanguageCode preenchido) em lotes, sem carregar o CSV inteiro
+    for chunk in pd.read_csv(csv_path, sep=';', header=0, dtype=str, chunksize=tamanho_chunk):
+        chunk = chunk.fillna('')
+        chunk = chunk.loc[chunk['LanguageCode'] != '']
+        registros = list(zip(chunk.index, chunk.to_dict('records')))
+        for inicio in range(0, len(registros), tamanho_lote):
+            yield registros[inicio:inicio + tamanho_lote]
+
+def gerar_registros(csv_path, template_path, data_adaptativa=True, config=None, estatisticas=None):
+    # Gerador de (índice, título, fileIdentifier, xml, erro) na ordem do CSV.
+    # Com erro e xml preenchidos, o registro foi gerado mas reprovado na validação XSD.
+    # estatisticas (dict, opcional) recebe registros, validados e segundos de validação somados dos workers
+    config = {**CONFIG_GERACAO, **(config or {})}
+    estatisticas = estatisticas if estatisticas is not None else {}
+    estatisticas.update({"registros": 0, "validados": 0, "segundos_validacao": 0.0})
+    lotes = ler_lotes(csv_path, config["tamanho_chunk"], config["tamanho_lote"])
+    opcoes = (config["pretty_print"], config["coluna_id"], config["chave_natural"])
+    xsd = (config["xsd_url"], config["pasta_cache_xsd"]) if config["validar_xsd"] else None
+    if xsd:
+        # Baixa/compila no processo principal primeiro: cache em disco pronto antes dos workers e erro de schema cedo
+        compilar_schema(*xsd)
+
+    def contabilizar(resultado_lote):
+        resultado, segundos_validacao = resultado_lote
+        estatisticas["registros"] += len(resultado)
+        if xsd:
+            estatisticas["validados"] += sum(1 for r in resultado if r[3] is not None)
+            estatisticas["segundos_validacao"] += segundos_validacao
+        return resultado
+
+    if config["n_processos"] <= 1:
+        _iniciar_worker(template_path, data_adaptativa, xsd)
+        for lote in lotes:
+            yield from contabilizar(_gerar_lote(lote, *opcoes))
+        return
+
+    max_pendentes = config["n_processos"] * config["lotes_por_processo"]
+    with ProcessPoolExecutor(max_workers=config["n_processos"], initializer=_iniciar_worker,
+                             initargs=(template_path, data_adaptativa, xsd)) as executor:
+        pendentes = deque()
+        for lote in lotes:
+            pendentes.append(executor.submit(_gerar_lote, lote, *opcoes))
+            if len(pendentes) >= max_pendentes:
+                yield from contabilizar(pendentes.popleft().result())
+        while pendentes:
+            yield from contabilizar(pendentes.popleft().result())
+
+def resumo_validacao(estatisticas):
+    if not estatisticas.get("validados"):
+        return None
+    segundos = estatisticas["segundos_validacao"]
+    return (f"Validação XSD: {estatisticas['validados']} registros em {segundos:.1f} s de CPU "
+            f"({estatisticas['validados'] / segundos if segundos > 0 else 0:.0f} registros/s por processo)")
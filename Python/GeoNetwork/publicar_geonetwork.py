@@ -0,0 +1,423 @@
+#Matheus Dias de Aviz
+#Publicação em lote dos XML gerados (v1 local) num GeoNetwork: CSW-T (csw-publication) ou API REST (PUT /records)
+#Conexões HTTP persistentes (keep-alive) num pool, lotes enviados por até n_conexoes threads,
+#novas tentativas com espera exponencial para falhas de rede/5xx/429, e um log de progresso (JSON por linha)
+#que permite retomar a publicação: registros já publicados são pulados na próxima execução
+#CSW Insert não é idempotente: depois de uma falha em que o servidor pode ter gravado (resposta perdida, timeout, 5xx),
+#os registros do lote são conferidos por GetRecordById antes de reenviar só os que não estão no catálogo
+#Só biblioteca padrão (http.client); há um servidor de teste local no fim do arquivo para validar sem o GeoNetwork
+import base64
+import http.client
+import json
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+from lxml import etree as ET
+
+from saida_metadados import ler_registros
+
+CONFIG_PUBLICACAO = {
+    "url": "http://localhost:8080/geonetwork",
+    "protocolo": "csw",              # "csw" (Transaction Insert/Update em lote) ou "rest" (PUT /srv/api/records)
+    "usuario": None,
+    "senha": None,
+    "n_conexoes": 4,                 # conexões persistentes = lotes em paralelo
+    "tamanho_lote": 50,              # registros por Transaction (csw) ou por tarefa (rest)
+    "max_tentativas": 5,
+    "espera_inicial": 1.0,           # segundos; dobra a cada tentativa (com variação aleatória de até 25%)
+    "timeout": 120,
+    "arquivo_progresso": "publicacao_progresso.jsonl",
+    "republicar": False,             # True: registros já publicados são reenviados (csw: Update)
+}
+
+CAMINHO_CSW = "/srv/eng/csw-publication"
+CAMINHO_CSW_CONSULTA = "/srv/eng/csw"
+CAMINHO_REST = "/srv/api/records?metadataType=METADATA&uuidProcessing=OVERWRITE&publishToAll=true"
+STATUS_REPETIR = (429, 500, 502, 503, 504)
+NS_CSW = "http://www.opengis.net/cat/csw/2.0.2"
+NS_GMD = "http://www.isotc211.org/2005/gmd"
+NS_GCO = "http://www.isotc211.org/2005/gco"
+
+# --- POOL DE CONEXÕES PERSISTENTES ---
+class PoolConexoes:
+    def __init__(self, url, tamanho, timeout=120):
+        partes = urlsplit(url)
+        self.classe = http.client.HTTPSConnection if partes.scheme == "https" else http.client.HTTPConnection
+        self.host = partes.hostname
+        self.porta = partes.port
+        self.prefixo = partes.path.rstrip("/")
+        self.timeout = timeout
+        self.livres = queue.LifoQueue(maxsize=tamanho)
+        self.abertas = 0
+        self.trava = threading.Lock()
+
+    def obter(self):
+        try:
+            return self.livres.get_nowait()
+        except queue.Empty:
+            with self.trava:
+                self.abertas += 1
+            return self.classe(self.host, self.porta, timeout=self.timeout)
+
+    def devolver(self, conn):
+        try:
+            self.livres.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def fechar(self):
+        while not self.livres.empty():
+            self.livres.get_nowait().close()
+
+def cabecalhos_base(config):
+    cabecalhos = {"Accept": "application/xml", "Connection": "keep-alive"}
+    if config.get("usuario"):
+        credencial = base64.b64encode(f"{config['usuario']}:{config['senha']}".encode()).decode()
+        cabecalhos["Authorization"] = f"Basic {credencial}"
+    if config["protocolo"] == "rest":
+        # GeoNetwork 4 só confere se o cabeçalho X-XSRF-TOKEN é igual ao cookie XSRF-TOKEN
+        token = secrets.token_hex(16)
+        cabecalhos["Cookie"] = f"XSRF-TOKEN={token}"
+        cabecalhos["X-XSRF-TOKEN"] = token
+    return cabecalhos
+
+class FalhaIncerta(Exception):
+    # Requisição não idempotente enviada por inteiro, sem resposta conclusiva: o servidor pode ter gravado
+    pass
+
+def esperar(config, tentativa):
+    time.sleep(config["espera_inicial"] * 2 ** tentativa * (1 + random.random() * 0.25))
+
+def requisitar(pool, metodo, caminho, corpo, cabecalhos, config, idempotente=True):
+    # Retorna (status, corpo da resposta); repete falhas de rede e STATUS_REPETIR com espera exponencial.
+    # idempotente=False (CSW Insert): só repete o que não chegou a ser processado (erro no envio, 429);
+    # resposta perdida, timeout e 5xx levantam FalhaIncerta para quem chamou conferir o que foi gravado
+    ultimo_erro = None
+    for tentativa in range(config["max_tentativas"]):
+        conn = pool.obter()
+        try:
+            conn.request(metodo, pool.prefixo + caminho, body=corpo, headers=cabecalhos)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            ultimo_erro = f"{type(e).__name__}: {e}"
+        else:
+            try:
+                resposta = conn.getresponse()
+                dados = resposta.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                ultimo_erro = f"{type(e).__name__}: {e}"
+                if not idempotente:
+                    raise FalhaIncerta(ultimo_erro)
+            else:
+                if resposta.will_close:
+                    conn.close()
+                else:
+                    pool.devolver(conn)
+                if resposta.status not in STATUS_REPETIR:
+                    return resposta.status, dados
+                ultimo_erro = f"HTTP {resposta.status}"
+                if not idempotente and resposta.status != 429:
+                    raise FalhaIncerta(ultimo_erro)
+        if tentativa + 1 < config["max_tentativas"]:
+            esperar(config, tentativa)
+    raise RuntimeError(f"{config['max_tentativas']} tentativas sem sucesso ({ultimo_erro})")
+
+# --- ENVIO DE UM LOTE ---
+def sem_declaracao(xml):
+    # Registro dentro da Transaction: sem a declaração <?xml ...?>
+    xml = xml.lstrip()
+    if xml.startswith(b"<?xml"):
+        xml = xml[xml.index(b"?>") + 2:].lstrip()
+    return xml
+
+def transacao_csw(lote, atualizar=False):
+    registros = [sem_declaracao(xml) for _, xml in lote]
+    if atualizar:
+        operacoes = b"".join(b"<csw:Update>" + r + b"</csw:Update>" for r in registros)
+    else:
+        operacoes = b"<csw:Insert>" + b"".join(registros) + b"</csw:Insert>"
+    return (b'<?xml version="1.0" encoding="UTF-8"?>'
+            b'<csw:Transaction xmlns:csw="' + NS_CSW.encode() + b'" service="CSW" version="2.0.2">'
+            + operacoes + b"</csw:Transaction>")
+
+def conferir_resposta_csw(status, dados, esperado):
+    # None se a Transaction gravou todos os registros; senão a mensagem de erro
+    if status != 200:
+        return f"HTTP {status}: {dados[:300].decode('utf-8', 'replace')}"
+    try:
+        raiz = ET.fromstring(dados)
+    except ET.XMLSyntaxError as e:
+        return f"Resposta inválida: {e}"
+    if raiz.tag.endswith("ExceptionReport"):
+        return "CSW: " + " ".join(t.strip() for t in raiz.itertext() if t.strip())[:500]
+    total = sum(int(raiz.findtext(f".//{{{NS_CSW}}}{campo}", default="0"))
+                for campo in ("totalInserted", "totalUpdated"))
+    return None if total == esperado else f"CSW gravou {total} de {esperado} registros"
+
+def registros_existentes(pool, identificadores, cabecalhos, config):
+    # fileIdentifiers (entre os informados) que já estão no catálogo; GetRecordById é uma consulta, pode ser repetida
+    parametros = urlencode({"service": "CSW", "version": "2.0.2", "request": "GetRecordById",
+                            "outputSchema": NS_GMD, "elementSetName": "brief", "id": ",".join(identificadores)})
+    cabecalhos = {k: v for k, v in cabecalhos.items() if k != "Content-Type"}
+    status, dados = requisitar(pool, "GET", f"{CAMINHO_CSW_CONSULTA}?{parametros}", None, cabecalhos, config)
+    if status != 200:
+        raise RuntimeError(f"GetRecordById: HTTP {status}")
+    raiz = ET.fromstring(dados)
+    return {e.text.strip() for e in raiz.iterfind(f".//{{{NS_GMD}}}fileIdentifier/{{{NS_GCO}}}CharacterString") if e.text}
+
+def inserir_csw(pool, lote, cabecalhos, config):
+    # Retorna (já gravados, restantes, status, dados, erro). Depois de cada FalhaIncerta, o que já está no catálogo
+    # conta como publicado e só o restante é reenviado; erro preenchido = restantes sem resposta do servidor
+    gravados = []
+    ultimo_erro = None
+    for tentativa in range(config["max_tentativas"]):
+        try:
+            status, dados = requisitar(pool, "POST", CAMINHO_CSW, transacao_csw(lote), cabecalhos, config,
+                                       idempotente=False)
+            return gravados, lote, status, dados, None
+        except RuntimeError as e:
+            return gravados, lote, None, None, str(e)
+        except FalhaIncerta as e:
+            ultimo_erro = str(e)
+        try:
+            existentes = registros_existentes(pool, [i for i, _ in lote], cabecalhos, config)
+        except (RuntimeError, ET.XMLSyntaxError) as e:
+            return gravados, lote, None, None, f"{ultimo_erro}; conferência por GetRecordById falhou ({e})"
+        gravados += [i for i, _ in lote if i in existentes]
+        lote = [r for r in lote if r[0] not in existentes]
+        if not lote:
+            return gravados, lote, None, None, None
+        if tentativa + 1 < config["max_tentativas"]:
+            esperar(config, tentativa)
+    return gravados, lote, None, None, f"{config['max_tentativas']} tentativas sem sucesso ({ultimo_erro})"
+
+def enviar_lote(pool, lote, atualizar, cabecalhos, config):
+    # Retorna [(fileIdentifier, erro ou None)]. Um lote CSW recusado pelo servidor é reenviado registro a registro,
+    # para isolar o registro com problema sem perder os demais (falha de rede esgotada vale para o lote todo).
+    cabecalhos = {**cabecalhos, "Content-Type": "application/xml"}
+    if config["protocolo"] == "rest":
+        resultado = []
+        for file_identifier, xml in lote:
+            try:
+                status, dados = requisitar(pool, "PUT", CAMINHO_REST, xml, cabecalhos, config)
+                erro = None if status in (200, 201) else f"HTTP {status}: {dados[:300].decode('utf-8', 'replace')}"
+            except RuntimeError as e:
+                erro = str(e)
+            resultado.append((file_identifier, erro))
+        return resultado
+
+    resultado = []
+    if atualizar:
+        # Update é idempotente: repetido às cegas por requisitar
+        try:
+            status, dados = requisitar(pool, "POST", CAMINHO_CSW, transacao_csw(lote, True), cabecalhos, config)
+        except RuntimeError as e:
+            return [(file_identifier, str(e)) for file_identifier, _ in lote]
+    else:
+        gravados, lote, status, dados, erro = inserir_csw(pool, lote, cabecalhos, config)
+        resultado = [(file_identifier, None) for file_identifier in gravados]
+        if erro is not None or not lote:
+            return resultado + [(file_identifier, erro) for file_identifier, _ in lote]
+    erro = conferir_resposta_csw(status, dados, len(lote))
+    if erro is not None and len(lote) > 1:
+        return resultado + [r for registro in lote for r in enviar_lote(pool, [registro], atualizar, cabecalhos, config)]
+    return resultado + [(file_identifier, erro) for file_identifier, _ in lote]
+
+# --- PROGRESSO (retomada) ---
+def carregar_progresso(arquivo):
+    publicados = set()
+    if arquivo and os.path.exists(arquivo):
+        with open(arquivo, encoding="utf-8") as f:
+            for linha in f:
+                registro = json.loads(linha)
+                if registro["situacao"] == "publicado":
+                    publicados.add(registro["fileIdentifier"])
+                else:
+                    publicados.discard(registro["fileIdentifier"])
+    return publicados
+
+def publicar(registros, config=None):
+    # registros: iterável de (fileIdentifier, xml em bytes), ex.: ler_registros(pasta_saida) da v1
+    config = {**CONFIG_PUBLICACAO, **(config or {})}
+    publicados = carregar_progresso(config["arquivo_progresso"])
+    if publicados:
+        print(f"{len(publicados)} registros já publicados em execuções anteriores ({config['arquivo_progresso']}).")
+
+    pool = PoolConexoes(config["url"], config["n_conexoes"], config["timeout"])
+    cabecalhos = cabecalhos_base(config)
+    progresso = open(config["arquivo_progresso"], "a", encoding="utf-8")
+    contagem = {"publicados": 0, "erros": 0, "pulados": 0}
+    inicio = time.time()
+
+    def lotes():
+        lote, lote_atualizar = [], []
+        for file_identifier, xml in registros:
+            if file_identifier in publicados:
+                if not config["republicar"]:
+                    contagem["pulados"] += 1
+                    continue
+                lote_atualizar.append((file_identifier, xml))
+                if len(lote_atualizar) >= config["tamanho_lote"]:
+                    yield lote_atualizar, True
+                    lote_atualizar = []
+                continue
+            lote.append((file_identifier, xml))
+            if len(lote) >= config["tamanho_lote"]:
+                yield lote, False
+                lote = []
+        for resto, atualizar in ((lote, False), (lote_atualizar, True)):
+            if resto:
+                yield resto, atualizar
+
+    def registrar(resultado):
+        hora = datetime.now().isoformat(timespec="seconds")
+        for file_identifier, erro in resultado:
+            situacao = "publicado" if erro is None else "erro"
+            contagem["publicados" if erro is None else "erros"] += 1
+            progresso.write(json.dumps({"fileIdentifier": file_identifier, "situacao": situacao, "erro": erro,
+                                        "hora": hora}, ensure_ascii=False) + "\n")
+            if erro is not None:
+                print(f"❌ {file_identifier}: {erro}")
+        progresso.flush()
+        total = contagem["publicados"] + contagem["erros"]
+        print(f"--> {total} registros enviados ({total / (time.time() - inicio):.0f} registros/s)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=config["n_conexoes"]) as executor:
+            pendentes = deque()
+            for lote, atualizar in lotes():
+                pendentes.append(executor.submit(enviar_lote, pool, lote, atualizar, cabecalhos, config))
+                if len(pendentes) >= 2 * config["n_conexoes"]:
+                    registrar(pendentes.popleft().result())
+            while pendentes:
+                registrar(pendentes.popleft().result())
+    finally:
+        progresso.close()
+        pool.fechar()
+
+    segundos = time.time() - inicio
+    contagem["segundos"] = round(segundos, 2)
+    contagem["registros_por_s"] = round(contagem["publicados"] / segundos, 1) if segundos > 0 else None
+    contagem["conexoes_abertas"] = pool.abertas
+    print(f"Publicados: {contagem['publicados']} | com erro: {contagem['erros']} | já publicados: {contagem['pulados']} | "
+          f"{segundos:.1f} s ({contagem['registros_por_s']} registros/s) | {pool.abertas} conexões HTTP abertas")
+    return contagem
+
+# --- SERVIDOR DE TESTE (substitui o GeoNetwork em testes locais) ---
+def iniciar_servidor_teste(porta=0, taxa_falhas=0.0, rejeitar=(), taxa_respostas_perdidas=0.0):
+    # CSW-T e REST mínimos com keep-alive; devolve 503 em taxa_falhas das requisições e ExceptionReport
+    # para Transactions que contenham algum fileIdentifier de "rejeitar" ou que insiram um já existente.
+    # Em taxa_respostas_perdidas, grava e fecha a conexão sem responder. Retorna (servidor, estado).
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs
+
+    estado = {"registros": {}, "conexoes": 0, "requisicoes": 0}
+    trava = threading.Lock()
+
+    def identificador(registro):
+        return registro.findtext("{http://www.isotc211.org/2005/gmd}fileIdentifier/{http://www.isotc211.org/2005/gco}CharacterString")
+
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with trava:
+                estado["conexoes"] += 1
+
+        def log_message(self, *args):
+            pass
+
+        def responder(self, status, corpo=b""):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def rejeitar_transacao(self, mensagem):
+            self.responder(200, b'<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows"><ows:Exception>'
+                                b'<ows:ExceptionText>' + mensagem.encode() + b'</ows:ExceptionText></ows:Exception></ows:ExceptionReport>')
+
+        def ler_corpo(self):
+            with trava:
+                estado["requisicoes"] += 1
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            corpo = self.ler_corpo()
+            if random.random() < taxa_falhas:
+                return self.responder(503)
+            raiz = ET.fromstring(corpo)
+            inseridos = [identificador(r) for op in raiz.findall(f"{{{NS_CSW}}}Insert") for r in op]
+            atualizados = [identificador(r) for op in raiz.findall(f"{{{NS_CSW}}}Update") for r in op]
+            if any(i in rejeitar for i in inseridos + atualizados):
+                return self.rejeitar_transacao("registro rejeitado")
+            with trava:
+                if any(i in estado["registros"] for i in inseridos):
+                    return self.rejeitar_transacao("fileIdentifier duplicado")
+                for i in inseridos + atualizados:
+                    estado["registros"][i] = estado["registros"].get(i, 0) + 1
+            if random.random() < taxa_respostas_perdidas:
+                # Gravou, mas o cliente não recebe a resposta (queda de conexão/timeout depois do commit)
+                self.close_connection = True
+                return
+            self.responder(200, (f'<csw:TransactionResponse xmlns:csw="{NS_CSW}"><csw:TransactionSummary>'
+                                 f'<csw:totalInserted>{len(inseridos)}</csw:totalInserted>'
+                                 f'<csw:totalUpdated>{len(atualizados)}</csw:totalUpdated>'
+                                 f'</csw:TransactionSummary></csw:TransactionResponse>').encode())
+
+        def do_GET(self):
+            # GetRecordById com ids separados por vírgula; devolve só os que existem
+            with trava:
+                estado["requisicoes"] += 1
+            parametros = parse_qs(urlsplit(self.path).query)
+            ids = parametros.get("id", [""])[0].split(",")
+            with trava:
+                existentes = [i for i in ids if i in estado["registros"]]
+            registros = "".join(f'<gmd:MD_Metadata xmlns:gmd="{NS_GMD}" xmlns:gco="{NS_GCO}"><gmd:fileIdentifier>'
+                                f'<gco:CharacterString>{i}</gco:CharacterString></gmd:fileIdentifier></gmd:MD_Metadata>'
+                                for i in existentes)
+            self.responder(200, f'<csw:GetRecordByIdResponse xmlns:csw="{NS_CSW}">{registros}</csw:GetRecordByIdResponse>'.encode())
+
+        def do_PUT(self):
+            corpo = self.ler_corpo()
+            if random.random() < taxa_falhas:
+                return self.responder(503)
+            if self.headers.get("X-XSRF-TOKEN") is None:
+                return self.responder(403)
+            i = identificador(ET.fromstring(corpo))
+            if i in rejeitar:
+                return self.responder(400, b"<erro>registro rejeitado</erro>")
+            with trava:
+                estado["registros"][i] = estado["registros"].get(i, 0) + 1
+            self.responder(201, b"<ok/>")
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), Manipulador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado
+
+if __name__ == "__main__":
+    PASTA_SAIDA = os.path.join("v1_local", "metadados_gerados")  # saída de csvToXML_metadata_v1.py
+    USAR_SERVIDOR_TESTE = True  # False: publica no GeoNetwork de CONFIG_PUBLICACAO["url"]
+
+    config = dict(CONFIG_PUBLICACAO)
+    if USAR_SERVIDOR_TESTE:
+        servidor, estado = iniciar_servidor_teste(taxa_falhas=0.05, taxa_respostas_perdidas=0.05)
+        config.update(url=f"http://127.0.0.1:{servidor.server_port}/geonetwork", espera_inicial=0.05,
+                      arquivo_progresso="publicacao_teste.jsonl")
+    publicar(ler_registros(PASTA_SAIDA), config)
+    if USAR_SERVIDOR_TESTE:
+        print(f"Servidor de teste: {len(estado['registros'])} registros, {estado['requisicoes']} requisições, "
+              f"{estado['conexoes']} conexões")
+        servidor.shutdown()
@@ -0,0 +1,134 @@
+#Matheus Dias de Aviz
+#Saída dos XML gerados (v1 local): pasta única, subpastas por hash, ZIP ou TAR em fluxo contínuo
+#"arquivos": um arquivo por registro na pasta de saída (comportamento original)
+#"shards": subpastas ab/cd/ pelo hash do fileIdentifier (nenhuma pasta passa de alguns milhares de arquivos)
+#"zip" / "tar": um único arquivo gravado em sequência, com buffer; pronto para cópia em bloco/importação no GeoNetwork
+#Todos gravam manifesto.csv (fileIdentifier;caminho;offset;bytes) para localizar cada registro sem listar a saída
+import csv
+import hashlib
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+FORMATOS_SAIDA = ("arquivos", "shards", "zip", "tar")
+TAMANHO_BUFFER = 8 * 1024 * 1024
+NOME_MANIFESTO = "manifesto.csv"
+
+def abrir_saida(output_dir, config=None):
+    config = config or {}
+    formato = config.get("formato_saida", "arquivos")
+    if formato not in FORMATOS_SAIDA:
+        raise ValueError(f"formato_saida desconhecido: {formato} (use {', '.join(FORMATOS_SAIDA)})")
+    os.makedirs(output_dir, exist_ok=True)
+    if formato in ("zip", "tar"):
+        return SaidaArquivoUnico(output_dir, formato, config.get("nome_arquivo_saida", f"metadados.{formato}"))
+    return SaidaPasta(output_dir, formato == "shards")
+
+class SaidaMetadados:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.manifesto = open(os.path.join(output_dir, NOME_MANIFESTO), "w", newline="", encoding="utf-8",
+                              buffering=TAMANHO_BUFFER)
+        self.escritor = csv.writer(self.manifesto, delimiter=";")
+        self.escritor.writerow(["fileIdentifier", "caminho", "offset", "bytes"])
+        self.registros = 0
+        self.bytes = 0
+        self.inicio = time.time()
+
+    def _registrar(self, file_identifier, caminho, offset, tamanho):
+        self.escritor.writerow([file_identifier, caminho, offset, tamanho])
+        self.registros += 1
+        self.bytes += tamanho
+        return caminho
+
+    def fechar(self):
+        self.manifesto.close()
+
+    def resumo(self):
+        segundos = time.time() - self.inicio
+        return (f"Saída: {self.registros} registros, {self.bytes / 1e6:.1f} MB em {segundos:.1f} s "
+                f"({self.registros / segundos if segundos > 0 else 0:.0f} registros/s)")
+
+class SaidaPasta(SaidaMetadados):
+    # Um arquivo por registro; com shards=True, em <pasta>/ab/cd/ pelos 4 primeiros hex do SHA-1 do fileIdentifier
+    def __init__(self, output_dir, shards=False):
+        super().__init__(output_dir)
+        self.shards = shards
+        self.pastas_criadas = set()
+
+    def gravar(self, file_identifier, nome, xml):
+        caminho = nome
+        if self.shards:
+            h = hashlib.sha1(str(file_identifier).encode()).hexdigest()
+            subpasta = os.path.join(h[:2], h[2:4])
+            if subpasta not in self.pastas_criadas:
+                os.makedirs(os.path.join(self.output_dir, subpasta), exist_ok=True)
+                self.pastas_criadas.add(subpasta)
+            caminho = os.path.join(subpasta, nome)
+        with open(os.path.join(self.output_dir, caminho), "wb") as f:
+            f.write(xml)
+        return self._registrar(file_identifier, caminho, 0, len(xml))
+
+class SaidaArquivoUnico(SaidaMetadados):
+    # ZIP (deflate) ou TAR sem compressão, gravados em sequência num arquivo com buffer grande.
+    # offset no manifesto: início do cabeçalho local do membro (ZIP) ou início dos dados (TAR, leitura direta)
+    def __init__(self, output_dir, formato, nome_arquivo):
+        super().__init__(output_dir)
+        self.formato = formato
+        self.caminho = os.path.join(output_dir, nome_arquivo)
+        self.arquivo = open(self.caminho, "wb", buffering=TAMANHO_BUFFER)
+        if formato == "zip":
+            self.pacote = zipfile.ZipFile(self.arquivo, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+        else:
+            self.pacote = tarfile.open(fileobj=self.arquivo, mode="w", format=tarfile.PAX_FORMAT)
+        self.agora = time.time()
+
+    def gravar(self, file_identifier, nome, xml):
+        if self.formato == "zip":
+            self.pacote.writestr(nome, xml)
+            offset = self.pacote.filelist[-1].header_offset
+        else:
+            info = tarfile.TarInfo(nome)
+            info.size = len(xml)
+            info.mtime = self.agora
+            self.pacote.addfile(info, io.BytesIO(xml))
+            # addfile grava uma cópia do TarInfo: início dos dados = fim do membro - blocos de dados
+            blocos = -(-len(xml) // tarfile.BLOCKSIZE)
+            offset = self.pacote.offset - blocos * tarfile.BLOCKSIZE
+        return self._registrar(file_identifier, nome, offset, len(xml))
+
+    def fechar(self):
+        self.pacote.close()
+        self.arquivo.close()
+        super().fechar()
+
+def ler_manifesto(output_dir):
+    # [(fileIdentifier, caminho, offset, bytes)] na ordem de gravação
+    with open(os.path.join(output_dir, NOME_MANIFESTO), newline="", encoding="utf-8") as f:
+        leitor = csv.reader(f, delimiter=";")
+        next(leitor)
+        return [(file_identifier, caminho, int(offset), int(tamanho)) for file_identifier, caminho, offset, tamanho in leitor]
+
+def ler_registros(output_dir, nome_arquivo=None):
+    # Gerador de (fileIdentifier, xml em bytes) a partir do manifesto, em qualquer formato de saída.
+    # ZIP/TAR: nome_arquivo ou o primeiro metadados.zip/metadados.tar encontrado na pasta
+    manifesto = ler_manifesto(output_dir)
+    if nome_arquivo is None:
+        nome_arquivo = next((f"metadados.{formato}" for formato in ("zip", "tar")
+                             if os.path.exists(os.path.join(output_dir, f"metadados.{formato}"))), None)
+    if nome_arquivo is None:
+        for file_identifier, caminho, _, _ in manifesto:
+            with open(os.path.join(output_dir, caminho), "rb") as f:
+                yield file_identifier, f.read()
+    elif nome_arquivo.endswith(".zip"):
+        with zipfile.ZipFile(os.path.join(output_dir, nome_arquivo)) as pacote:
+            for file_identifier, caminho, _, _ in manifesto:
+                yield file_identifier, pacote.read(caminho)
+    else:
+        # TAR sem compressão: leitura direta pelo offset dos dados
+        with open(os.path.join(output_dir, nome_arquivo), "rb", buffering=TAMANHO_BUFFER) as f:
+            for file_identifier, _, offset, tamanho in manifesto:
+                f.seek(offset)
+                yield file_identifier, f.read(tamanho)
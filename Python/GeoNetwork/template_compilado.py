@@ -0,0 +1,327 @@
+#Matheus Dias de Aviz
+#Template MGB 2.0 compilado: o XML é lido uma única vez e cada campo do CSV vira a posição do seu elemento
+#na ordem do documento, resolvida no template original. Cada registro é uma cópia do template (deepcopy em C
+#do lxml) cuja lista de elementos é indexada direto pelas posições, sem ET.parse nem buscas XPath ".//" por linha.
+#Usado por v1_local/csvToXML_metadata_v1.py e v2_db/csvToXML_metadata_v2.py
+import copy
+import uuid
+
+from lxml import etree as ET
+
+# --- MAPEAMENTO CAMPO -> XPATH: (xpath no template, atributo ou None para o texto, coluna do CSV, conversão) ---
+def _inteiro(valor):
+    # Célula vazia não vira "0" nem um <gco:Integer/> vazio (inválido no XSD): o registro vai para o caminho de erro
+    if valor == '':
+        raise ValueError("valor numérico vazio")
+    return str(int(float(valor)))
+
+CAMPOS_RAIZ = [
+    ('./gmd:dateStamp/gco:DateTime', None, 'dateStamp', None),
+    ('./gmd:language/gmd:LanguageCode', 'codeListValue', 'LanguageCode', None),
+    ('./gmd:characterSet/gmd:MD_CharacterSetCode', 'codeListValue', 'characterSet', None),
+    ('./gmd:hierarchyLevel/gmd:MD_ScopeCode', 'codeListValue', 'hierarchyLevel', None),
+]
+
+# Relativos ao CI_ResponsibleParty com papel "author" (gmd:contact e gmd:pointOfContact)
+CAMPOS_CONTATO = [
+    ('.//gmd:individualName/gco:CharacterString', None, 'contact_individualName', None),
+    ('.//gmd:organisationName/gco:CharacterString', None, 'contact_organisationName', None),
+    ('.//gmd:positionName/gco:CharacterString', None, 'contact_positionName', None),
+    ('.//gmd:contactInfo//gmd:voice/gco:CharacterString', None, 'contact_phone', None),
+    ('.//gmd:contactInfo//gmd:deliveryPoint/gco:CharacterString', None, 'contact_deliveryPoint', None),
+    ('.//gmd:contactInfo//gmd:city/gco:CharacterString', None, 'contact_city', None),
+    ('.//gmd:contactInfo//gmd:administrativeArea/gco:CharacterString', None, 'contact_administrativeArea', None),
+    ('.//gmd:contactInfo//gmd:postalCode/gco:CharacterString', None, 'contact_postalCode', str),
+    ('.//gmd:contactInfo//gmd:country/gco:CharacterString', None, 'contact_country', None),
+    ('.//gmd:contactInfo//gmd:electronicMailAddress/gco:CharacterString', None, 'contact_email', None),
+]
+
+# Relativos ao gmd:MD_DataIdentification
+CAMPOS_IDENTIFICACAO = [
+    ('.//gmd:citation//gmd:title/gco:CharacterString', None, 'title', None),
+    ('./gmd:abstract/gco:CharacterString', None, 'abstract', None),
+    ('./gmd:status/gmd:MD_ProgressCode', 'codeListValue', 'status_codeListValue', None),
+    ('./gmd:language/gmd:LanguageCode', 'codeListValue', 'LanguageCode', None),
+    ('./gmd:characterSet/gmd:MD_CharacterSetCode', 'codeListValue', 'characterSet', None),
+    ('.//gmd:spatialRepresentationType/gmd:MD_SpatialRepresentationTypeCode', 'codeListValue', 'MD_SpatialRepresentationTypeCode_codeListValue', None),
+    ('.//gmd:spatialResolution//gmd:denominator/gco:Integer', None, 'spatialResolution_denominator', _inteiro),
+    ('.//gmd:topicCategory/gmd:MD_TopicCategoryCode', None, 'topicCategory', None),
+    ('.//gmd:extent//gmd:westBoundLongitude/gco:Decimal', None, 'westBoundLongitude', str),
+    ('.//gmd:extent//gmd:eastBoundLongitude/gco:Decimal', None, 'eastBoundLongitude', str),
+    ('.//gmd:extent//gmd:southBoundLatitude/gco:Decimal', None, 'southBoundLatitude', str),
+    ('.//gmd:extent//gmd:northBoundLatitude/gco:Decimal', None, 'northBoundLatitude', str),
+]
+
+COLUNAS_PALAVRAS_CHAVE = ['MD_Keywords1', 'MD_Keywords2', 'MD_Keywords3', 'MD_Keywords4']
+
+def novo_uuid():
+    return str(uuid.uuid4())
+
+def contato_autor(nos_contato, ns):
+    # Primeiro CI_ResponsibleParty com papel "author" (mesma regra do break das versões anteriores)
+    for party in nos_contato:
+        if party.find('.//gmd:role/gmd:CI_RoleCode', namespaces=ns).get('codeListValue') == 'author':
+            return party
+    return None
+
+class TemplateCompilado:
+    # data_adaptativa=True (v1): troca a tag da data de criação entre gco:Date e gco:DateTime conforme o valor
+    # data_adaptativa=False (v2): recria o gmd:date sempre com gco:DateTime
+    def __init__(self, template_path, data_adaptativa=True):
+        parser = ET.XMLParser(remove_blank_text=True)
+        self.original = ET.parse(template_path, parser).getroot()
+        self.ns = self.original.nsmap
+        self.data_adaptativa = data_adaptativa
+        self.tag_keywords = f"{{{self.ns['gmd']}}}MD_Keywords"
+        self.tag_keyword = f"{{{self.ns['gmd']}}}keyword"
+        self.tag_char_string = f"{{{self.ns['gco']}}}CharacterString"
+        self.tag_date = f"{{{self.ns['gco']}}}Date"
+        self.tag_date_time = f"{{{self.ns['gco']}}}DateTime"
+
+        # Posição de cada nó na ordem do documento: a mesma em qualquer cópia do template
+        self.posicoes = {elemento: i for i, elemento in enumerate(self.original.iter())}
+        # Setters compilados: (posição, atributo ou None, coluna, conversão)
+        self.setters = []
+        self.ausentes = []
+        self.uuids = []
+        raiz = self.original
+        self.posicao_identificador = self._resolver(raiz, './gmd:fileIdentifier/gco:CharacterString')
+        self._compilar(raiz, CAMPOS_RAIZ)
+
+        contato = contato_autor(raiz.findall('./gmd:contact/gmd:CI_ResponsibleParty', namespaces=self.ns), self.ns)
+        self._compilar_contato(contato)
+
+        self.posicao_data = None
+        self.posicao_keywords = None
+        id_info = raiz.find('.//gmd:identificationInfo/gmd:MD_DataIdentification', namespaces=self.ns)
+        if id_info is not None:
+            contato = contato_autor(id_info.findall('./gmd:pointOfContact/gmd:CI_ResponsibleParty', namespaces=self.ns), self.ns)
+            self._compilar_contato(contato)
+            self._compilar(id_info, CAMPOS_IDENTIFICACAO)
+            xpath_data = './/gmd:citation//gmd:date/gmd:CI_Date/gmd:date' + ('/*' if data_adaptativa else '')
+            self.posicao_data = self._resolver(id_info, xpath_data)
+            self.posicao_keywords = self._resolver(id_info, './gmd:descriptiveKeywords')
+
+        if self.ausentes:
+            print(f"Campos não encontrados no template (serão ignorados): {', '.join(self.ausentes)}")
+
+    def _resolver(self, contexto, xpath):
+        elemento = contexto.find(xpath, namespaces=self.ns)
+        if elemento is None:
+            self.ausentes.append(xpath)
+            return None
+        return self.posicoes[elemento]
+
+    def _compilar(self, contexto, campos):
+        for xpath, atributo, coluna, conversao in campos:
+            posicao = self._resolver(contexto, xpath)
+            if posicao is not None:
+                self.setters.append((posicao, atributo, coluna, conversao))
+
+    def _compilar_contato(self, contato):
+        if contato is None:
+            return
+        self.uuids.append(self.posicoes[contato])
+        self._compilar(contato, CAMPOS_CONTATO)
+
+    def preencher(self, row, gerar_uuid=novo_uuid):
+        # Retorna (fileIdentifier, raiz do registro); row é um dict (ou Series) com as colunas do CSV
+        raiz = copy.deepcopy(self.original)
+        elementos = list(raiz.iter())
+        identificador = gerar_uuid()
+        if self.posicao_identificador is not None:
+            elementos[self.posicao_identificador].text = identificador
+        for posicao in self.uuids:
+            elementos[posicao].set('uuid', gerar_uuid())
+
+        for posicao, atributo, coluna, conversao in self.setters:
+            valor = row.get(coluna)
+            if conversao is not None:
+                try:
+                    valor = conversao(valor if valor is not None else '')
+                except ValueError as e:
+                    raise ValueError(f"coluna '{coluna}': {e}") from e
+            if atributo is None:
+                elementos[posicao].text = valor
+            else:
+                elementos[posicao].set(atributo, valor)
+
+        if self.posicao_data is not None:
+            valor = row.get('date_creation', '')
+            elemento = elementos[self.posicao_data]
+            if self.data_adaptativa:
+                elemento.tag = self.tag_date_time if 'T' in valor else self.tag_date
+                elemento.text = valor
+            else:
+                elemento.clear()
+                ET.SubElement(elemento, self.tag_date_time).text = valor
+
+        if self.posicao_keywords is not None:
+            container = elementos[self.posicao_keywords]
+            container.clear()
+            palavras = [row[col] for col in COLUNAS_PALAVRAS_CHAVE if col in row and row[col]]
+            if palavras:
+                md_keywords_node = ET.SubElement(container, self.tag_keywords)
+                for palavra in palavras:
+                    ET.SubElement(ET.SubElement(md_keywords_node, self.tag_keyword), self.tag_char_string).text = palavra
+        return identificador, raiz
+
+# --- IMPLEMENTAÇÃO ORIGINAL (csvToXML_metadata_v1.py / v2.py antes do template compilado), para conferência e benchmark ---
+# Cópia literal do corpo do laço por registro; só o uuid.uuid4() virou gerar_uuid() para comparar com UUIDs fixos
+# e o "data_adaptativa" escolhe entre o bloco de data da v1 e o da v2
+def set_element_text(parent_element, xpath, text_value, ns_map):
+    element = parent_element.find(xpath, namespaces=ns_map)
+    if element is not None:
+        element.text = text_value
+
+def set_element_attribute(parent_element, xpath, attr_name, attr_value, ns_map):
+    element = parent_element.find(xpath, namespaces=ns_map)
+    if element is not None:
+        element.set(attr_name, attr_value)
+
+def atualizar_bloco_de_contato(contato_node, csv_row, ns_map, gerar_uuid=novo_uuid):
+    if contato_node is None: return
+    contato_node.set('uuid', gerar_uuid())
+    set_element_text(contato_node, './/gmd:individualName/gco:CharacterString', csv_row.get('contact_individualName'), ns_map)
+    set_element_text(contato_node, './/gmd:organisationName/gco:CharacterString', csv_row.get('contact_organisationName'), ns_map)
+    set_element_text(contato_node, './/gmd:positionName/gco:CharacterString', csv_row.get('contact_positionName'), ns_map)
+    set_element_text(contato_node, './/gmd:contactInfo//gmd:voice/gco:CharacterString', csv_row.get('contact_phone'), ns_map)
+    set_element_text(contato_node, './/gmd:contactInfo//gmd:deliveryPoint/gco:CharacterString', csv_row.get('contact_deliveryPoint'), ns_map)
+    set_element_text(contato_node, './/gmd:contactInfo//gmd:city/gco:CharacterString', csv_row.get('contact_city'), ns_map)
+    set_element_text(contato_node, './/gmd:contactInfo//gmd:administrativeArea/gco:CharacterString', csv_row.get('contact_administrativeArea'), ns_map)
+    set_element_text(contato_node, './/gmd:contactInfo//gmd:postalCode/gco:CharacterString', str(csv_row.get('contact_postalCode', '')), ns_map)
+    set_element_text(contato_node, './/gmd:contactInfo//gmd:country/gco:CharacterString', csv_row.get('contact_country'), ns_map)
+    set_element_text(contato_node, './/gmd:contactInfo//gmd:electronicMailAddress/gco:CharacterString', csv_row.get('contact_email'), ns_map)
+
+def preencher_original(template_path, row, data_adaptativa=True, gerar_uuid=novo_uuid):
+    parser = ET.XMLParser(remove_blank_text=True)
+    tree = ET.parse(template_path, parser)
+    root = tree.getroot()
+    ns = root.nsmap
+
+    file_identifier = gerar_uuid()
+    set_element_text(root, './gmd:fileIdentifier/gco:CharacterString', file_identifier, ns)
+    set_element_text(root, './gmd:dateStamp/gco:DateTime', row.get('dateStamp'), ns)
+
+    set_element_attribute(root, './gmd:language/gmd:LanguageCode', 'codeListValue', row.get('LanguageCode'), ns)
+    set_element_attribute(root, './gmd:characterSet/gmd:MD_CharacterSetCode', 'codeListValue', row.get('characterSet'), ns)
+    set_element_attribute(root, './gmd:hierarchyLevel/gmd:MD_ScopeCode', 'codeListValue', row.get('hierarchyLevel'), ns)
+
+    for party in root.findall('./gmd:contact/gmd:CI_ResponsibleParty', namespaces=ns):
+        if party.find('.//gmd:role/gmd:CI_RoleCode', namespaces=ns).get('codeListValue') == 'author':
+            atualizar_bloco_de_contato(party, row, ns, gerar_uuid)
+            break
+
+    id_info = root.find('.//gmd:identificationInfo/gmd:MD_DataIdentification', namespaces=ns)
+    if id_info is not None:
+        for party in id_info.findall('./gmd:pointOfContact/gmd:CI_ResponsibleParty', namespaces=ns):
+            if party.find('.//gmd:role/gmd:CI_RoleCode', namespaces=ns).get('codeListValue') == 'author':
+                atualizar_bloco_de_contato(party, row, ns, gerar_uuid)
+                break
+
+        set_element_text(id_info, './/gmd:citation//gmd:title/gco:CharacterString', row.get('title'), ns)
+
+        if data_adaptativa:
+            # v1: LÓGICA DE DATA ADAPTATIVA
+            date_value_from_csv = row.get('date_creation', '')
+            date_element = id_info.find('.//gmd:citation//gmd:date/gmd:CI_Date/gmd:date/*', namespaces=ns)
+            if date_element is not None:
+                if 'T' in date_value_from_csv:
+                    date_element.tag = f"{{{ns['gco']}}}DateTime"
+                else:
+                    date_element.tag = f"{{{ns['gco']}}}Date"
+                date_element.text = date_value_from_csv
+        else:
+            # v2: Lógica "Destruir e Reconstruir" para a data de criação
+            date_parent = id_info.find('.//gmd:citation//gmd:date/gmd:CI_Date/gmd:date', namespaces=ns)
+            if date_parent is not None:
+                date_parent.clear()
+                date_time_element = ET.SubElement(date_parent, f"{{{ns['gco']}}}DateTime")
+                date_time_element.text = row.get('date_creation', '')
+
+        set_element_text(id_info, './gmd:abstract/gco:CharacterString', row.get('abstract'), ns)
+        set_element_attribute(id_info, './gmd:status/gmd:MD_ProgressCode', 'codeListValue', row.get('status_codeListValue'), ns)
+        set_element_attribute(id_info, './gmd:language/gmd:LanguageCode', 'codeListValue', row.get('LanguageCode'), ns)
+        set_element_attribute(id_info, './gmd:characterSet/gmd:MD_CharacterSetCode', 'codeListValue', row.get('characterSet'), ns)
+
+        keyword_container = id_info.find('./gmd:descriptiveKeywords', namespaces=ns)
+        if keyword_container is not None:
+            keyword_container.clear()
+            md_keywords_node = ET.SubElement(keyword_container, f"{{{ns['gmd']}}}MD_Keywords")
+            keywords_found = False
+            for col in ['MD_Keywords1', 'MD_Keywords2', 'MD_Keywords3', 'MD_Keywords4']:
+                if col in row and row[col]:
+                    keywords_found = True
+                    keyword_node = ET.SubElement(md_keywords_node, f"{{{ns['gmd']}}}keyword")
+                    char_string = ET.SubElement(keyword_node, f"{{{ns['gco']}}}CharacterString")
+                    char_string.text = row[col]
+            if not keywords_found:
+                keyword_container.remove(md_keywords_node)
+
+        set_element_attribute(id_info, './/gmd:spatialRepresentationType/gmd:MD_SpatialRepresentationTypeCode', 'codeListValue', row.get('MD_SpatialRepresentationTypeCode_codeListValue'), ns)
+        set_element_text(id_info, './/gmd:spatialResolution//gmd:denominator/gco:Integer', str(int(float(row.get('spatialResolution_denominator', 0)))), ns)
+        set_element_text(id_info, './/gmd:topicCategory/gmd:MD_TopicCategoryCode', row.get('topicCategory'), ns)
+
+        set_element_text(id_info, './/gmd:extent//gmd:westBoundLongitude/gco:Decimal', str(row.get('westBoundLongitude')), ns)
+        set_element_text(id_info, './/gmd:extent//gmd:eastBoundLongitude/gco:Decimal', str(row.get('eastBoundLongitude')), ns)
+        set_element_text(id_info, './/gmd:extent//gmd:southBoundLatitude/gco:Decimal', str(row.get('southBoundLatitude')), ns)
+        set_element_text(id_info, './/gmd:extent//gmd:northBoundLatitude/gco:Decimal', str(row.get('northBoundLatitude')), ns)
+    return file_identifier, root
+
+# --- BENCHMARK ANTES/DEPOIS + CONFERÊNCIA (saídas idênticas com os mesmos UUIDs) ---
+if __name__ == "__main__":
+    import os
+    import time
+
+    import pandas as pd
+
+    PASTA = os.path.dirname(os.path.abspath(__file__))
+    CAMINHO_CSV = os.path.join(PASTA, 'tb_mgb2_metadata.cvs')
+    CAMINHO_TEMPLATE = os.path.join(PASTA, 'tamplate_mgb20.xml')
+    N_REGISTROS = 5000
+
+    linhas = pd.read_csv(CAMINHO_CSV, sep=';', header=0, dtype=str).fillna('').to_dict('records')
+    linhas = [dict(linhas[i % len(linhas)], title=f"Camada {i}") for i in range(N_REGISTROS)]
+
+    def uuids_fixos():
+        contador = iter(range(10 ** 9))
+        return lambda: f"00000000-0000-0000-0000-{next(contador):012d}"
+
+    def saida(preencher, *args):
+        # XML gerado, ou o tipo da exceção quando o registro falha (ex.: denominador vazio -> ValueError nos dois)
+        try:
+            return ET.tostring(preencher(*args)[1])
+        except Exception as e:
+            return type(e).__name__
+
+    # Inclui um registro com denominador vazio: o original falha em float('') e o compilado também deve falhar
+    amostra = linhas[:200] + [dict(linhas[0], spatialResolution_denominator='')]
+    for data_adaptativa in (True, False):
+        template = TemplateCompilado(CAMINHO_TEMPLATE, data_adaptativa)
+        iguais, erros, diferentes = 0, 0, 0
+        for row in amostra:
+            original = saida(preencher_original, CAMINHO_TEMPLATE, row, data_adaptativa, uuids_fixos())
+            compilado = saida(template.preencher, row, uuids_fixos())
+            if original != compilado:
+                diferentes += 1
+            elif isinstance(original, str):
+                erros += 1
+            else:
+                iguais += 1
+        print(f"{'✅' if not diferentes and erros else '❌'} data_adaptativa={data_adaptativa}: {iguais} registros iguais "
+              f"ao código original, {erros} com o mesmo erro, {diferentes} diferentes")
+
+    inicio = time.time()
+    for row in linhas:
+        preencher_original(CAMINHO_TEMPLATE, row)
+    tempo_antes = time.time() - inicio
+
+    inicio = time.time()
+    template = TemplateCompilado(CAMINHO_TEMPLATE)
+    for row in linhas:
+        template.preencher(row)
+    tempo_depois = time.time() - inicio
+
+    print(f"{N_REGISTROS} registros: parse + find por linha {tempo_antes:.2f} s ({tempo_antes / N_REGISTROS * 1e6:.0f} µs/registro) | "
+          f"template compilado {tempo_depois:.2f} s ({tempo_depois / N_REGISTROS * 1e6:.0f} µs/registro) | "
+          f"{tempo_antes / tempo_depois:.1f}x")
@@ -1,11 +1,18 @@
 # Matheus Dias de Aviz 
 # Transforma dados em tabelas em um tamplate XML (Perfil MGB 2.0) e insere em um banco de dados PostgreSQL
-from lxml import etree as ET
-import pandas as pd
-import uuid
-from datetime import datetime, timezone
 import os
 import psycopg2 # Biblioteca para conectar com o PostgreSQL
+import sys
+import csv
+import hashlib
+import io
+import time
+from psycopg2.extras import execute_values
+
+# Módulos compartilhados com a v1 (Python/GeoNetwork/template_compilado.py e geracao_paralela.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from geracao_paralela import gerar_registros, resumo_validacao
+from validacao_xsd import ArquivoRejeitos
 
 # --- CONFIGURAÇÃO DOS ARQUIVOS DE ENTRADA ---
 caminho_csv = 'tb_mgb2_metadata.csv' # Corrigi o nome para .csv
@@ -21,35 +28,84 @@ db_config = {
     "schema": "metadados",      # Schema onde a tabela está
     "table": "registros",       # Nome da tabela de destino
     "id_column": "id",          # Nome da coluna para o UUID
-    "xml_column": "conteudo_xml"  # Nome da coluna para o XML
+    "xml_column": "conteudo_xml",  # Nome da coluna para o XML
+    "modo_carga": "linha",      # "linha" (um INSERT por registro); opcionais: "execute_values" ou "copy" (staging + upsert)
+    "tamanho_lote": 1000,       # Registros por lote nos modos em lote
+    "commit_por_lote": False,   # True: commit a cada lote (um erro só desfaz o lote atual)
+    "tabela_hash": "registros_hash"  # Tabela de controle (id -> hash do XML) no mesmo schema; None desliga o salto
 }
 
-def set_element_text(parent_element, xpath, text_value, ns_map):
-    element = parent_element.find(xpath, namespaces=ns_map)
-    if element is not None:
-        element.text = text_value
-
-def set_element_attribute(parent_element, xpath, attr_name, attr_value, ns_map):
-    element = parent_element.find(xpath, namespaces=ns_map)
-    if element is not None:
-        element.set(attr_name, attr_value)
-
-def atualizar_bloco_de_contato(contato_node, csv_row, ns_map):
-    if contato_node is None: return
-    contato_node.set('uuid', str(uuid.uuid4()))
-    set_element_text(contato_node, './/gmd:individualName/gco:CharacterString', csv_row.get('contact_individualName'), ns_map)
-    set_element_text(contato_node, './/gmd:organisationName/gco:CharacterString', csv_row.get('contact_organisationName'), ns_map)
-    set_element_text(contato_node, './/gmd:positionName/gco:CharacterString', csv_row.get('contact_positionName'), ns_map)
-    set_element_text(contato_node, './/gmd:contactInfo//gmd:voice/gco:CharacterString', csv_row.get('contact_phone'), ns_map)
-    set_element_text(contato_node, './/gmd:contactInfo//gmd:deliveryPoint/gco:CharacterString', csv_row.get('contact_deliveryPoint'), ns_map)
-    set_element_text(contato_node, './/gmd:contactInfo//gmd:city/gco:CharacterString', csv_row.get('contact_city'), ns_map)
-    set_element_text(contato_node, './/gmd:contactInfo//gmd:administrativeArea/gco:CharacterString', csv_row.get('contact_administrativeArea'), ns_map)
-    set_element_text(contato_node, './/gmd:contactInfo//gmd:postalCode/gco:CharacterString', str(csv_row.get('contact_postalCode', '')), ns_map)
-    set_element_text(contato_node, './/gmd:contactInfo//gmd:country/gco:CharacterString', csv_row.get('contact_country'), ns_map)
-    set_element_text(contato_node, './/gmd:contactInfo//gmd:electronicMailAddress/gco:CharacterString', csv_row.get('contact_email'), ns_map)
+# --- GERAÇÃO EM BLOCOS E EM PARALELO (ver CONFIG_GERACAO em geracao_paralela.py) ---
+config_geracao = {
+    "n_processos": os.cpu_count() or 1,
+    "tamanho_chunk": 20000,
+    "tamanho_lote": 500,
+    "validar_xsd": False,  # True: valida cada registro no schema ISO 19139 (baixado uma vez para xsd_cache/)
+    "arquivo_rejeitos": "rejeitados.jsonl",  # registros com erro ou inválidos no XSD, com os detalhes
+    # Identificador estável: coluna "fileIdentifier" do CSV quando preenchida, senão uuid5 de título + organização
+    "coluna_id": "fileIdentifier",
+    "chave_natural": ["title", "contact_organisationName"],
+}
+
+# --- CARGA NO BANCO: linha a linha ou em lotes ---
+def query_upsert(db_params_config, origem="VALUES (%s, %s)"):
+    tabela = f"{db_params_config['schema']}.{db_params_config['table']}"
+    id_col, xml_col = db_params_config['id_column'], db_params_config['xml_column']
+    return f"""
+        INSERT INTO {tabela} ({id_col}, {xml_col})
+        {origem}
+        ON CONFLICT ({id_col}) DO UPDATE SET
+        {xml_col} = EXCLUDED.{xml_col};
+    """
+
+def criar_staging(cursor, db_params_config):
+    # Tabela temporária com os mesmos tipos das colunas de destino; vive até o fim da sessão
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS staging_metadados AS
+        SELECT {db_params_config['id_column']}, {db_params_config['xml_column']}
+        FROM {db_params_config['schema']}.{db_params_config['table']} WITH NO DATA;
+    """)
+
+def inserir_lote(cursor, lote, db_params_config):
+    # lote: [(file_identifier, xml)]; um único upsert set-based por lote
+    modo = db_params_config.get("modo_carga", "linha")
+    id_col, xml_col = db_params_config['id_column'], db_params_config['xml_column']
+    if modo == "execute_values":
+        execute_values(cursor, query_upsert(db_params_config, "VALUES %s"), lote, page_size=len(lote))
+    elif modo == "copy":
+        # COPY em CSV (o XML tem quebras de linha e aspas) para a staging, depois INSERT ... SELECT com upsert
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(lote)
+        buffer.seek(0)
+        cursor.execute("TRUNCATE staging_metadados;")
+        cursor.copy_expert(f"COPY staging_metadados ({id_col}, {xml_col}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(query_upsert(db_params_config, f"SELECT {id_col}, {xml_col} FROM staging_metadados"))
+    else:
+        raise ValueError(f"modo_carga desconhecido: {modo}")
+
+# --- HASH DO CONTEÚDO: só registros novos ou alterados são gravados ---
+def criar_tabela_hash(cursor, db_params_config):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {db_params_config['schema']}.{db_params_config['tabela_hash']} (
+            id TEXT PRIMARY KEY,
+            hash_conteudo TEXT NOT NULL,
+            atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+def carregar_hashes(cursor, db_params_config):
+    cursor.execute(f"SELECT id, hash_conteudo FROM {db_params_config['schema']}.{db_params_config['tabela_hash']};")
+    return dict(cursor.fetchall())
+
+def gravar_hashes(cursor, pares, db_params_config):
+    execute_values(cursor, f"""
+        INSERT INTO {db_params_config['schema']}.{db_params_config['tabela_hash']} (id, hash_conteudo)
+        VALUES %s
+        ON CONFLICT (id) DO UPDATE SET hash_conteudo = EXCLUDED.hash_conteudo, atualizado_em = now();
+    """, pares, page_size=max(len(pares), 1))
 
 # --- Função principal para inserir no banco de dados ---
-def gerar_e_inserir_metadados(csv_path, template_path, db_params_config):
+def gerar_e_inserir_metadados(csv_path, template_path, db_params_config, config=None):
     if not os.path.exists(csv_path):
         print(f"Erro: Arquivo CSV não encontrado em '{csv_path}'")
         return
@@ -58,6 +114,8 @@ def gerar_e_inserir_metadados(csv_path, template_path, db_params_config):
         return
 
     conn = None
+    rejeitos = ArquivoRejeitos((config or {}).get("arquivo_rejeitos", "rejeitados.jsonl"))
+    estatisticas = {}
     try:
         # Extrai parâmetros de conexão do dicionário principal
         db_connect_params = {
@@ -74,93 +132,87 @@ def gerar_e_inserir_metadados(csv_path, template_path, db_params_config):
         cursor = conn.cursor()
         print("Conexão bem-sucedida.")
 
-        df = pd.read_csv(csv_path, sep=';', header=0, dtype=str).fillna('')
-        df = df.loc[df['LanguageCode'] != '']
-        print(f"Encontrados {len(df)} registros para processar.")
-
-        for index, row in df.iterrows():
-            parser = ET.XMLParser(remove_blank_text=True)
-            tree = ET.parse(template_path, parser)
-            root = tree.getroot()
-            ns = root.nsmap
-            
-            # Gera o UUID e o insere no XML
-            file_identifier = str(uuid.uuid4())
-            set_element_text(root, './gmd:fileIdentifier/gco:CharacterString', file_identifier, ns)
-            
-            # Preenche o resto do XML com a lógica já validada
-            set_element_text(root, './gmd:dateStamp/gco:DateTime', row.get('dateStamp'), ns)
-            set_element_attribute(root, './gmd:language/gmd:LanguageCode', 'codeListValue', row.get('LanguageCode'), ns)
-            set_element_attribute(root, './gmd:characterSet/gmd:MD_CharacterSetCode', 'codeListValue', row.get('characterSet'), ns)
-            set_element_attribute(root, './gmd:hierarchyLevel/gmd:MD_ScopeCode', 'codeListValue', row.get('hierarchyLevel'), ns)
-            
-            for party in root.findall('./gmd:contact/gmd:CI_ResponsibleParty', namespaces=ns):
-                if party.find('.//gmd:role/gmd:CI_RoleCode', namespaces=ns).get('codeListValue') == 'author':
-                    atualizar_bloco_de_contato(party, row, ns)
-                    break
-            
-            id_info = root.find('.//gmd:identificationInfo/gmd:MD_DataIdentification', namespaces=ns)
-            if id_info is not None:
-                for party in id_info.findall('./gmd:pointOfContact/gmd:CI_ResponsibleParty', namespaces=ns):
-                    if party.find('.//gmd:role/gmd:CI_RoleCode', namespaces=ns).get('codeListValue') == 'author':
-                        atualizar_bloco_de_contato(party, row, ns)
-                        break
-
-                set_element_text(id_info, './/gmd:citation//gmd:title/gco:CharacterString', row.get('title'), ns)
-                
-                # Lógica "Destruir e Reconstruir" para a data de criação
-                date_parent = id_info.find('.//gmd:citation//gmd:date/gmd:CI_Date/gmd:date', namespaces=ns)
-                if date_parent is not None:
-                    date_parent.clear()
-                    date_time_element = ET.SubElement(date_parent, f"{{{ns['gco']}}}DateTime")
-                    date_time_element.text = row.get('date_creation', '')
-                
-                set_element_text(id_info, './gmd:abstract/gco:CharacterString', row.get('abstract'), ns)
-                set_element_attribute(id_info, './gmd:status/gmd:MD_ProgressCode', 'codeListValue', row.get('status_codeListValue'), ns)
-                set_element_attribute(id_info, './gmd:language/gmd:LanguageCode', 'codeListValue', row.get('LanguageCode'), ns)
-                set_element_attribute(id_info, './gmd:characterSet/gmd:MD_CharacterSetCode', 'codeListValue', row.get('characterSet'), ns)
-                
-                keyword_container = id_info.find('./gmd:descriptiveKeywords', namespaces=ns)
-                if keyword_container is not None:
-                    keyword_container.clear()
-                    md_keywords_node = ET.SubElement(keyword_container, f"{{{ns['gmd']}}}MD_Keywords")
-                    keywords_found = False
-                    for col in ['MD_Keywords1', 'MD_Keywords2', 'MD_Keywords3', 'MD_Keywords4']:
-                        if col in row and row[col]:
-                            keywords_found = True
-                            keyword_node = ET.SubElement(md_keywords_node, f"{{{ns['gmd']}}}keyword")
-                            char_string = ET.SubElement(keyword_node, f"{{{ns['gco']}}}CharacterString")
-                            char_string.text = row[col]
-                    if not keywords_found:
-                        keyword_container.remove(md_keywords_node)
-
-                set_element_attribute(id_info, './/gmd:spatialRepresentationType/gmd:MD_SpatialRepresentationTypeCode', 'codeListValue', row.get('MD_SpatialRepresentationTypeCode_codeListValue'), ns)
-                set_element_text(id_info, './/gmd:spatialResolution//gmd:denominator/gco:Integer', str(int(float(row.get('spatialResolution_denominator', 0)))), ns)
-                set_element_text(id_info, './/gmd:topicCategory/gmd:MD_TopicCategoryCode', row.get('topicCategory'), ns)
-                set_element_text(id_info, './/gmd:extent//gmd:westBoundLongitude/gco:Decimal', str(row.get('westBoundLongitude')), ns)
-                set_element_text(id_info, './/gmd:extent//gmd:eastBoundLongitude/gco:Decimal', str(row.get('eastBoundLongitude')), ns)
-                set_element_text(id_info, './/gmd:extent//gmd:southBoundLatitude/gco:Decimal', str(row.get('southBoundLatitude')), ns)
-                set_element_text(id_info, './/gmd:extent//gmd:northBoundLatitude/gco:Decimal', str(row.get('northBoundLatitude')), ns)
-
-            # Converte o XML gerado para uma string
-            xml_string_output = ET.tostring(root, pretty_print=True, xml_declaration=True, encoding='utf-8').decode('utf-8')
-
-            # Query
-            query = f"""
-                INSERT INTO {db_params_config['schema']}.{db_params_config['table']} 
-                ({db_params_config['id_column']}, {db_params_config['xml_column']}) 
-                VALUES (%s, %s)
-                ON CONFLICT ({db_params_config['id_column']}) DO UPDATE SET
-                {db_params_config['xml_column']} = EXCLUDED.{db_params_config['xml_column']};
-            """
-            
-            # Executa a query
-            cursor.execute(query, (file_identifier, xml_string_output))
-            print(f"--> Registro '{row.get('title')}' (ID: {file_identifier}) inserido/atualizado no banco.")
+        modo = db_params_config.get("modo_carga", "linha")
+        tamanho_lote = db_params_config.get("tamanho_lote", 1000)
+        query = query_upsert(db_params_config)
+        if modo == "copy":
+            criar_staging(cursor, db_params_config)
+        print(f"Modo de carga: {modo}")
+
+        # Hashes da última carga: registros com o mesmo id e o mesmo conteúdo não são regravados
+        hashes = {}
+        if db_params_config.get("tabela_hash"):
+            criar_tabela_hash(cursor, db_params_config)
+            hashes = carregar_hashes(cursor, db_params_config)
+            print(f"{len(hashes)} registros já carregados (hash de conteúdo).")
+
+        # CSV lido em chunks; registros montados no pool de processos (config["n_processos"]) e recebidos na ordem do CSV
+        # (data de criação sempre recriada como gco:DateTime, como antes)
+        gerados, erros, inalterados = 0, 0, 0
+        lote, lote_hashes = [], []
+        vistos = set()
+        inicio = time.time()
+        for index, title, file_identifier, xml, erro in gerar_registros(csv_path, template_path, False, config, estatisticas):
+            if erro is not None:
+                erros += 1
+                rejeitos.registrar(index, title, file_identifier, erro, xml)
+                print(f"❌ Registro {index} ('{title}') rejeitado: {erro}")
+                continue
+
+            # Mesmo id duas vezes no CSV: o upsert em lote não aceita, e o segundo sobrescreveria o primeiro
+            if file_identifier in vistos:
+                erros += 1
+                rejeitos.registrar(index, title, file_identifier, "identificador repetido no CSV", xml)
+                print(f"❌ Registro {index} ('{title}') ignorado: identificador {file_identifier} repetido no CSV.")
+                continue
+            vistos.add(file_identifier)
+
+            hash_conteudo = hashlib.sha256(xml).hexdigest()
+            if hashes.get(file_identifier) == hash_conteudo:
+                inalterados += 1
+                continue
+
+            # XML já serializado pelo worker
+            xml_string_output = xml.decode('utf-8')
+
+            if modo == "linha":
+                # Um INSERT ... ON CONFLICT por registro (comportamento original)
+                # Os hashes vão em lote (um execute_values a cada tamanho_lote), não um por registro
+                cursor.execute(query, (file_identifier, xml_string_output))
+                if db_params_config.get("tabela_hash"):
+                    lote_hashes.append((file_identifier, hash_conteudo))
+                    if len(lote_hashes) >= tamanho_lote:
+                        gravar_hashes(cursor, lote_hashes, db_params_config)
+                        lote_hashes = []
+                gerados += 1
+                print(f"--> Registro '{title}' (ID: {file_identifier}) inserido/atualizado no banco.")
+                continue
+
+            lote.append((file_identifier, xml_string_output))
+            lote_hashes.append((file_identifier, hash_conteudo))
+            if len(lote) >= tamanho_lote:
+                inserir_lote(cursor, lote, db_params_config)
+                if db_params_config.get("tabela_hash"):
+                    gravar_hashes(cursor, lote_hashes, db_params_config)
+                gerados += len(lote)
+                lote, lote_hashes = [], []
+                if db_params_config.get("commit_por_lote"):
+                    conn.commit()
+                print(f"--> {gerados} registros inseridos/atualizados ({gerados / (time.time() - inicio):.0f} registros/s).")
+
+        if lote:
+            inserir_lote(cursor, lote, db_params_config)
+            gerados += len(lote)
+        if lote_hashes and db_params_config.get("tabela_hash"):
+            gravar_hashes(cursor, lote_hashes, db_params_config)
 
         # Salva (commita) todas as transações no banco de dados
         conn.commit()
-        print("\nTodas as alterações foram salvas no banco de dados.")
+        segundos = time.time() - inicio
+        print(f"\nTodas as alterações foram salvas no banco de dados. Registros: {gerados} | inalterados: {inalterados} | com erro: {erros} | "
+              f"{segundos:.1f} s ({gerados / segundos if segundos > 0 else 0:.0f} registros/s)")
+        if resumo_validacao(estatisticas):
+            print(resumo_validacao(estatisticas))
 
     except psycopg2.Error as e:
         print(f"\nERRO DE BANCO DE DADOS: {e}")
@@ -171,6 +223,7 @@ def gerar_e_inserir_metadados(csv_path, template_path, db_params_config):
         import traceback
         traceback.print_exc()
     finally:
+        rejeitos.fechar()
         # Garante que a conexão seja sempre fechada
         if conn:
             cursor.close()
@@ -178,4 +231,4 @@ def gerar_e_inserir_metadados(csv_path, template_path, db_params_config):
             print("Conexão com o banco de dados foi fechada.")
 
 if __name__ == "__main__":
-    gerar_e_inserir_metadados(caminho_csv, caminho_template_xml, db_config)
+    gerar_e_inserir_metadados(caminho_csv, caminho_template_xml, db_config, config_geracao)
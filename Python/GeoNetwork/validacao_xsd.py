@@ -0,0 +1,92 @@
+#Matheus Dias de Aviz
+#Validação XSD (ISO 19139 / gmd) dos registros MGB 2.0 gerados
+#O schema é compilado uma vez por processo; os XSD (gmd, gco, gml, xlink...) ficam numa cópia local em disco,
+#baixada na primeira execução pelo próprio resolver do lxml: as execuções seguintes compilam sem acessar a rede.
+#(o schema compilado do libxml2 não pode ser serializado; o que fica em disco é a árvore de XSD já resolvida)
+#Registros inválidos vão para um arquivo de rejeitados (JSON por linha) com os erros, sem interromper a geração
+import json
+import os
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+from lxml import etree as ET
+
+XSD_GMD = "http://schemas.opengis.net/iso/19139/20070417/gmd/gmd.xsd"
+PASTA_CACHE_XSD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xsd_cache")
+MAX_ERROS_POR_REGISTRO = 5
+
+_schemas = {}
+
+class ResolvedorCache(ET.Resolver):
+    # http(s)://host/caminho -> <pasta_cache>/host/caminho; baixa só o que ainda não está na cópia local.
+    # O conteúdo volta com a URL original como base, para os include/import relativos passarem por aqui também.
+    def __init__(self, pasta_cache):
+        super().__init__()
+        self.pasta_cache = pasta_cache
+
+    def caminho_local(self, url):
+        partes = urlparse(url)
+        return os.path.join(self.pasta_cache, partes.netloc.replace(":", "_"), *partes.path.lstrip("/").split("/"))
+
+    def ler(self, url):
+        local = self.caminho_local(url)
+        if not os.path.exists(local):
+            print(f"Baixando {url}...")
+            with urllib.request.urlopen(url, timeout=60) as resposta:
+                conteudo = resposta.read()
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            with open(local + ".tmp", "wb") as f:
+                f.write(conteudo)
+            os.replace(local + ".tmp", local)
+        with open(local, "rb") as f:
+            return f.read()
+
+    def resolve(self, url, id, context):
+        if not url or urlparse(url).scheme not in ("http", "https"):
+            return None
+        return self.resolve_string(self.ler(url), context, base_url=url)
+
+def compilar_schema(xsd_url=XSD_GMD, pasta_cache=PASTA_CACHE_XSD):
+    # Um XMLSchema por (url, pasta) e por processo
+    chave = (xsd_url, pasta_cache)
+    if chave not in _schemas:
+        inicio = time.time()
+        parser = ET.XMLParser()
+        resolvedor = ResolvedorCache(pasta_cache)
+        parser.resolvers.add(resolvedor)
+        documento = ET.fromstring(resolvedor.ler(xsd_url), parser, base_url=xsd_url)
+        _schemas[chave] = ET.XMLSchema(documento)
+        print(f"Schema {xsd_url} compilado em {time.time() - inicio:.1f} s.")
+    return _schemas[chave]
+
+def erros_validacao(schema, root):
+    # None se válido; senão os primeiros erros (linha: mensagem)
+    if schema.validate(root):
+        return None
+    erros = [f"linha {e.line}: {e.message}" for e in list(schema.error_log)[:MAX_ERROS_POR_REGISTRO]]
+    return "XSD inválido: " + " | ".join(erros)
+
+class ArquivoRejeitos:
+    # Um JSON por linha: índice no CSV, título, fileIdentifier, erro e o XML (quando chegou a ser gerado).
+    # O arquivo da execução anterior é apagado na abertura: sem rejeitados, não sobra arquivo nenhum
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.arquivo = None
+        self.rejeitados = 0
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+    def registrar(self, index, title, file_identifier, erro, xml=None):
+        if self.arquivo is None:
+            self.arquivo = open(self.caminho, "w", encoding="utf-8")
+        self.arquivo.write(json.dumps({
+            "indice": int(index), "title": title, "fileIdentifier": file_identifier, "erro": erro,
+            "xml": xml.decode("utf-8") if xml is not None else None,
+        }, ensure_ascii=False) + "\n")
+        self.rejeitados += 1
+
+    def fechar(self):
+        if self.arquivo is not None:
+            self.arquivo.close()
+            print(f"{self.rejeitados} registros rejeitados em {self.caminho}")
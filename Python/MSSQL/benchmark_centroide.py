@@ -0,0 +1,214 @@
+#Matheus Dias de Aviz
+#Benchmark do pipeline de centroides sem o SQL Server de produção
+#Gera parcelas sintéticas nas zonas 22S/23S, grava num SQLite local (no lugar do MS SQL Server) e roda
+#leitura -> decodificação WKB -> centroide -> reprojeção -> update, com as mesmas funções de centroide_UTMtoLatLon.py
+#Reprojeção comparada por motor: pyproj, NumPy, grade e Python puro (fórmulas de fn_UTMtoLatLon ponto a ponto)
+#Resultado em JSON (uma linha por execução) para acompanhar regressões
+import json
+import math
+import os
+import platform
+import sqlite3
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+
+from centroide_paralelo import gerar_poligonos_sinteticos, obter_transformador
+from centroide_UTMtoLatLon import criar_geodataframe, calcular_centroides
+from grade_utm_latlon import EXTENSAO_SP, erro_em_metros
+from metricas_centroide import MetricasEtapas, bytes_update, bytes_wkb, pico_rss_mb
+from utm_latlon_numpy import A, K0, CORRECOES_ZONA, COEFICIENTES_CALIBRACAO, CONSTANTES_TSQL, latlon_do_epsg
+
+ZONAS_EPSG = {22: "EPSG:31982", 23: "EPSG:31983"}
+
+# --- FÓRMULAS DE fn_UTMtoLatLon EM PYTHON PURO (um ponto por vez, sem NumPy) ---
+def utm_para_latlon_escalar(x, y, zona, hemisferio_sul=True, c=CONSTANTES_TSQL):
+    e2, ep2 = c["e2"], c["ep2"]
+    xr = x - 500000.0
+    yr = y - 10000000.0 if hemisferio_sul else y
+    mu = (yr / K0) / c["denominador_mu"]
+    e1 = (1.0 - math.sqrt(1.0 - e2)) / (1.0 + math.sqrt(1.0 - e2))
+    phi1 = (mu
+            + (3.0 * e1 / 2.0 - 27.0 * e1 ** 3 / 32.0) * math.sin(2.0 * mu)
+            + (21.0 * e1 ** 2 / 16.0 - 55.0 * e1 ** 4 / 32.0) * math.sin(4.0 * mu)
+            + (151.0 * e1 ** 3 / 96.0) * math.sin(6.0 * mu)
+            + (1097.0 * e1 ** 4 / 512.0) * math.sin(8.0 * mu))
+    sen2 = math.sin(phi1) ** 2
+    cos_phi1 = math.cos(phi1)
+    N1 = A / math.sqrt(1.0 - e2 * sen2)
+    T1 = math.tan(phi1)
+    C1 = ep2 * cos_phi1 ** 2
+    R1 = c["a_1_menos_e2"] / (1.0 - e2 * sen2) ** 1.5
+    graus = 180.0 / math.pi
+
+    lat = (phi1
+           - (T1 * xr ** 2) / (2.0 * R1 * N1 * K0 * K0)
+           + (T1 * (5.0 + 3.0 * T1 * T1 + 10.0 * C1 - 4.0 * C1 * C1 - 9.0 * ep2) * xr ** 4) / (24.0 * R1 * N1 ** 3 * K0 ** 4)
+           - (T1 * (61.0 + 90.0 * T1 * T1 + 298.0 * C1 + 45.0 * T1 ** 4 - 252.0 * ep2 - 3.0 * C1 * C1) * xr ** 6) / (720.0 * R1 * N1 ** 5 * K0 ** 6)
+           ) * graus
+    lon = (zona * 6 - 183) + ((xr / (N1 * cos_phi1 * K0))
+                              - ((1.0 + 2.0 * T1 * T1 + C1) * xr ** 3) / (6.0 * N1 ** 3 * cos_phi1 * K0 ** 3)
+                              + ((5.0 - 2.0 * C1 + 28.0 * T1 * T1 - 3.0 * C1 * C1 + 8.0 * ep2 + 24.0 * T1 ** 4) * xr ** 5) / (120.0 * N1 ** 5 * cos_phi1 * K0 ** 5)
+                              ) * graus
+
+    # fn_UTMtoLatLon: correção por zona | fn_UTMtoLatLon_aux: calibração linear
+    corr_lat, corr_lon = CORRECOES_ZONA.get(zona, (0.0, 0.0))
+    k = COEFICIENTES_CALIBRACAO
+    lat += corr_lat + k["a_lat"] + k["b_lat"] * x + k["c_lat"] * y
+    lon += corr_lon + k["a_lon"] + k["b_lon"] * x + k["c_lon"] * y
+    return lat, lon
+
+# --- MOTORES DE REPROJEÇÃO: (x, y, zona) -> (lat, lon), um grupo por zona ---
+def reprojetar_pyproj(x, y, zona):
+    lon, lat = obter_transformador(ZONAS_EPSG[zona]).transform(x, y)
+    return lat, lon
+
+def reprojetar_python_puro(x, y, zona):
+    resultado = [utm_para_latlon_escalar(xi, yi, zona) for xi, yi in zip(x.tolist(), y.tolist())]
+    lat, lon = zip(*resultado) if resultado else ((), ())
+    return np.array(lat), np.array(lon)
+
+def _motor_numpy(motor):
+    return lambda x, y, zona: latlon_do_epsg(x, y, ZONAS_EPSG[zona], motor)
+
+MOTORES_BENCHMARK = {
+    "pyproj": reprojetar_pyproj,
+    "numpy": _motor_numpy("numpy"),
+    "numpy_tsql": _motor_numpy("numpy_tsql"),
+    "grade": _motor_numpy("grade"),
+    "grade_tsql": _motor_numpy("grade_tsql"),
+    "python_puro": reprojetar_python_puro,
+}
+
+def reprojetar_por_zona(funcao, x, y, zonas):
+    lat = np.empty(len(x))
+    lon = np.empty(len(x))
+    for zona in np.unique(zonas):
+        na_zona = zonas == zona
+        lat[na_zona], lon[na_zona] = funcao(x[na_zona], y[na_zona], int(zona))
+    return lat, lon
+
+# --- BANCO LOCAL (SQLite no lugar do MS SQL Server) ---
+def centros_na_zona(rng, n, zona):
+    # Centros (x, y) em UTM da zona, sorteados na parte de SP que fica dentro da faixa de 6° da zona
+    lon_min, lon_max, lat_min, lat_max = EXTENSAO_SP
+    meridiano = zona * 6 - 183
+    lon = rng.uniform(max(lon_min, meridiano - 3), min(lon_max, meridiano + 3), n)
+    lat = rng.uniform(lat_min, lat_max, n)
+    transformador = Transformer.from_crs("EPSG:4674", ZONAS_EPSG[zona], always_xy=True)
+    return transformador.transform(lon, lat)
+
+def criar_banco(arquivo, n_registros, tamanho_lote=100000, n_vertices=16, semente=42):
+    # Parcelas geradas em lotes (10M polígonos de uma vez não cabem em memória); zona sorteada por parcela
+    # e coordenadas dentro da zona sorteada (cada zona reprojetada com o seu meridiano central de verdade)
+    if os.path.exists(arquivo):
+        os.remove(arquivo)
+    conn = sqlite3.connect(arquivo)
+    conn.execute("CREATE TABLE parcelas (qgs_fid INTEGER PRIMARY KEY, geometry BLOB, zona INTEGER, lat REAL, lon REAL)")
+    rng = np.random.default_rng(semente)
+    for inicio in range(0, n_registros, tamanho_lote):
+        n = min(tamanho_lote, n_registros - inicio)
+        zonas = rng.choice(list(ZONAS_EPSG), n)
+        cx, cy = np.empty(n), np.empty(n)
+        for zona in ZONAS_EPSG:
+            na_zona = zonas == zona
+            cx[na_zona], cy[na_zona] = centros_na_zona(rng, int(na_zona.sum()), zona)
+        wkb = gerar_poligonos_sinteticos(n, n_vertices=n_vertices, semente=semente + inicio, centros=(cx, cy))
+        conn.executemany("INSERT INTO parcelas (qgs_fid, geometry, zona) VALUES (?, ?, ?)",
+                         zip(range(inicio + 1, inicio + n + 1), wkb.tolist(), zonas.tolist()))
+    conn.commit()
+    return conn
+
+def medir_motor(funcao, x, y, zonas):
+    # Tempo sem rastreamento; pico de memória numa segunda execução com tracemalloc (que deixa o Python puro mais lento)
+    inicio = time.time()
+    lat, lon = reprojetar_por_zona(funcao, x, y, zonas)
+    segundos = time.time() - inicio
+    tracemalloc.start()
+    reprojetar_por_zona(funcao, x, y, zonas)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return lat, lon, segundos, pico
+
+def executar_benchmark(n_registros, arquivo_banco, tamanho_lote=100000):
+    metricas = MetricasEtapas(f"sintetico_{n_registros}")
+    print(f"\n--- BENCHMARK COM {n_registros} PARCELAS ---")
+
+    with metricas.medir("geracao", n_registros):
+        conn = criar_banco(arquivo_banco, n_registros, tamanho_lote)
+
+    # Leitura em lotes por qgs_fid (keyset), como o modo em lotes do pipeline
+    xs, ys, zonas, fids = [], [], [], []
+    ultimo_fid = 0
+    while True:
+        with metricas.medir("leitura") as medida:
+            df = pd.read_sql("SELECT qgs_fid, geometry, zona FROM parcelas WHERE qgs_fid > ? ORDER BY qgs_fid LIMIT ?",
+                             conn, params=(ultimo_fid, tamanho_lote))
+            medida["registros"], medida["bytes"] = len(df), bytes_wkb(df['geometry'])
+        if df.empty:
+            break
+        ultimo_fid = int(df['qgs_fid'].iloc[-1])
+        with metricas.medir("decodificacao_wkb", len(df)):
+            gdf = criar_geodataframe(df, ZONAS_EPSG[23])
+        with metricas.medir("centroide", len(gdf)):
+            gdf, _ = calcular_centroides(gdf)
+        xs.append(shapely.get_x(gdf.geometry.values))
+        ys.append(shapely.get_y(gdf.geometry.values))
+        zonas.append(gdf['zona'].to_numpy())
+        fids.append(gdf['qgs_fid'].to_numpy())
+    x, y, zonas, fids = (np.concatenate(partes) for partes in (xs, ys, zonas, fids))
+
+    # Reprojeção por motor; erro em metros contra o pyproj e contra fn_UTMtoLatLon_aux (numpy_tsql)
+    resultados, motores = {}, {}
+    for nome, funcao in MOTORES_BENCHMARK.items():
+        print(f"Reprojetando {len(x)} centroides com {nome}...")
+        lat, lon, segundos, pico = medir_motor(funcao, x, y, zonas)
+        resultados[nome] = (lat, lon)
+        motores[nome] = {"segundos": round(segundos, 4), "pontos_por_s": round(len(x) / segundos, 1) if segundos > 0 else None,
+                         "pico_memoria_mb": round(pico / 1e6, 2)}
+    for nome, (lat, lon) in resultados.items():
+        for referencia in ("pyproj", "numpy_tsql"):
+            erro = erro_em_metros(lat, lon, *resultados[referencia])
+            motores[nome][f"erro_{referencia}_m"] = {"max": float(erro.max()), "p99": float(np.percentile(erro, 99)),
+                                                     "medio": float(erro.mean())}
+
+    # Update do resultado do pyproj (motor padrão do pipeline), em lotes
+    lat, lon = resultados["pyproj"]
+    with metricas.medir("update", len(fids), bytes_update(len(fids))):
+        for inicio in range(0, len(fids), tamanho_lote):
+            fim = inicio + tamanho_lote
+            conn.executemany("UPDATE parcelas SET lat = ?, lon = ? WHERE qgs_fid = ?",
+                             zip(lat[inicio:fim].tolist(), lon[inicio:fim].tolist(), fids[inicio:fim].tolist()))
+        conn.commit()
+    conn.close()
+
+    metricas.emitir()
+    return {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "n_registros": n_registros,
+        "plataforma": {"python": platform.python_version(), "sistema": platform.platform(), "cpus": os.cpu_count()},
+        "pipeline": metricas.resumo(),
+        "motores": motores,
+        "pico_rss_mb": pico_rss_mb(),
+    }
+
+if __name__ == "__main__":
+    ESCALAS = [10000, 100000]  # até 10000000 (o Python puro leva alguns minutos nessa escala)
+    PASTA = os.path.dirname(os.path.abspath(__file__))
+    ARQUIVO_BANCO = os.path.join(PASTA, "benchmark_centroide.sqlite")
+    ARQUIVO_RESULTADOS = os.path.join(PASTA, "benchmark_centroide.jsonl")
+
+    for n_registros in ESCALAS:
+        resultado = executar_benchmark(n_registros, ARQUIVO_BANCO)
+        with open(ARQUIVO_RESULTADOS, "a", encoding="utf-8") as f:
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        for nome, m in resultado["motores"].items():
+            print(f"{nome:12s} {m['pontos_por_s']:>14,.0f} pontos/s | {m['pico_memoria_mb']:8.1f} MB | "
+                  f"erro máx. p/ pyproj {m['erro_pyproj_m']['max']:.4f} m")
+    os.remove(ARQUIVO_BANCO)
+    print(f"✅ Resultados anexados em {ARQUIVO_RESULTADOS}")
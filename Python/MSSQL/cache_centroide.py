@@ -0,0 +1,115 @@
+#Matheus Dias de Aviz
+#Cache em disco (SQLite) de geometria -> lat/lon do centroide, para não recalcular parcelas que não mudaram
+#Chave: hash (BLAKE2b, 16 bytes) de EPSG de origem + motor de reprojeção + modo do centroide + WKB
+#Só o WKB é lido para montar a chave: os acertos nunca são decodificados; as faltas seguem o pipeline normal
+#"arquivo_cache" na config liga o cache; "tamanho_max_cache" limita o número de entradas (descarta as menos usadas)
+import hashlib
+import sqlite3
+import time
+
+import pandas as pd
+
+TAMANHO_MAX_CACHE = 5000000  # ~60 bytes por entrada no SQLite
+# O mesmo arquivo é usado ao mesmo tempo pelas tasks mapeadas do Airflow (uma por faixa de qgs_fid). O pool de
+# processos do centroide_paralelo não acessa o cache: separar/concluir rodam só no processo principal.
+# WAL deixa leitores e um escritor em paralelo, e os escritores esperam a vez em vez de falhar com "database is locked"
+ESPERA_TRAVA_S = 60
+
+_caches = {}
+
+def abrir_cache(config):
+    # Uma conexão por arquivo e por processo; None quando o cache não está configurado
+    arquivo = config.get("arquivo_cache")
+    if not arquivo:
+        return None
+    if arquivo not in _caches:
+        _caches[arquivo] = CacheCentroides(arquivo, config.get("tamanho_max_cache", TAMANHO_MAX_CACHE))
+    return _caches[arquivo]
+
+class CacheCentroides:
+    def __init__(self, arquivo, tamanho_max=TAMANHO_MAX_CACHE):
+        self.tamanho_max = int(tamanho_max)
+        self.conn = sqlite3.connect(arquivo, timeout=ESPERA_TRAVA_S)
+        self.conn.execute(f"PRAGMA busy_timeout={ESPERA_TRAVA_S * 1000}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS centroides (
+                chave BLOB PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL, uso REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_centroides_uso ON centroides (uso)")
+        self.conn.execute("CREATE TEMP TABLE consulta (posicao INTEGER PRIMARY KEY, chave BLOB NOT NULL)")
+        self.entradas = self.conn.execute("SELECT COUNT(*) FROM centroides").fetchone()[0]
+        self.acertos = 0
+        self.faltas = 0
+
+    def chaves(self, df, config):
+        # Prefixo por EPSG (por linha no modo multizona); linhas sem EPSG conhecido ficam sem chave (sempre falta)
+        sufixo = f"|{config.get('motor_reprojecao', 'pyproj')}|{config.get('centroide', 'cliente')}|"
+        if config.get("zonas"):
+            prefixos = [None if pd.isna(z) or config["zonas"].get(z) is None else (config["zonas"][z] + sufixo).encode()
+                        for z in df['zona']]
+        else:
+            prefixos = [(config["epsg_origem"] + sufixo).encode()] * len(df)
+        return [None if p is None or w is None else hashlib.blake2b(p + w, digest_size=16).digest()
+                for p, w in zip(prefixos, df['geometry'].to_numpy(dtype=object))]
+
+    def separar(self, df, config):
+        # Retorna (acertos: qgs_fid + lat/lon já calculados, faltas: df original com a coluna "chave_cache")
+        df = df.assign(chave_cache=self.chaves(df, config))
+        consulta = [(i, chave) for i, chave in enumerate(df['chave_cache']) if chave is not None]
+        self.conn.execute("DELETE FROM consulta")
+        self.conn.executemany("INSERT INTO consulta VALUES (?, ?)", consulta)
+        encontrados = self.conn.execute("""
+            SELECT q.posicao, c.lat, c.lon FROM consulta AS q JOIN centroides AS c ON c.chave = q.chave
+        """).fetchall()
+        if encontrados:
+            # Marca o uso para a política de descarte (menos usadas saem primeiro)
+            self.conn.execute("UPDATE centroides SET uso = ? WHERE chave IN (SELECT chave FROM consulta)", (time.time(),))
+            self.conn.commit()
+
+        posicoes = [p for p, _, _ in encontrados]
+        acertos = df.iloc[posicoes].drop(columns=['geometry', 'chave_cache'])
+        acertos[config["coluna_lat"]] = [lat for _, lat, _ in encontrados]
+        acertos[config["coluna_lon"]] = [lon for _, _, lon in encontrados]
+        faltas = df.drop(index=df.index[posicoes])
+        self.acertos += len(acertos)
+        self.faltas += len(faltas)
+        return acertos, faltas
+
+    def gravar(self, gdf, config):
+        # Grava os resultados calculados para as faltas e aplica o limite de tamanho
+        agora = time.time()
+        linhas = [(chave, float(lat), float(lon), agora)
+                  for chave, lat, lon in zip(gdf['chave_cache'], gdf[config["coluna_lat"]], gdf[config["coluna_lon"]])
+                  if chave is not None and pd.notna(lat) and pd.notna(lon)]
+        self.conn.executemany("INSERT OR REPLACE INTO centroides VALUES (?, ?, ?, ?)", linhas)
+        # Estimativa por cima (chaves substituídas e gravações de outros processos não entram): só a contagem real
+        # decide o descarte
+        self.entradas += len(linhas)
+        if self.entradas > self.tamanho_max:
+            self.entradas = self.conn.execute("SELECT COUNT(*) FROM centroides").fetchone()[0]
+        if self.entradas > self.tamanho_max:
+            # Descarta 10% abaixo do limite de uma vez para não podar a cada lote
+            excesso = self.entradas - int(self.tamanho_max * 0.9)
+            self.conn.execute("""
+                DELETE FROM centroides WHERE chave IN (SELECT chave FROM centroides ORDER BY uso LIMIT ?)
+            """, (excesso,))
+            self.entradas = self.conn.execute("SELECT COUNT(*) FROM centroides").fetchone()[0]
+        self.conn.commit()
+
+    def concluir(self, gdf, acertos, config):
+        # Grava as faltas calculadas e junta com os acertos, em ordem de qgs_fid, só com colunas tabulares
+        if not gdf.empty:
+            self.gravar(gdf, config)
+        calculados = pd.DataFrame(gdf).drop(columns=['geometry', 'chave_cache'], errors='ignore')
+        partes = [parte for parte in (calculados, acertos) if not parte.empty]
+        if len(partes) < 2:
+            return partes[0] if partes else calculados
+        return pd.concat(partes).sort_values('qgs_fid', kind='stable')
+
+    def resumo(self):
+        total = self.acertos + self.faltas
+        percentual = 100.0 * self.acertos / total if total else 0.0
+        return f"Cache: {self.acertos} acertos / {total} consultas ({percentual:.1f}%), {self.entradas} entradas"
@@ -4,6 +4,11 @@ import geopandas as gpd
 import pandas as pd
 import pyodbc
 import time
+from centroide_paralelo import calcular_latlon_paralelo
+from utm_latlon_numpy import latlon_do_epsg
+from metricas_centroide import MetricasEtapas, bytes_update, bytes_wkb
+from centroide_servidor import expressao_geometria_sql, calibrar_centroide, recuperar_centroides_nulos
+from cache_centroide import abrir_cache
 
 # --- CONFIGURAÇÃO DA CONEXÃO ---
 conn_str = (
@@ -15,87 +20,353 @@ conn_str = (
     #r'PWD=id_senha;'
 )
 
+# --- ETAPAS REUTILIZÁVEIS (modo completo e modo em lotes) ---
+def criar_geodataframe(df, epsg_origem):
+    # Com "leitor": "arrow" a coluna já chega decodificada (ver leitura_arrow.py)
+    if df['geometry'].dtype == 'geometry':
+        return gpd.GeoDataFrame(df, geometry='geometry', crs=epsg_origem)
+    return gpd.GeoDataFrame(df, geometry=gpd.GeoSeries.from_wkb(df['geometry']), crs=epsg_origem)
+
+def calcular_centroides(gdf):
+    # Retorna o GeoDataFrame só com centroides válidos e a quantidade de registros pulados
+    gdf['geometry'] = gdf.geometry.centroid
+    registros_antes = len(gdf)
+    gdf = gdf[~gdf.geometry.is_empty]
+    return gdf, registros_antes - len(gdf)
+
+def reprojetar_centroides(gdf, config):
+    # "motor_reprojecao": "pyproj" (padrão), "numpy", "numpy_tsql", "grade" ou "grade_tsql" (ver utm_latlon_numpy.py)
+    motor = config.get("motor_reprojecao", "pyproj")
+    if motor == "pyproj":
+        gdf_latlon = gdf.to_crs("EPSG:4674")
+        gdf[config["coluna_lat"]] = gdf_latlon.geometry.y
+        gdf[config["coluna_lon"]] = gdf_latlon.geometry.x
+    else:
+        lat, lon = latlon_do_epsg(gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy(), config["epsg_origem"], motor)
+        gdf[config["coluna_lat"]] = lat
+        gdf[config["coluna_lon"]] = lon
+    return gdf
+
+# --- MODO MULTIZONA (PASSAGEM ÚNICA) ---
+# "zonas": {valor da zona: EPSG de origem}. O valor vem de "coluna_zona" ou, sem ela, do SRID da geometria
+#   (ex.: {22: "EPSG:31982", 23: "EPSG:31983"} com coluna de zona, {31982: "EPSG:31982", ...} com SRID).
+# Em UTM as mesmas coordenadas X/Y são válidas nas duas zonas, então a zona precisa vir do dado (coluna ou SRID).
+def expressao_zona_sql(config):
+    return config.get("coluna_zona") or f"{config['coluna_geom']}.STSrid"
+
+def calcular_latlon_multizona(df, config, metricas=None):
+    # Agrupa as linhas pela zona, reprojeta cada grupo com o EPSG correto e remonta em ordem de qgs_fid
+    # Linhas sem zona ou com zona fora de "zonas" são avisadas à parte e não entram em "pulados" (centroide inválido)
+    config_zona = {k: v for k, v in config.items() if k != "zonas"}
+    resultados, pulados = [], 0
+    sem_zona = int(df['zona'].isna().sum())
+    if sem_zona:
+        print(f"   ATENÇÃO: {sem_zona} registros sem zona foram pulados.")
+    for valor_zona, grupo in df.groupby('zona', sort=True):
+        epsg_origem = config["zonas"].get(valor_zona)
+        if epsg_origem is None:
+            print(f"   ATENÇÃO: {len(grupo)} registros com zona '{valor_zona}' sem EPSG configurado foram pulados.")
+            continue
+        gdf, pulados_zona = calcular_latlon(grupo.drop(columns='zona'), {**config_zona, "epsg_origem": epsg_origem}, metricas)
+        resultados.append(pd.DataFrame(gdf.drop(columns='geometry')))
+        pulados += pulados_zona
+    if not resultados:
+        return pd.DataFrame(columns=df.columns.drop(['geometry', 'zona'])), pulados
+    return pd.concat(resultados).sort_values('qgs_fid', kind='stable'), pulados
+
+def calcular_latlon(df, config, metricas=None):
+    # Etapas 2 e 3 juntas: por zona ("zonas"), num pool de processos ("n_processos") ou em série (GeoPandas)
+    metricas = metricas if metricas is not None else MetricasEtapas()
+    if config.get("zonas"):
+        return calcular_latlon_multizona(df, config, metricas)
+    if config.get("n_processos"):
+        return calcular_latlon_paralelo(df, config, metricas)
+    with metricas.medir("decodificacao_wkb", len(df)):
+        gdf = criar_geodataframe(df, config["epsg_origem"])
+    with metricas.medir("centroide", len(gdf)):
+        gdf, pulados = calcular_centroides(gdf)
+    with metricas.medir("reprojecao", len(gdf)):
+        gdf = reprojetar_centroides(gdf, config)
+    return gdf, pulados
+
+# --- ESTRATÉGIAS DE ATUALIZAÇÃO ---
+# "estrategia_update": "executemany" (padrão, um UPDATE ... WHERE qgs_fid = ? por linha)
+#                      "staging" (carga em lote numa tabela temporária + um único UPDATE ... FROM com JOIN)
+# "tamanho_lote_staging": linhas por executemany no INSERT da tabela temporária (padrão 100000)
+def atualizar_via_staging(conn, gdf, config):
+    colunas_stage = [(config["coluna_lat"], "lat", "FLOAT"), (config["coluna_lon"], "lon", "FLOAT")]
+    tamanho = int(config.get("tamanho_lote_staging", 100000))
+
+    definicao = ", ".join(f"{nome} {tipo} NULL" for _, nome, tipo in colunas_stage)
+    insert_query = (f"INSERT INTO #centroide_staging (qgs_fid, {', '.join(n for _, n, _ in colunas_stage)}) "
+                    f"VALUES (?{', ?' * len(colunas_stage)})")
+    update_query = f"""
+        UPDATE t SET {', '.join(f't.{destino} = s.{nome}' for destino, nome, _ in colunas_stage)}
+        FROM {config['nome_tabela']} AS t
+        INNER JOIN #centroide_staging AS s ON t.qgs_fid = s.qgs_fid
+    """
+    dados = list(zip(gdf['qgs_fid'], gdf[config["coluna_lat"]], gdf[config["coluna_lon"]]))
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            IF OBJECT_ID('tempdb..#centroide_staging') IS NOT NULL DROP TABLE #centroide_staging;
+            CREATE TABLE #centroide_staging (qgs_fid BIGINT NOT NULL PRIMARY KEY, {definicao});
+        """)
+        cursor.fast_executemany = True
+        for inicio in range(0, len(dados), tamanho):
+            cursor.executemany(insert_query, dados[inicio:inicio + tamanho])
+        cursor.execute(update_query)
+        cursor.execute("DROP TABLE #centroide_staging;")
+    conn.commit()
+
+def atualizar_registros(conn, update_query, gdf, config):
+    # Retorna (estratégia usada, segundos) para o relatório de registros/s
+    estrategia = config.get("estrategia_update", "executemany")
+    inicio = time.time()
+    if estrategia == "staging":
+        atualizar_via_staging(conn, gdf, config)
+    else:
+        dados_para_atualizar = list(zip(
+            gdf[config["coluna_lat"]],
+            gdf[config["coluna_lon"]],
+            gdf['qgs_fid']
+        ))
+        with conn.cursor() as cursor:
+            cursor.fast_executemany = True
+            cursor.executemany(update_query, dados_para_atualizar)
+        conn.commit()
+    return estrategia, time.time() - inicio
+
+def taxa(registros, segundos):
+    return registros / segundos if segundos > 0 else 0.0
+
+def montar_update_query(nome_tabela, config):
+    return f"UPDATE {nome_tabela} SET {config['coluna_lat']} = ?, {config['coluna_lon']} = ? WHERE qgs_fid = ?"
+
 # --- FUNÇÃO DE LÓGICA REUTILIZÁVEL ---
 def processar_zona_com_geopandas(config):
+    # "centroide": "auto" mede cliente x servidor numa amostra antes de começar (ver centroide_servidor.py)
+    if config.get("centroide") == "auto":
+        with pyodbc.connect(conn_str, timeout=300) as conn:
+            config = {**config, "centroide": calibrar_centroide(conn, config)}
+
+    # Se "tamanho_lote" estiver na config, usa o modo em lotes (memória limitada ao lote)
+    if config.get("tamanho_lote"):
+        return processar_zona_em_lotes(config)
+
     nome_tabela = config["nome_tabela"]
     coluna_geom = config["coluna_geom"]
+    coluna_zona = f", {expressao_zona_sql(config)} AS zona" if config.get("zonas") else ""
     
     print(f"\n--- INICIANDO PROCESSAMENTO PARA: {nome_tabela} ---")
     start_time = time.time()
+    # Métricas por etapa (JSON lines); "arquivo_metricas" na config também grava num arquivo
+    metricas = MetricasEtapas(nome_tabela, config.get("arquivo_metricas"))
     
     try:
         # ETAPA 1: LEITURA DOS DADOS BRUTOS
         query_leitura = f"""
-            SELECT qgs_fid, {coluna_geom}.STAsBinary() AS geometry
+            SELECT qgs_fid, {expressao_geometria_sql(config)} AS geometry{coluna_zona}
             FROM {nome_tabela}
             WHERE {coluna_geom} IS NOT NULL AND {coluna_geom}.STIsEmpty() = 0;
         """
         print("1. Lendo geometrias do MS SQL Server...")
         
-        with pyodbc.connect(conn_str, timeout=300) as conn:
-            df = pd.read_sql(query_leitura, conn)
+        if config.get("comparar_leitores"):
+            # Medição à parte (processos novos): pd.read_sql x Arrow na mesma consulta, ver leitura_arrow.py
+            from leitura_arrow import comparar_leitores
+            comparar_leitores(conn_str, query_leitura, config, metricas)
+
+        if config.get("leitor") == "arrow":
+            # Leitura colunar em lotes (arrow-odbc, dependência opcional); conexão própria, fora do pool
+            from leitura_arrow import ler_geometrias_arrow
+            with metricas.medir("leitura") as medida:
+                df, medida["bytes"] = ler_geometrias_arrow(conn_str, query_leitura, config, decodificar=not (config.get("n_processos") or config.get("arquivo_cache")))
+                medida["registros"] = len(df)
+        else:
+            with pyodbc.connect(conn_str, timeout=300) as conn, metricas.medir("leitura") as medida:
+                df = pd.read_sql(query_leitura, conn)
+                medida["registros"], medida["bytes"] = len(df), bytes_wkb(df['geometry'])
         
+        if config.get("centroide") == "servidor" and df['geometry'].isna().any():
+            with pyodbc.connect(conn_str, timeout=300) as conn:
+                recuperar_centroides_nulos(conn, df, config, metricas)
         df.dropna(subset=['geometry'], inplace=True)
         
         print(f"   Leitura concluída. {len(df)} registros encontrados.")
-        if df.empty: return
+        if df.empty: return metricas.resumo()
 
-        gdf = gpd.GeoDataFrame(df, geometry=gpd.GeoSeries.from_wkb(df['geometry']), crs=config["epsg_origem"])
-        print("   GeoDataFrame criado com sucesso.")
+        # Cache de resultados ("arquivo_cache"): só as geometrias novas/alteradas seguem para o cálculo
+        cache = abrir_cache(config)
+        if cache is not None:
+            with metricas.medir("cache", len(df)):
+                acertos, df = cache.separar(df, config)
+            print(f"   Cache: {len(acertos)} registros reaproveitados, {len(df)} a calcular.")
 
-        # ETAPA 2: PROCESSAMENTO E CÁLCULO DO CENTROIDE
-        print("2. Calculando centroides no Geopandas...")
-        gdf['geometry'] = gdf.geometry.centroid
-        
-        registros_antes = len(gdf)
-        gdf = gdf[~gdf.geometry.is_empty]
-        registros_depois = len(gdf)
-        
-        if registros_antes > registros_depois:
-            print(f"   ATENÇÃO: {registros_antes - registros_depois} registros foram pulados porque não foi possível calcular um centroide válido.")
+        if df.empty:
+            gdf, pulados = df, 0
+        elif config.get("zonas"):
+            # ETAPAS 2 e 3 POR ZONA: cada grupo reprojetado com o seu EPSG de origem
+            print(f"2-3. Calculando centroides e reprojetando por zona ({df['zona'].value_counts().to_dict()})...")
+            gdf, pulados = calcular_latlon(df, config, metricas)
+        elif config.get("n_processos"):
+            # ETAPAS 2 e 3 EM PARALELO: partições do WKB processadas num pool de processos
+            print(f"2-3. Calculando centroides e reprojetando em {config['n_processos']} processos...")
+            gdf, pulados = calcular_latlon_paralelo(df, config, metricas)
+        else:
+            with metricas.medir("decodificacao_wkb", len(df)):
+                gdf = criar_geodataframe(df, config["epsg_origem"])
+            print("   GeoDataFrame criado com sucesso.")
 
-        # ETAPA 3: REPROJEÇÃO
-        print(f"3. Reprojetando {len(gdf)} centroides para Lat/Lon (EPSG:4674)...")
-        gdf_latlon = gdf.to_crs("EPSG:4674")
+            # ETAPA 2: PROCESSAMENTO E CÁLCULO DO CENTROIDE
+            print("2. Calculando centroides no Geopandas...")
+            with metricas.medir("centroide", len(gdf)):
+                gdf, pulados = calcular_centroides(gdf)
+
+            # ETAPA 3: REPROJEÇÃO
+            print(f"3. Reprojetando {len(gdf)} centroides para Lat/Lon (EPSG:4674)...")
+            with metricas.medir("reprojecao", len(gdf)):
+                gdf = reprojetar_centroides(gdf, config)
         
-        # --- A CORREÇÃO ESTÁ AQUI ---
-        gdf[config["coluna_lat"]] = gdf_latlon.geometry.y
-        gdf[config["coluna_lon"]] = gdf_latlon.geometry.x
+        if cache is not None:
+            gdf = cache.concluir(gdf, acertos, config)
+            print(f"   {cache.resumo()}")
+
+        if pulados:
+            print(f"   ATENÇÃO: {pulados} registros foram pulados porque não foi possível calcular um centroide válido.")
         print("   Reprojeção concluída!")
 
         # ETAPA 4: ATUALIZAÇÃO EM LOTE
         print(f"4. Atualizando {len(gdf)} registros no banco de dados...")
-        dados_para_atualizar = list(zip(
-            gdf[config["coluna_lat"]],
-            gdf[config["coluna_lon"]],
-            gdf['qgs_fid']
-        ))
-
-        update_query = f"UPDATE {nome_tabela} SET {config['coluna_lat']} = ?, {config['coluna_lon']} = ? WHERE qgs_fid = ?"
+        update_query = montar_update_query(nome_tabela, config)
         
         with pyodbc.connect(conn_str) as conn:
-            with conn.cursor() as cursor:
-                cursor.fast_executemany = True
-                cursor.executemany(update_query, dados_para_atualizar)
-                conn.commit()
+            estrategia, duracao = atualizar_registros(conn, update_query, gdf, config)
+        metricas.registrar("update", duracao, len(gdf), bytes_update(len(gdf), config))
+        print(f"   Update via {estrategia}: {len(gdf)} registros em {duracao:.2f} s ({taxa(len(gdf), duracao):.0f} registros/s).")
         
         print(f"   ✅ SUCESSO! A tabela '{nome_tabela}' foi atualizada.")
 
     except Exception as e:
+        metricas.erro = str(e)
         print(f"   ❌ ERRO: {e}")
     finally:
         end_time = time.time()
+        metricas.emitir()
         print(f"   Tempo de execução: {end_time - start_time:.2f} segundos.")
+    return metricas.resumo()
+
+# --- MODO EM LOTES (STREAMING) ---
+# Lê por paginação em qgs_fid (keyset), calcula e grava lote a lote.
+# O pico de memória passa a depender de "tamanho_lote", não do tamanho da tabela.
+def processar_zona_em_lotes(config):
+    nome_tabela = config["nome_tabela"]
+    coluna_geom = config["coluna_geom"]
+    tamanho_lote = int(config["tamanho_lote"])
+
+    print(f"\n--- INICIANDO PROCESSAMENTO EM LOTES DE {tamanho_lote} PARA: {nome_tabela} ---")
+    start_time = time.time()
+    # Métricas por etapa (JSON lines); "arquivo_metricas" na config também grava num arquivo
+    metricas = MetricasEtapas(nome_tabela, config.get("arquivo_metricas"))
+
+    coluna_zona = f", {expressao_zona_sql(config)} AS zona" if config.get("zonas") else ""
+    colunas_lote = ['qgs_fid', 'geometry'] + (['zona'] if coluna_zona else [])
+
+    query_lote = f"""
+        SELECT TOP ({tamanho_lote}) qgs_fid, {expressao_geometria_sql(config)} AS geometry{coluna_zona}
+        FROM {nome_tabela}
+        WHERE qgs_fid > ? AND {coluna_geom} IS NOT NULL AND {coluna_geom}.STIsEmpty() = 0
+        ORDER BY qgs_fid;
+    """
+    update_query = montar_update_query(nome_tabela, config)
+    cache = abrir_cache(config)
+
+    ultimo_fid = config.get("fid_inicial", -1)
+    total_lidos, total_atualizados, total_pulados, n_lote = 0, 0, 0, 0
+    tempo_update = 0.0
+
+    try:
+        with pyodbc.connect(conn_str, timeout=300) as conn:
+            while True:
+                with conn.cursor() as cursor, metricas.medir("leitura") as medida:
+                    cursor.execute(query_lote, ultimo_fid)
+                    linhas = cursor.fetchall()
+                    medida["registros"] = len(linhas)
+                    medida["bytes"] = sum(len(linha[1]) for linha in linhas if linha[1] is not None)
+                if not linhas:
+                    break
+
+                n_lote += 1
+                # O cursor de chave (keyset) avança pelo último qgs_fid lido, mesmo que o lote vire vazio após filtros
+                ultimo_fid = linhas[-1][0]
+                total_lidos += len(linhas)
+
+                df = pd.DataFrame.from_records(linhas, columns=colunas_lote)
+                del linhas
+                recuperar_centroides_nulos(conn, df, config, metricas)
+                df.dropna(subset=['geometry'], inplace=True)
+                if df.empty:
+                    continue
+
+                if cache is not None:
+                    with metricas.medir("cache", len(df)):
+                        acertos, df = cache.separar(df, config)
+                gdf, pulados = calcular_latlon(df, config, metricas) if not df.empty else (df, 0)
+                if cache is not None:
+                    gdf = cache.concluir(gdf, acertos, config)
+                total_pulados += pulados
+                if gdf.empty:
+                    continue
+
+                estrategia, duracao = atualizar_registros(conn, update_query, gdf, config)
+                total_atualizados += len(gdf)
+                tempo_update += duracao
+                metricas.registrar("update", duracao, len(gdf), bytes_update(len(gdf), config))
+
+                print(f"   Lote {n_lote}: {len(gdf)} registros atualizados (até qgs_fid {ultimo_fid}) - {taxa(len(gdf), duracao):.0f} registros/s via {estrategia}.")
+
+        if total_pulados:
+            print(f"   ATENÇÃO: {total_pulados} registros foram pulados porque não foi possível calcular um centroide válido.")
+        print(f"   ✅ SUCESSO! {total_atualizados} de {total_lidos} registros atualizados em {n_lote} lotes na tabela '{nome_tabela}'.")
+        print(f"   Update: {tempo_update:.2f} s no total ({taxa(total_atualizados, tempo_update):.0f} registros/s).")
+        if cache is not None:
+            print(f"   {cache.resumo()}")
+
+    except Exception as e:
+        metricas.erro = str(e)
+        print(f"   ❌ ERRO no lote {n_lote} (último qgs_fid {ultimo_fid}): {e}")
+    finally:
+        end_time = time.time()
+        metricas.emitir()
+        print(f"   Tempo de execução: {end_time - start_time:.2f} segundos.")
+    return metricas.resumo()
 
 # --- PONTO DE ENTRADA DO SCRIPT ---
 if __name__ == "__main__":
     
+    # Tabela com parcelas nas zonas 22S e 23S: uma única leitura, cada linha reprojetada pelo EPSG da sua zona
+    ZONAS_SP_CONFIG = { 
+        "nome_tabela": "[SCHEMA].[TbOrigem]",
+        "coluna_geom": "Campo_Geom",
+        "coluna_lat": "Campo_Latitude",
+        "coluna_lon": "Campo_Longitude",
+        "zonas": {31982: "EPSG:31982", 31983: "EPSG:31983"},  # SRID da geometria -> EPSG de origem
+        #"coluna_zona": "Campo_Zona",  # Se a zona estiver numa coluna, use {22: "EPSG:31982", 23: "EPSG:31983"}
+        #"tamanho_lote": 50000,  # Descomente para o modo em lotes (tabelas grandes)
+        #"n_processos": 8,        # Descomente para calcular centroides/reprojeção num pool de processos
+        #"estrategia_update": "staging",  # Tabela temporária + UPDATE ... FROM em vez de um UPDATE por linha
+        #"leitor": "arrow",       # Leitura colunar via arrow-odbc no modo completo (ver leitura_arrow.py)
+        #"comparar_leitores": True,  # Mede pd.read_sql x Arrow (tempo e memória) antes da leitura
+        #"centroide": "auto",      # "servidor" pede só o ponto ao banco (STCentroid); "auto" calibra numa amostra
+    }
+
+    # Configurações por zona, para tabelas que só têm uma zona
     ZONA_22S_CONFIG = { 
         "nome_tabela": "[SCHEMA].[TbOrigem]",
         "coluna_geom": "Campo_Geom",
         "coluna_lat": "Campo_Latitude",
         "coluna_lon": "Campo_Longitude",
-        "epsg_origem": "EPSG:31982"
+        "epsg_origem": "EPSG:31982",
     }
 
     ZONA_23S_CONFIG = { 
@@ -103,12 +374,11 @@ if __name__ == "__main__":
         "coluna_geom": "Campo_Geom",
         "coluna_lat": "Campo_Latitude",
         "coluna_lon": "Campo_Longitude",
-        "epsg_origem": "EPSG:31982"
+        "epsg_origem": "EPSG:31983"
     }
 
     print("Iniciando fluxo de atualização de coordenadas.")
     
-    processar_zona_com_geopandas(ZONA_22S_CONFIG)
-    processar_zona_com_geopandas(ZONA_23S_CONFIG)
+    processar_zona_com_geopandas(ZONAS_SP_CONFIG)
 
     print("Fluxo de atualização finalizado.")
@@ -6,9 +6,18 @@ import pendulum, requests, pyodbc
 from datetime import datetime, timedelta
 import geopandas as gpd
 import pandas as pd
+import json
 import time
+import queue
+import threading
+from contextlib import contextmanager
+from centroide_paralelo import calcular_latlon_paralelo
+from utm_latlon_numpy import latlon_do_epsg
+from metricas_centroide import MetricasEtapas, bytes_update, bytes_wkb
+from centroide_servidor import expressao_geometria_sql, calibrar_centroide, recuperar_centroides_nulos
+from cache_centroide import abrir_cache
 
-def get_corporativo_connection():
+def get_corporativo_conn_str():
     # --- CONFIGURAÇÔES ---
     #Sempre em string (erro visto em testes)
     conn = BaseHook.get_connection('Hml_DB_ID-DB')
@@ -21,88 +30,533 @@ def get_corporativo_connection():
         f"PORT={conn.port or '1234'};"
         f"TrustServerCertificate={conn.extra_dejson.get('TrustServerCertificate', 'yes')};"
     )
-    return pyodbc.connect(conn_str)  
+    return conn_str
+
+def get_corporativo_connection():
+    return pyodbc.connect(get_corporativo_conn_str())  
+
+# --- GERENCIADOR DE CONEXÕES ---
+# A string de conexão é montada uma vez a partir de 'Hml_DB_ID-DB' e as conexões abertas ficam num pool
+# pequeno, reaproveitadas entre as fases de leitura e escrita (e entre partições na mesma task).
+TAMANHO_POOL_CONEXOES = 2
+
+class PoolConexoes:
+    def __init__(self, conn_str, tamanho=TAMANHO_POOL_CONEXOES, timeout=300):
+        self.conn_str = conn_str
+        self.timeout = timeout
+        self.livres = queue.LifoQueue(maxsize=tamanho)
+        self.trava = threading.Lock()
+        # Métricas de abertura de conexão (login + TLS), separadas do tempo de leitura/escrita
+        self.conexoes_abertas = 0
+        self.tempo_conexao = 0.0
+
+    def abrir(self):
+        inicio = time.time()
+        conn = pyodbc.connect(self.conn_str, timeout=self.timeout)
+        with self.trava:
+            self.conexoes_abertas += 1
+            self.tempo_conexao += time.time() - inicio
+        return conn
+
+    def saudavel(self, conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1").fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def fechar(self, conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+    @contextmanager
+    def conexao(self):
+        conn = None
+        while conn is None:
+            try:
+                candidata = self.livres.get_nowait()
+            except queue.Empty:
+                conn = self.abrir()
+                break
+            if self.saudavel(candidata):
+                conn = candidata
+            else:
+                self.fechar(candidata)
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                pass
+            raise
+        finally:
+            try:
+                self.livres.put_nowait(conn)
+            except queue.Full:
+                self.fechar(conn)
+
+    def resumo(self):
+        return f"Conexões: {self.conexoes_abertas} abertas em {self.tempo_conexao:.2f} s"
+
+    def fechar_todas(self):
+        while True:
+            try:
+                self.fechar(self.livres.get_nowait())
+            except queue.Empty:
+                break
+
+_pool_conexoes = None
+
+def obter_pool_conexoes():
+    # Um pool por processo de task; a string de conexão só é montada na primeira chamada
+    global _pool_conexoes
+    if _pool_conexoes is None:
+        _pool_conexoes = PoolConexoes(get_corporativo_conn_str())
+    return _pool_conexoes
+
+# --- ETAPAS REUTILIZÁVEIS (modo completo e modo em lotes) ---
+def criar_geodataframe(df, epsg_origem):
+    # Com "leitor": "arrow" a coluna já chega decodificada (ver leitura_arrow.py)
+    if df['geometry'].dtype == 'geometry':
+        return gpd.GeoDataFrame(df, geometry='geometry', crs=epsg_origem)
+    return gpd.GeoDataFrame(df, geometry=gpd.GeoSeries.from_wkb(df['geometry']), crs=epsg_origem)
+
+def calcular_centroides(gdf):
+    # Retorna o GeoDataFrame só com centroides válidos e a quantidade de registros pulados
+    gdf['geometry'] = gdf.geometry.centroid
+    registros_antes = len(gdf)
+    gdf = gdf[~gdf.geometry.is_empty]
+    return gdf, registros_antes - len(gdf)
+
+def reprojetar_centroides(gdf, config):
+    # "motor_reprojecao": "pyproj" (padrão), "numpy", "numpy_tsql", "grade" ou "grade_tsql" (ver utm_latlon_numpy.py)
+    motor = config.get("motor_reprojecao", "pyproj")
+    if motor == "pyproj":
+        gdf_latlon = gdf.to_crs("EPSG:4674")
+        gdf[config["coluna_lat"]] = gdf_latlon.geometry.y
+        gdf[config["coluna_lon"]] = gdf_latlon.geometry.x
+    else:
+        lat, lon = latlon_do_epsg(gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy(), config["epsg_origem"], motor)
+        gdf[config["coluna_lat"]] = lat
+        gdf[config["coluna_lon"]] = lon
+    return gdf
+
+# --- MODO MULTIZONA (PASSAGEM ÚNICA) ---
+# "zonas": {valor da zona: EPSG de origem}. O valor vem de "coluna_zona" ou, sem ela, do SRID da geometria
+#   (ex.: {22: "EPSG:31982", 23: "EPSG:31983"} com coluna de zona, {31982: "EPSG:31982", ...} com SRID).
+# Em UTM as mesmas coordenadas X/Y são válidas nas duas zonas, então a zona precisa vir do dado (coluna ou SRID).
+def expressao_zona_sql(config):
+    return config.get("coluna_zona") or f"{config['coluna_geom']}.STSrid"
+
+def calcular_latlon_multizona(df, config, metricas=None):
+    # Agrupa as linhas pela zona, reprojeta cada grupo com o EPSG correto e remonta em ordem de qgs_fid
+    # Linhas sem zona ou com zona fora de "zonas" são avisadas à parte e não entram em "pulados" (centroide inválido)
+    config_zona = {k: v for k, v in config.items() if k != "zonas"}
+    resultados, pulados = [], 0
+    sem_zona = int(df['zona'].isna().sum())
+    if sem_zona:
+        print(f"   ATENÇÃO: {sem_zona} registros sem zona foram pulados.")
+    for valor_zona, grupo in df.groupby('zona', sort=True):
+        epsg_origem = config["zonas"].get(valor_zona)
+        if epsg_origem is None:
+            print(f"   ATENÇÃO: {len(grupo)} registros com zona '{valor_zona}' sem EPSG configurado foram pulados.")
+            continue
+        gdf, pulados_zona = calcular_latlon(grupo.drop(columns='zona'), {**config_zona, "epsg_origem": epsg_origem}, metricas)
+        resultados.append(pd.DataFrame(gdf.drop(columns='geometry')))
+        pulados += pulados_zona
+    if not resultados:
+        return pd.DataFrame(columns=df.columns.drop(['geometry', 'zona'])), pulados
+    return pd.concat(resultados).sort_values('qgs_fid', kind='stable'), pulados
+
+def calcular_latlon(df, config, metricas=None):
+    # Etapas 2 e 3 juntas: por zona ("zonas"), num pool de processos ("n_processos") ou em série (GeoPandas)
+    metricas = metricas if metricas is not None else MetricasEtapas()
+    if config.get("zonas"):
+        return calcular_latlon_multizona(df, config, metricas)
+    if config.get("n_processos"):
+        return calcular_latlon_paralelo(df, config, metricas)
+    with metricas.medir("decodificacao_wkb", len(df)):
+        gdf = criar_geodataframe(df, config["epsg_origem"])
+    with metricas.medir("centroide", len(gdf)):
+        gdf, pulados = calcular_centroides(gdf)
+    with metricas.medir("reprojecao", len(gdf)):
+        gdf = reprojetar_centroides(gdf, config)
+    return gdf, pulados
+
+# --- ESTRATÉGIAS DE ATUALIZAÇÃO ---
+# "estrategia_update": "executemany" (padrão, um UPDATE ... WHERE qgs_fid = ? por linha)
+#                      "staging" (carga em lote numa tabela temporária + um único UPDATE ... FROM com JOIN)
+# "tamanho_lote_staging": linhas por executemany no INSERT da tabela temporária (padrão 100000)
+def atualizar_via_staging(conn, gdf, config):
+    colunas_extra = [(config["coluna_hash"], "hash_geom", "VARBINARY(32)")] if config.get("coluna_hash") else []
+    colunas_stage = [(config["coluna_lat"], "lat", "FLOAT"), (config["coluna_lon"], "lon", "FLOAT")] + colunas_extra
+    tamanho = int(config.get("tamanho_lote_staging", 100000))
+
+    definicao = ", ".join(f"{nome} {tipo} NULL" for _, nome, tipo in colunas_stage)
+    insert_query = (f"INSERT INTO #centroide_staging (qgs_fid, {', '.join(n for _, n, _ in colunas_stage)}) "
+                    f"VALUES (?{', ?' * len(colunas_stage)})")
+    update_query = f"""
+        UPDATE t SET {', '.join(f't.{destino} = s.{nome}' for destino, nome, _ in colunas_stage)}
+        FROM {config['nome_tabela']} AS t
+        INNER JOIN #centroide_staging AS s ON t.qgs_fid = s.qgs_fid
+    """
+    dados = list(zip(gdf['qgs_fid'], *(gdf[origem] for origem in
+                                        [config["coluna_lat"], config["coluna_lon"]] + (['hash_geom'] if colunas_extra else []))))
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            IF OBJECT_ID('tempdb..#centroide_staging') IS NOT NULL DROP TABLE #centroide_staging;
+            CREATE TABLE #centroide_staging (qgs_fid BIGINT NOT NULL PRIMARY KEY, {definicao});
+        """)
+        cursor.fast_executemany = True
+        for inicio in range(0, len(dados), tamanho):
+            cursor.executemany(insert_query, dados[inicio:inicio + tamanho])
+        cursor.execute(update_query)
+        cursor.execute("DROP TABLE #centroide_staging;")
+    conn.commit()
+
+def atualizar_registros(conn, update_query, gdf, config):
+    # Retorna (estratégia usada, segundos) para o relatório de registros/s
+    estrategia = config.get("estrategia_update", "executemany")
+    inicio = time.time()
+    if estrategia == "staging":
+        atualizar_via_staging(conn, gdf, config)
+    else:
+        colunas = [gdf[config["coluna_lat"]], gdf[config["coluna_lon"]]]
+        if config.get("coluna_hash"):
+            colunas.append(gdf['hash_geom'])
+        dados_para_atualizar = list(zip(*colunas, gdf['qgs_fid']))
+        with conn.cursor() as cursor:
+            cursor.fast_executemany = True
+            cursor.executemany(update_query, dados_para_atualizar)
+        conn.commit()
+    return estrategia, time.time() - inicio
+
+def taxa(registros, segundos):
+    return registros / segundos if segundos > 0 else 0.0
+
+def montar_update_query(nome_tabela, config):
+    set_hash = f", {config['coluna_hash']} = ?" if config.get("coluna_hash") else ""
+    return f"""
+            UPDATE {nome_tabela} 
+            SET {config['coluna_lat']} = ?, {config['coluna_lon']} = ?{set_hash} 
+            WHERE qgs_fid = ?
+         """
+
+# --- MODO INCREMENTAL (DELTA) ---
+# "coluna_hash": coluna VARBINARY(32) na tabela de origem que guarda o hash (SHA2_256) do EPSG de origem + WKB
+#   usado no último cálculo. Só entram linhas com hash diferente/nulo ou lat/lon nulos.
+#   DDL: ALTER TABLE [SCHEMA].[tbOrigem] ADD CampoGeomHash VARBINARY(32) NULL;
+# "coluna_versao" (opcional): coluna ROWVERSION. Limita a varredura às linhas alteradas desde a última
+#   execução bem-sucedida; a marca d'água fica numa Variable do Airflow.
+def expressao_hash_geom(config):
+    # No modo multizona a origem de cada linha é a própria zona/SRID, não um EPSG fixo
+    if config.get("zonas"):
+        origem = f"CAST(CAST({expressao_zona_sql(config)} AS VARCHAR(16)) AS VARBINARY(32))"
+    else:
+        origem = f"CAST('{config['epsg_origem']}' AS VARBINARY(32))"
+    return f"HASHBYTES('SHA2_256', {origem} + {config['coluna_geom']}.STAsBinary())"
+
+def chave_watermark(config):
+    return f"centroide_rowversion_{config['nome_tabela']}_{config.get('epsg_origem', 'multizona')}"
+
+def ler_watermark(conn, config):
+    # Retorna (marca_anterior, marca_atual) como BIGINT; a atual é o maior rowversion já confirmado no banco
+    if not (config.get("coluna_hash") and config.get("coluna_versao")):
+        return None, None
+    anterior = int(Variable.get(chave_watermark(config), default_var=0))
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1")
+        atual = cursor.fetchone()[0]
+    return anterior, atual
+
+def montar_filtro_incremental(config, marca_anterior, marca_atual):
+    # Retorna (colunas extras do SELECT, filtro extra do WHERE, parâmetros do filtro)
+    if not config.get("coluna_hash"):
+        return "", "", []
+    hash_atual = expressao_hash_geom(config)
+    colunas = f", {hash_atual} AS hash_geom"
+    filtro = f"""
+        AND {config['coluna_geom']} IS NOT NULL
+        AND ({config['coluna_hash']} IS NULL OR {config['coluna_hash']} <> {hash_atual}
+             OR {config['coluna_lat']} IS NULL OR {config['coluna_lon']} IS NULL)"""
+    parametros = []
+    if marca_atual is not None:
+        filtro += f"""
+        AND {config['coluna_versao']} > CAST(? AS BINARY(8)) AND {config['coluna_versao']} <= CAST(? AS BINARY(8))"""
+        parametros = [marca_anterior, marca_atual]
+    return colunas, filtro, parametros
+
+# --- PARTICIONAMENTO POR FAIXA DE qgs_fid (FAN-OUT NO AIRFLOW) ---
+# NTILE divide as linhas com geometria em faixas com o mesmo número de registros (não o mesmo intervalo de qgs_fid).
+# As faixas são contíguas: cada uma começa onde a anterior terminou e a última fica aberta,
+# então linhas inseridas depois do particionamento também são processadas.
+def calcular_faixas_fid(conn, config, n_faixas):
+    query = f"""
+        SELECT MAX(qgs_fid), COUNT(*)
+        FROM (
+            SELECT qgs_fid, NTILE({int(n_faixas)}) OVER (ORDER BY qgs_fid) AS faixa
+            FROM {config['nome_tabela']}
+            WHERE {config['coluna_geom']} IS NOT NULL
+        ) AS f
+        GROUP BY faixa
+        ORDER BY faixa"""
+    with conn.cursor() as cursor:
+        cursor.execute(query)
+        linhas = cursor.fetchall()
+    faixas, inicio = [], config.get("fid_inicial", -1)
+    for n, (fid_final, registros) in enumerate(linhas, start=1):
+        faixas.append({"fid_inicial": inicio, "fid_final": fid_final if n < len(linhas) else None, "registros": registros})
+        inicio = fid_final
+    return faixas
+
+def resumir_faixas(resumos):
+    # Soma por etapa os resumos (XCom) de cada faixa; segundos_total é o da faixa mais lenta
+    total = {"faixas": len(resumos), "segundos_total": 0.0, "pico_rss_mb": 0.0, "erros": [], "etapas": {}}
+    for resumo in resumos:
+        total["segundos_total"] = max(total["segundos_total"], resumo["segundos_total"])
+        total["pico_rss_mb"] = max(total["pico_rss_mb"], resumo["pico_rss_mb"] or 0.0)
+        if resumo["erro"]:
+            total["erros"].append({"faixa": resumo.get("faixa"), "erro": resumo["erro"]})
+        for etapa, e in resumo["etapas"].items():
+            soma = total["etapas"].setdefault(etapa, {"segundos": 0.0, "registros": 0, "bytes": 0, "chamadas": 0})
+            for campo in soma:
+                soma[campo] += e[campo]
+    for e in total["etapas"].values():
+        e["registros_por_s"] = round(e["registros"] / e["segundos"], 1) if e["segundos"] > 0 else None
+    return total
 
 # --- FUNÇÃO ---
 def processar_zona_com_geopandas(config):
+    # "centroide": "auto" mede cliente x servidor numa amostra antes de começar (ver centroide_servidor.py)
+    if config.get("centroide") == "auto":
+        with obter_pool_conexoes().conexao() as conn:
+            config = {**config, "centroide": calibrar_centroide(conn, config)}
 
-    conn_str = get_corporativo_connection()
+    # Se "tamanho_lote" estiver na config, usa o modo em lotes (memória limitada ao lote)
+    # O modo incremental ("coluna_hash") também roda pelo caminho em lotes
+    if config.get("tamanho_lote") or config.get("coluna_hash"):
+        return processar_zona_em_lotes(config)
+
+    pool = obter_pool_conexoes()
+    tempo_conexao_inicial, conexoes_iniciais = pool.tempo_conexao, pool.conexoes_abertas
 
     nome_tabela = config["nome_tabela"]
     coluna_geom = config["coluna_geom"]
+    coluna_zona = f", {expressao_zona_sql(config)} AS zona" if config.get("zonas") else ""
     
     print(f"\n--- INICIANDO PROCESSAMENTO COM LÓGICA NO GEOPANDAS PARA: {nome_tabela} ---")
     start_time = time.time()
+    # Métricas por etapa (JSON lines); "arquivo_metricas" na config também grava num arquivo
+    metricas = MetricasEtapas(nome_tabela, config.get("arquivo_metricas"))
     
     try:
         # ETAPA 1: LEITURA DOS DADOS BRUTOS
         query_leitura = f"""
-            SELECT qgs_fid, {coluna_geom}.STAsBinary() AS geometry
+            SELECT qgs_fid, {expressao_geometria_sql(config)} AS geometry{coluna_zona}
             FROM {nome_tabela}"""
         
         print("1. Lendo geometrias MS SQL Server...")
         
-        with pyodbc.connect(conn_str, timeout=300) as conn:
-            df = pd.read_sql(query_leitura, conn)
+        if config.get("comparar_leitores"):
+            # Medição à parte (processos novos): pd.read_sql x Arrow na mesma consulta, ver leitura_arrow.py
+            from leitura_arrow import comparar_leitores
+            comparar_leitores(get_corporativo_conn_str(), query_leitura, config, metricas)
+
+        if config.get("leitor") == "arrow":
+            # Leitura colunar em lotes (arrow-odbc, dependência opcional); conexão própria, fora do pool
+            from leitura_arrow import ler_geometrias_arrow
+            with metricas.medir("leitura") as medida:
+                df, medida["bytes"] = ler_geometrias_arrow(get_corporativo_conn_str(), query_leitura, config, decodificar=not (config.get("n_processos") or config.get("arquivo_cache")))
+                medida["registros"] = len(df)
+        else:
+            with pool.conexao() as conn, metricas.medir("leitura") as medida:
+                df = pd.read_sql(query_leitura, conn)
+                medida["registros"], medida["bytes"] = len(df), bytes_wkb(df['geometry'])
         
+        if config.get("centroide") == "servidor" and df['geometry'].isna().any():
+            with pool.conexao() as conn:
+                recuperar_centroides_nulos(conn, df, config, metricas)
         # Filtra qualquer linha que o STAsBinary() não conseguiu processar (raro, mas seguro)
         df.dropna(subset=['geometry'], inplace=True)
         
         print(f"Leitura concluída. {len(df)} registros encontrados.")
         if df.empty:
             print("Nenhum dado para processar.")
-            return
-
-        gdf = gpd.GeoDataFrame(df, geometry=gpd.GeoSeries.from_wkb(df['geometry']), crs=config["epsg_origem"])
-        print("GeoDataFrame criado com sucesso.")
-
-        # ETAPA 2: PROCESSAMENTO E CÁLCULO DO CENTROIDE (Removi o cálculo do banco)
-        print("2. Calculando centroides no Geopandas...")
-        gdf['geometry'] = gdf.geometry.centroid
-               
-        # Filtro: remove geometrias que resultaram em centroides vazios
-        registros_antes_filtro = len(gdf)
-        gdf = gdf[~gdf.geometry.is_empty]
-        registros_depois_filtro = len(gdf)
-        
-        if registros_antes_filtro > registros_depois_filtro:
-            print(f"ATENÇÃO: {registros_antes_filtro - registros_depois_filtro} registros foram pulados porque não foi possível calcular um centroide.")
+            return metricas.resumo()
 
-        #Reprojeção em si
-        print("3. Reprojetando os centroides para Lat/Lon EPSG:4674...")
-        gdf_latlon = gdf.to_crs("EPSG:4674")
+        # Cache de resultados ("arquivo_cache"): só as geometrias novas/alteradas seguem para o cálculo
+        cache = abrir_cache(config)
+        if cache is not None:
+            with metricas.medir("cache", len(df)):
+                acertos, df = cache.separar(df, config)
+            print(f"Cache: {len(acertos)} registros reaproveitados, {len(df)} a calcular.")
+
+        if df.empty:
+            gdf, pulados = df, 0
+        elif config.get("zonas"):
+            # ETAPAS 2 e 3 POR ZONA: cada grupo reprojetado com o seu EPSG de origem
+            print(f"2-3. Calculando centroides e reprojetando por zona ({df['zona'].value_counts().to_dict()})...")
+            gdf, pulados = calcular_latlon(df, config, metricas)
+        elif config.get("n_processos"):
+            # ETAPAS 2 e 3 EM PARALELO: partições do WKB processadas num pool de processos
+            print(f"2-3. Calculando centroides e reprojetando em {config['n_processos']} processos...")
+            gdf, pulados = calcular_latlon_paralelo(df, config, metricas)
+        else:
+            with metricas.medir("decodificacao_wkb", len(df)):
+                gdf = criar_geodataframe(df, config["epsg_origem"])
+            print("GeoDataFrame criado com sucesso.")
+
+            # ETAPA 2: PROCESSAMENTO E CÁLCULO DO CENTROIDE (no banco só com "centroide": "servidor")
+            print("2. Calculando centroides no Geopandas...")
+            # Filtro: remove geometrias que resultaram em centroides vazios
+            with metricas.medir("centroide", len(gdf)):
+                gdf, pulados = calcular_centroides(gdf)
+
+            #Reprojeção em si
+            print("3. Reprojetando os centroides para Lat/Lon EPSG:4674...")
+            with metricas.medir("reprojecao", len(gdf)):
+                gdf = reprojetar_centroides(gdf, config)
         
-        gdf[config["coluna_lat"]] = gdf_latlon.geometry.y
-        gdf[config["coluna_lon"]] = gdf_latlon.geometry.x
+        if cache is not None:
+            gdf = cache.concluir(gdf, acertos, config)
+            print(cache.resumo())
+
+        if pulados:
+            print(f"ATENÇÃO: {pulados} registros foram pulados porque não foi possível calcular um centroide.")
         print("   Processamento concluído!")
 
         # ETAPA 4: ATUALIZAÇÃO EM LOTE
         print(f"4. Atualizando {len(gdf)} registros no banco de dados...")
-        dados_para_atualizar = list(zip(
-            gdf[config["coluna_lat"]],
-            gdf[config["coluna_lon"]],
-            gdf['qgs_fid']
-        ))
-
-        update_query = f"""
-            UPDATE {nome_tabela} 
-            SET {config['coluna_lat']} = ?, {config['coluna_lon']} = ? 
-            WHERE qgs_fid = ?
-         """
+        update_query = montar_update_query(nome_tabela, config)
         
-        with pyodbc.connect(conn_str) as conn:
-            with conn.cursor() as cursor:
-                cursor.fast_executemany = True
-                cursor.executemany(update_query, dados_para_atualizar)
-                conn.commit()
+        with pool.conexao() as conn:
+            estrategia, duracao = atualizar_registros(conn, update_query, gdf, config)
+        metricas.registrar("update", duracao, len(gdf), bytes_update(len(gdf), config))
+        print(f"   Update via {estrategia}: {len(gdf)} registros em {duracao:.2f} s ({taxa(len(gdf), duracao):.0f} registros/s).")
         
         print(f"A tabela '{nome_tabela}' foi atualizada!")
 
     except Exception as e:
+        metricas.erro = str(e)
         print(f"ERRO: {e}")
     finally:
         end_time = time.time()
+        metricas.registrar("conexao", pool.tempo_conexao - tempo_conexao_inicial, pool.conexoes_abertas - conexoes_iniciais)
+        metricas.emitir()
+        print(pool.resumo())
+        print(f"Tempo de execução: {end_time - start_time:.2f} segundos.")
+    return metricas.resumo()
+
+# --- MODO EM LOTES (STREAMING) ---
+# Lê por paginação em qgs_fid (keyset), calcula e grava lote a lote.
+# O pico de memória passa a depender de "tamanho_lote", não do tamanho da tabela.
+def processar_zona_em_lotes(config):
+    pool = obter_pool_conexoes()
+    tempo_conexao_inicial, conexoes_iniciais = pool.tempo_conexao, pool.conexoes_abertas
+
+    nome_tabela = config["nome_tabela"]
+    coluna_geom = config["coluna_geom"]
+    tamanho_lote = int(config.get("tamanho_lote", 50000))
+    incremental = bool(config.get("coluna_hash"))
+    coluna_zona = f", {expressao_zona_sql(config)} AS zona" if config.get("zonas") else ""
+
+    modo = "INCREMENTAL " if incremental else ""
+    print(f"\n--- INICIANDO PROCESSAMENTO {modo}EM LOTES DE {tamanho_lote} PARA: {nome_tabela} ---")
+    start_time = time.time()
+    # Métricas por etapa (JSON lines); "arquivo_metricas" na config também grava num arquivo
+    metricas = MetricasEtapas(nome_tabela, config.get("arquivo_metricas"))
+
+    update_query = montar_update_query(nome_tabela, config)
+    cache = abrir_cache(config)
+
+    ultimo_fid = config.get("fid_inicial", -1)
+    total_lidos, total_atualizados, total_pulados, n_lote = 0, 0, 0, 0
+    tempo_update = 0.0
+
+    try:
+        with pool.conexao() as conn:
+            # No fan-out por faixas a marca d'água é lida uma vez (calcular_particoes) e gravada no resumo
+            faixa = "marca_dagua" in config
+            marca_anterior, marca_atual = config["marca_dagua"] if faixa else ler_watermark(conn, config)
+            colunas_extras, filtro_extra, parametros_filtro = montar_filtro_incremental(config, marca_anterior, marca_atual)
+            if config.get("fid_final") is not None:
+                filtro_extra += "\n                AND qgs_fid <= ?"
+                parametros_filtro = parametros_filtro + [config["fid_final"]]
+            if marca_atual is not None:
+                print(f"Marca d'água rowversion: {marca_anterior} -> {marca_atual}")
+
+            query_lote = f"""
+                SELECT TOP ({tamanho_lote}) qgs_fid, {expressao_geometria_sql(config)} AS geometry{coluna_zona}{colunas_extras}
+                FROM {nome_tabela}
+                WHERE qgs_fid > ?{filtro_extra}
+                ORDER BY qgs_fid;
+            """
+            colunas_lote = ['qgs_fid', 'geometry'] + (['zona'] if coluna_zona else []) + (['hash_geom'] if incremental else [])
+
+            while True:
+                with conn.cursor() as cursor, metricas.medir("leitura") as medida:
+                    cursor.execute(query_lote, ultimo_fid, *parametros_filtro)
+                    linhas = cursor.fetchall()
+                    medida["registros"] = len(linhas)
+                    medida["bytes"] = sum(len(linha[1]) for linha in linhas if linha[1] is not None)
+                if not linhas:
+                    break
+
+                n_lote += 1
+                # A chave avança pelo último qgs_fid lido, mesmo que o lote fique vazio após os filtros
+                ultimo_fid = linhas[-1][0]
+                total_lidos += len(linhas)
+
+                df = pd.DataFrame.from_records(linhas, columns=colunas_lote)
+                del linhas
+                recuperar_centroides_nulos(conn, df, config, metricas)
+                df.dropna(subset=['geometry'], inplace=True)
+                if df.empty:
+                    continue
+
+                if cache is not None:
+                    with metricas.medir("cache", len(df)):
+                        acertos, df = cache.separar(df, config)
+                gdf, pulados = calcular_latlon(df, config, metricas) if not df.empty else (df, 0)
+                if cache is not None:
+                    gdf = cache.concluir(gdf, acertos, config)
+                total_pulados += pulados
+                if gdf.empty:
+                    continue
+
+                estrategia, duracao = atualizar_registros(conn, update_query, gdf, config)
+                total_atualizados += len(gdf)
+                tempo_update += duracao
+                metricas.registrar("update", duracao, len(gdf), bytes_update(len(gdf), config))
+
+                print(f"Lote {n_lote}: {len(gdf)} registros atualizados (até qgs_fid {ultimo_fid}) - {taxa(len(gdf), duracao):.0f} registros/s via {estrategia}.")
+
+            # Só avança a marca d'água depois que todos os lotes foram gravados
+            if marca_atual is not None and not faixa:
+                Variable.set(chave_watermark(config), str(marca_atual))
+
+        if total_pulados:
+            print(f"ATENÇÃO: {total_pulados} registros foram pulados porque não foi possível calcular um centroide.")
+        print(f"A tabela '{nome_tabela}' foi atualizada! {total_atualizados} de {total_lidos} registros em {n_lote} lotes.")
+        print(f"Update: {tempo_update:.2f} s no total ({taxa(total_atualizados, tempo_update):.0f} registros/s).")
+        if cache is not None:
+            print(cache.resumo())
+
+    except Exception as e:
+        metricas.erro = str(e)
+        print(f"ERRO no lote {n_lote} (último qgs_fid {ultimo_fid}): {e}")
+    finally:
+        end_time = time.time()
+        metricas.registrar("conexao", pool.tempo_conexao - tempo_conexao_inicial, pool.conexoes_abertas - conexoes_iniciais)
+        metricas.emitir()
+        print(pool.resumo())
         print(f"Tempo de execução: {end_time - start_time:.2f} segundos.")
+    return metricas.resumo()
 
 # --- PONTO DE ENTRADA DO SCRIPT ---
 # if __name__ == "__main__":
@@ -125,33 +579,78 @@ with DAG(
       catchup=False,
       tags=['geopandas', 'geoprocessamento', 'etl'],
 ) as dag:
-    def processar_zona_22s():
-        config = {
-            "nome_tabela": "[SCHEMA].[tbOrigem]",
-            "coluna_geom": "Campo_Geom",
-            "coluna_lat": "CampoLat",
-            "coluna_lon": "CampoLon",
-            "epsg_origem": "EPSG:31982"
-        }
-        processar_zona_com_geopandas(config)
-
-    def processar_zona_23s():
-        config = {
-            "nome_tabela": "[SCHEMA].[tbOrigem]",
-            "coluna_geom": "Campo_Geom",
-            "coluna_lat": "CampoLat",
-            "coluna_lon": "CampoLon",
-            "epsg_origem": "EPSG:31983"
-        }
-        processar_zona_com_geopandas(config)
-    
-    task_zona_22s = PythonOperator(
-        task_id='processar_zona_22s',
-        python_callable=processar_zona_22s
+    # Passagem única por linha: zonas 22S e 23S na mesma tabela, dividida em faixas de qgs_fid processadas em paralelo
+    CONFIG_CENTROIDE = {
+        "nome_tabela": "[SCHEMA].[tbOrigem]",
+        "coluna_geom": "Campo_Geom",
+        "coluna_lat": "CampoLat",
+        "coluna_lon": "CampoLon",
+        "zonas": {31982: "EPSG:31982", 31983: "EPSG:31983"},  # SRID da geometria -> EPSG de origem
+        #"coluna_zona": "CampoZona",  # Com coluna de zona, use {22: "EPSG:31982", 23: "EPSG:31983"}
+        "tamanho_lote": 50000,
+        "n_processos": 4,  # por faixa: várias faixas podem cair no mesmo worker
+        "estrategia_update": "staging",  # ou "executemany" (um UPDATE por linha)
+        #"centroide": "auto",  # "servidor" pede só o ponto ao banco (STCentroid); "auto" calibra numa amostra
+        # Modo incremental: descomente após criar as colunas na tabela de origem
+        #"coluna_hash": "CampoGeomHash",
+        #"coluna_versao": "CampoRowVersion"
+    }
+    N_FAIXAS = 8
+    MAX_FAIXAS_PARALELAS = 4
+    POOL_AIRFLOW = "centroide_pool"  # criar em Admin > Pools; os slots limitam as faixas no cluster todo
+
+    def calcular_particoes():
+        # Faixas de qgs_fid + tudo que precisa ser decidido uma vez só (marca d'água, modo do centroide)
+        config = CONFIG_CENTROIDE
+        with obter_pool_conexoes().conexao() as conn:
+            faixas = calcular_faixas_fid(conn, config, N_FAIXAS)
+            marca_dagua = list(ler_watermark(conn, config))
+            centroide = calibrar_centroide(conn, config) if config.get("centroide") == "auto" else config.get("centroide", "cliente")
+        for n, faixa in enumerate(faixas, start=1):
+            print(f"Faixa {n}: qgs_fid > {faixa['fid_inicial']} até {faixa['fid_final'] or 'o fim'} ({faixa['registros']} registros)")
+        return [{"faixa": {**faixa, "marca_dagua": marca_dagua, "centroide": centroide}} for faixa in faixas]
+
+    def processar_faixa(faixa):
+        config = {**CONFIG_CENTROIDE, **{k: v for k, v in faixa.items() if k != "registros"}}
+        resumo = processar_zona_em_lotes(config)
+        resumo["faixa"] = [faixa["fid_inicial"], faixa["fid_final"]]
+        resumo["marca_dagua"] = faixa["marca_dagua"]
+        if resumo["erro"]:
+            # A task da faixa falha (e o "retries" do DAG refaz só esta faixa) em vez de terminar como sucesso
+            raise RuntimeError(f"Faixa {resumo['faixa']} falhou: {resumo['erro']}")
+        # O resumo das métricas vai para o XCom (return_value) e é somado em resumir_execucao
+        return resumo
+
+    def resumir_execucao(faixas, resumos):
+        # Faixa que falhou (erro no processamento, timeout, worker perdido) não deixa resumo no XCom
+        resumos = [resumo for resumo in resumos if resumo]
+        total = resumir_faixas(resumos)
+        print(json.dumps(total, ensure_ascii=False, indent=2))
+        if total["erros"] or len(resumos) < len(faixas):
+            raise RuntimeError(f"{len(faixas) - len(resumos) + len(total['erros'])} de {len(faixas)} faixas falharam: {total['erros']}")
+        # Modo incremental: a marca d'água só avança quando todas as faixas terminaram sem erro
+        marca_atual = resumos[0]["marca_dagua"][1] if resumos else None
+        if marca_atual is not None:
+            Variable.set(chave_watermark(CONFIG_CENTROIDE), str(marca_atual))
+        return total
+
+    task_calcular_particoes = PythonOperator(
+        task_id='calcular_particoes',
+        python_callable=calcular_particoes
     )
 
-    task_zona_23s = PythonOperator(
-        task_id='processar_zona_23s',
-        python_callable=processar_zona_23s
+    task_processar_faixa = PythonOperator.partial(
+        task_id='processar_faixa',
+        python_callable=processar_faixa,
+        pool=POOL_AIRFLOW,
+        max_active_tis_per_dag=MAX_FAIXAS_PARALELAS,
+    ).expand(op_kwargs=task_calcular_particoes.output)
+
+    task_resumir_execucao = PythonOperator(
+        task_id='resumir_execucao',
+        python_callable=resumir_execucao,
+        op_kwargs={"faixas": task_calcular_particoes.output, "resumos": task_processar_faixa.output},
+        trigger_rule='all_done',  # resume (e falha) mesmo que alguma faixa tenha estourado o timeout
     )
-    task_zona_22s >> task_zona_23s
+
+    task_calcular_particoes >> task_processar_faixa >> task_resumir_execucao
@@ -0,0 +1,199 @@
+#Matheus Dias de Aviz
+#Manutenção da tabela materializada de centroides (T-SQL/Tb_Centroide_LatLon.sql)
+#"reconstruir": recalcula a tabela inteira em lotes | "incremental": só as linhas com geometria alterada (Change Tracking)
+#Centroide no banco (MakeValid().STCentroid(), igual à view antiga); reprojeção com utm_latlon_numpy "numpy_tsql",
+#que devolve o mesmo resultado de fn_UTMtoLatLon_aux
+import numpy as np
+import pyodbc
+import time
+from utm_latlon_numpy import latlon_do_epsg
+
+# --- CONFIGURAÇÃO DA CONEXÃO ---
+conn_str = (
+    r'DRIVER={ODBC Driver 17 for SQL Server};'
+    r'SERVER=end_servidor;'
+    r'DATABASE=id_banco;'
+    r'Trusted_Connection=yes;'
+    #r'UID=id_user;'
+    #r'PWD=id_senha;'
+)
+
+# --- CHANGE TRACKING ---
+def versao_atual(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()")
+        return cursor.fetchone()[0]
+
+def ultima_versao_sincronizada(conn, config):
+    # Retorna a última versão aplicada, ou None se nunca sincronizou / se o histórico já foi limpo
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT UltimaVersao FROM {config['tabela_controle']} WHERE TabelaOrigem = ?", config["tabela_origem"])
+        linha = cursor.fetchone()
+        if linha is None:
+            return None
+        cursor.execute("SELECT CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID(?))", config["tabela_origem"])
+        minima = cursor.fetchone()[0]
+    if minima is None or linha[0] < minima:
+        return None
+    return linha[0]
+
+def gravar_versao(conn, config, versao):
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            MERGE {config['tabela_controle']} AS c
+            USING (SELECT ? AS TabelaOrigem, ? AS UltimaVersao) AS s ON c.TabelaOrigem = s.TabelaOrigem
+            WHEN MATCHED THEN UPDATE SET UltimaVersao = s.UltimaVersao, DataAtualizacao = SYSDATETIME()
+            WHEN NOT MATCHED THEN INSERT (TabelaOrigem, UltimaVersao) VALUES (s.TabelaOrigem, s.UltimaVersao);
+        """, config["tabela_origem"], versao)
+
+def carregar_ids_alterados(conn, config, versao_anterior):
+    # Guarda em #centroide_ids os qgs_fid inseridos/excluídos ou com a geometria (ou IDTERRENO) alterada
+    origem = config["tabela_origem"]
+    mascara = " OR ".join(
+        f"CHANGE_TRACKING_IS_COLUMN_IN_MASK(COLUMNPROPERTY(OBJECT_ID('{origem}'), '{coluna}', 'ColumnId'), ct.SYS_CHANGE_COLUMNS) = 1"
+        for coluna in (config["coluna_geom"], config["coluna_id"])
+    )
+    with conn.cursor() as cursor:
+        cursor.execute("IF OBJECT_ID('tempdb..#centroide_ids') IS NOT NULL DROP TABLE #centroide_ids;")
+        cursor.execute("CREATE TABLE #centroide_ids (qgs_fid INT PRIMARY KEY);")
+        cursor.execute(f"""
+            INSERT INTO #centroide_ids (qgs_fid)
+            SELECT ct.qgs_fid
+            FROM CHANGETABLE(CHANGES {origem}, ?) AS ct
+            WHERE ct.SYS_CHANGE_OPERATION <> 'U' OR ct.SYS_CHANGE_COLUMNS IS NULL OR {mascara};
+        """, versao_anterior)
+        cursor.execute("SELECT COUNT(*) FROM #centroide_ids")
+        return cursor.fetchone()[0]
+
+# --- CÁLCULO E GRAVAÇÃO ---
+def calcular_lote(linhas, config):
+    # linhas: (qgs_fid, IDTERRENO, X, Y) do centroide em UTM; X/Y nulos quando o banco não calcula o centroide
+    fid, id_terreno, x, y = (list(coluna) for coluna in zip(*linhas))
+    x = np.array(x, dtype=np.float64)
+    y = np.array(y, dtype=np.float64)
+    validos = ~(np.isnan(x) | np.isnan(y))
+    lat = np.full(len(x), np.nan)
+    lon = np.full(len(x), np.nan)
+    lat[validos], lon[validos] = latlon_do_epsg(x[validos], y[validos], config["epsg_origem"], "numpy_tsql")
+
+    registros = []
+    for i in range(len(fid)):
+        if validos[i]:
+            # WKT com 15 dígitos (o CAST AS VARCHAR da view antiga arredondava para 6)
+            registros.append((fid[i], id_terreno[i], float(lat[i]), float(lon[i]), f"POINT ({lon[i]:.15g} {lat[i]:.15g})"))
+        else:
+            registros.append((fid[i], id_terreno[i], None, None, None))
+    return registros
+
+def gravar_lote(conn, registros, config):
+    # Staging + MERGE: um comando para o lote inteiro em vez de um INSERT/UPDATE por linha
+    with conn.cursor() as cursor:
+        cursor.fast_executemany = True
+        cursor.execute("IF OBJECT_ID('tempdb..#centroide_mat') IS NOT NULL DROP TABLE #centroide_mat;")
+        cursor.execute("""
+            CREATE TABLE #centroide_mat (
+                ID INT PRIMARY KEY, IDTERRENO INT NULL,
+                Centroide_Latitude FLOAT NULL, Centroide_Longitude FLOAT NULL, Centroide_LatLon_WKT VARCHAR(100) NULL
+            );
+        """)
+        cursor.executemany("INSERT INTO #centroide_mat VALUES (?, ?, ?, ?, ?)", registros)
+        cursor.execute(f"""
+            MERGE {config['tabela_destino']} AS t
+            USING #centroide_mat AS s ON t.ID = s.ID
+            WHEN MATCHED THEN UPDATE SET
+                IDTERRENO = s.IDTERRENO, Centroide_Latitude = s.Centroide_Latitude,
+                Centroide_Longitude = s.Centroide_Longitude, Centroide_LatLon_WKT = s.Centroide_LatLon_WKT,
+                DataAtualizacao = SYSDATETIME()
+            WHEN NOT MATCHED THEN INSERT (ID, IDTERRENO, Centroide_Latitude, Centroide_Longitude, Centroide_LatLon_WKT)
+                VALUES (s.ID, s.IDTERRENO, s.Centroide_Latitude, s.Centroide_Longitude, s.Centroide_LatLon_WKT);
+        """)
+        cursor.execute("DROP TABLE #centroide_mat;")
+    conn.commit()
+
+def remover_orfaos(conn, config, incremental):
+    # Tira da tabela materializada os IDs que sumiram da origem ou ficaram sem geometria
+    coluna_geom = config["coluna_geom"]
+    juncao = "JOIN #centroide_ids AS i ON i.qgs_fid = t.ID" if incremental else ""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            DELETE t FROM {config['tabela_destino']} AS t {juncao}
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {config['tabela_origem']} AS o
+                WHERE o.qgs_fid = t.ID AND o.{coluna_geom} IS NOT NULL AND o.{coluna_geom}.STIsEmpty() = 0
+            );
+        """)
+        return cursor.rowcount
+
+# --- FUNÇÃO PRINCIPAL ---
+def atualizar_tabela_centroides(config, modo="incremental"):
+    coluna_geom = config["coluna_geom"]
+    tamanho_lote = int(config.get("tamanho_lote", 50000))
+
+    print(f"\n--- ATUALIZANDO {config['tabela_destino']} ({modo}) A PARTIR DE {config['tabela_origem']} ---")
+    start_time = time.time()
+    total, n_lote, ultimo_fid = 0, 0, -1
+
+    try:
+        with pyodbc.connect(conn_str, timeout=300) as conn:
+            # A versão é lida antes de qualquer leitura: o que mudar durante a execução entra na próxima
+            versao = versao_atual(conn)
+            anterior = ultima_versao_sincronizada(conn, config) if modo == "incremental" else None
+            if modo == "incremental" and anterior is None:
+                print("   Sem versão válida do Change Tracking: fazendo reconstrução completa.")
+                modo = "reconstruir"
+
+            incremental = modo == "incremental"
+            if incremental:
+                n_alterados = carregar_ids_alterados(conn, config, anterior)
+                print(f"   {n_alterados} linhas alteradas desde a versão {anterior}.")
+                origem = f"#centroide_ids AS i JOIN {config['tabela_origem']} AS o ON o.qgs_fid = i.qgs_fid"
+            else:
+                origem = f"{config['tabela_origem']} AS o"
+
+            query_lote = f"""
+                SELECT TOP ({tamanho_lote}) o.qgs_fid, o.{config['coluna_id']}, c.centroide.STX, c.centroide.STY
+                FROM {origem}
+                CROSS APPLY (SELECT o.{coluna_geom}.MakeValid().STCentroid() AS centroide) AS c
+                WHERE o.qgs_fid > ? AND o.{coluna_geom} IS NOT NULL AND o.{coluna_geom}.STIsEmpty() = 0
+                ORDER BY o.qgs_fid;
+            """
+
+            while True:
+                with conn.cursor() as cursor:
+                    cursor.execute(query_lote, ultimo_fid)
+                    linhas = cursor.fetchall()
+                if not linhas:
+                    break
+                n_lote += 1
+                ultimo_fid = linhas[-1][0]
+                gravar_lote(conn, calcular_lote(linhas, config), config)
+                total += len(linhas)
+                print(f"   Lote {n_lote}: {len(linhas)} centroides gravados (até qgs_fid {ultimo_fid}).")
+
+            removidos = remover_orfaos(conn, config, incremental)
+            # Só registra a versão depois que todos os lotes foram gravados
+            gravar_versao(conn, config, versao)
+            conn.commit()
+
+        print(f"   ✅ SUCESSO! {total} centroides gravados e {removidos} removidos. Versão sincronizada: {versao}.")
+
+    except Exception as e:
+        print(f"   ❌ ERRO no lote {n_lote} (último qgs_fid {ultimo_fid}): {e}")
+    finally:
+        end_time = time.time()
+        print(f"   Tempo de execução: {end_time - start_time:.2f} segundos.")
+
+# --- EXECUÇÃO ---
+if __name__ == "__main__":
+    CENTROIDE_CONFIG = {
+        "tabela_origem": "[TERRAS].[TbOrigemDados]",
+        "tabela_destino": "[SCHEMA].[TbCentroideLatLon]",
+        "tabela_controle": "[SCHEMA].[TbCentroideLatLon_Controle]",
+        "coluna_geom": "CAMPO_GEOM",
+        "coluna_id": "IDTERRENO",
+        "epsg_origem": "EPSG:31983",  # zona 23S, a mesma fixada na view antiga
+        "tamanho_lote": 50000,
+    }
+
+    atualizar_tabela_centroides(CENTROIDE_CONFIG, modo="incremental")
+    #atualizar_tabela_centroides(CENTROIDE_CONFIG, modo="reconstruir")  # carga inicial
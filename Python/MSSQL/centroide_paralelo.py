@@ -0,0 +1,130 @@
+#Matheus Dias de Aviz
+#Motor paralelo (pool de processos) para WKB -> centroide -> reprojeção EPSG:4674
+#Usado por centroide_UTMtoLatLon.py e centroide_UTMtoLatLon_AirFlow.py quando "n_processos" está na config
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+from utm_latlon_numpy import latlon_do_epsg
+
+# Pool reaproveitado entre lotes do modo streaming (criar processos a cada lote custaria mais que o cálculo)
+_pool = None
+_pool_tamanho = None
+
+# Transformadores pyproj em cache por processo (criar um Transformer é caro)
+_transformadores = {}
+
+def obter_transformador(epsg_origem):
+    if epsg_origem not in _transformadores:
+        _transformadores[epsg_origem] = Transformer.from_crs(epsg_origem, "EPSG:4674", always_xy=True)
+    return _transformadores[epsg_origem]
+
+def obter_pool(n_processos):
+    global _pool, _pool_tamanho
+    if _pool is None or _pool_tamanho != n_processos:
+        if _pool is not None:
+            _pool.shutdown()
+        # "spawn" evita herdar conexões ODBC e threads do worker do Airflow via fork
+        _pool = ProcessPoolExecutor(max_workers=n_processos, mp_context=multiprocessing.get_context("spawn"))
+        _pool_tamanho = n_processos
+    return _pool
+
+def processar_particao(wkb, epsg_origem, motor="pyproj"):
+    # Executado dentro do processo filho: mesma sequência da versão GeoPandas (from_wkb, centroid, to_crs)
+    # Também devolve o tempo de cada etapa para as métricas (metricas_centroide.py)
+    inicio = time.time()
+    geometrias = shapely.from_wkb(wkb)
+    t_decodificacao = time.time()
+    centroides = shapely.centroid(geometrias)
+    validos = ~(shapely.is_missing(centroides) | shapely.is_empty(centroides))
+    t_centroide = time.time()
+    x, y = shapely.get_x(centroides[validos]), shapely.get_y(centroides[validos])
+    if motor == "pyproj":
+        lon, lat = obter_transformador(epsg_origem).transform(x, y)
+    else:
+        lat, lon = latlon_do_epsg(x, y, epsg_origem, motor)
+    tempos = (t_decodificacao - inicio, t_centroide - t_decodificacao, time.time() - t_centroide)
+    return validos, lat, lon, tempos
+
+def calcular_latlon_paralelo(df, config, metricas=None):
+    # Retorna (df só com centroides válidos + colunas lat/lon, ordenado por qgs_fid; quantidade de pulados)
+    n_processos = int(config.get("n_processos") or os.cpu_count())
+    n_particoes = int(config.get("n_particoes") or n_processos * 4)
+
+    inicio = time.time()
+    wkb = df['geometry'].to_numpy(dtype=object)
+    partes = [p for p in np.array_split(wkb, min(n_particoes, len(wkb))) if len(p)]
+
+    # map devolve os resultados na ordem das partições, então a remontagem é uma simples concatenação
+    resultados = list(obter_pool(n_processos).map(
+        processar_particao, partes, repeat(config["epsg_origem"]), repeat(config.get("motor_reprojecao", "pyproj"))
+    ))
+
+    validos = np.concatenate([r[0] for r in resultados])
+    df = df.loc[validos].copy()
+    df[config["coluna_lat"]] = np.concatenate([r[1] for r in resultados])
+    df[config["coluna_lon"]] = np.concatenate([r[2] for r in resultados])
+
+    if metricas is not None:
+        # Por etapa: soma dos tempos dos processos (tempo de CPU); "paralelo" guarda o tempo de parede do pool
+        tempos = np.sum([r[3] for r in resultados], axis=0)
+        metricas.registrar("decodificacao_wkb", tempos[0], len(wkb))
+        metricas.registrar("centroide", tempos[1], len(wkb))
+        metricas.registrar("reprojecao", tempos[2], len(df))
+        metricas.registrar("paralelo", time.time() - inicio, len(wkb))
+    return df.sort_values('qgs_fid', kind='stable'), int((~validos).sum())
+
+# --- BENCHMARK: caminho serial (GeoPandas) x pool de processos ---
+def gerar_poligonos_sinteticos(n_registros, n_vertices=32, semente=42, centros=None):
+    # Polígonos irregulares em torno de coordenadas UTM da zona 23S (São Paulo) ou de centros (x, y) informados
+    rng = np.random.default_rng(semente)
+    if centros is None:
+        cx = rng.uniform(250000, 450000, n_registros)
+        cy = rng.uniform(7350000, 7500000, n_registros)
+    else:
+        cx, cy = centros
+    angulos = np.sort(rng.uniform(0, 2 * np.pi, (n_registros, n_vertices)), axis=1)
+    raios = rng.uniform(10, 60, (n_registros, n_vertices))
+    xs = cx[:, None] + raios * np.cos(angulos)
+    ys = cy[:, None] + raios * np.sin(angulos)
+    aneis = np.stack([xs, ys], axis=-1)
+    aneis = np.concatenate([aneis, aneis[:, :1]], axis=1)
+    return shapely.to_wkb(shapely.polygons(aneis))
+
+if __name__ == "__main__":
+    import pandas as pd
+    from centroide_UTMtoLatLon import criar_geodataframe, calcular_centroides, reprojetar_centroides
+
+    N_REGISTROS = 500000
+    LISTA_PROCESSOS = [2, 4, 8, os.cpu_count()]
+
+    config = {
+        "coluna_lat": "lat",
+        "coluna_lon": "lon",
+        "epsg_origem": "EPSG:31983",
+    }
+
+    print(f"Gerando {N_REGISTROS} polígonos sintéticos...")
+    df = pd.DataFrame({'qgs_fid': np.arange(N_REGISTROS), 'geometry': gerar_poligonos_sinteticos(N_REGISTROS)})
+
+    start_time = time.time()
+    gdf, _ = calcular_centroides(criar_geodataframe(df.copy(), config["epsg_origem"]))
+    gdf = reprojetar_centroides(gdf, config)
+    tempo_serial = time.time() - start_time
+    print(f"Serial (GeoPandas): {tempo_serial:.2f} s")
+
+    for n_processos in sorted(set(LISTA_PROCESSOS)):
+        config["n_processos"] = n_processos
+        obter_pool(n_processos)  # aquece o pool fora da medição (spawn dos processos)
+        start_time = time.time()
+        resultado, _ = calcular_latlon_paralelo(df, config)
+        tempo = time.time() - start_time
+
+        diferenca = np.abs(resultado["lat"].to_numpy() - gdf["lat"].to_numpy()).max()
+        print(f"{n_processos} processos: {tempo:.2f} s | speedup {tempo_serial / tempo:.2f}x | diferença máx. lat {diferenca:.2e}")
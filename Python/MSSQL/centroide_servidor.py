@@ -0,0 +1,95 @@
+#Matheus Dias de Aviz
+#Centroide calculado no SQL Server (pushdown) x no cliente (GeoPandas/shapely)
+#"centroide" na config: "cliente" (padrão), "servidor" ou "auto" (calibração numa amostra da tabela)
+#No modo "servidor", as linhas em que o STCentroid() volta NULL são relidas inteiras e calculadas no cliente,
+#para o resultado ser o mesmo do modo "cliente"
+import time
+
+import shapely
+
+AMOSTRA_CALIBRACAO = 2000
+# qgs_fid por consulta na releitura dos centroides nulos (o SQL Server aceita até 2100 parâmetros)
+TAMANHO_LOTE_RELEITURA = 1000
+
+def expressao_geometria_sql(config, coluna_geom=None):
+    # No modo "servidor" o banco devolve só o WKB do ponto (21 bytes) em vez do polígono inteiro;
+    # o resto do pipeline não muda: centroide de um ponto é o próprio ponto, sobra só a reprojeção.
+    # STCentroid() volta NULL para linhas/pontos e quando o MakeValid() gera uma GeometryCollection
+    # (polígono inválido ou que se autotangencia): essas linhas passam por recuperar_centroides_nulos.
+    coluna_geom = coluna_geom or config["coluna_geom"]
+    if config.get("centroide", "cliente") == "servidor":
+        return f"{coluna_geom}.MakeValid().STCentroid().STAsBinary()"
+    return f"{coluna_geom}.STAsBinary()"
+
+def recuperar_centroides_nulos(conn, df, config, metricas=None):
+    # Modo "servidor": troca os centroides NULL pela geometria inteira (STAsBinary, relida por qgs_fid),
+    # que segue o mesmo caminho do modo "cliente" (centroide de um ponto é o próprio ponto).
+    # Geometrias NULL na tabela continuam NULL e saem no dropna da leitura. Retorna quantas foram recuperadas.
+    if config.get("centroide", "cliente") != "servidor":
+        return 0
+    nulos = df['geometry'].isna()
+    if not nulos.any():
+        return 0
+
+    inicio = time.time()
+    fids = df.loc[nulos, 'qgs_fid'].tolist()
+    wkb = {}
+    with conn.cursor() as cursor:
+        for i in range(0, len(fids), TAMANHO_LOTE_RELEITURA):
+            parte = fids[i:i + TAMANHO_LOTE_RELEITURA]
+            cursor.execute(f"SELECT qgs_fid, {config['coluna_geom']}.STAsBinary() FROM {config['nome_tabela']} "
+                           f"WHERE qgs_fid IN ({', '.join('?' * len(parte))})", *parte)
+            wkb.update((fid, geom) for fid, geom in cursor.fetchall() if geom is not None)
+
+    geometrias = [wkb.get(fid) for fid in fids]
+    if df['geometry'].dtype == 'geometry':
+        # Leitor Arrow com decodificação: a coluna já é shapely
+        geometrias = shapely.from_wkb(geometrias)
+    elif df['geometry'].dtype != object:
+        # Leitor Arrow sem decodificação (binário Arrow): vira bytes, como no pd.read_sql
+        df['geometry'] = df['geometry'].astype(object)
+    df.loc[nulos, 'geometry'] = geometrias
+
+    if metricas is not None:
+        metricas.registrar("releitura_centroide_nulo", time.time() - inicio, len(wkb), sum(len(g) for g in wkb.values()))
+    print(f"   ATENÇÃO: {len(fids)} centroides NULL no servidor; {len(wkb)} recalculados no cliente "
+          f"e {len(fids) - len(wkb)} sem geometria.")
+    return len(wkb)
+
+def _medir_amostra(conn, config, modo, amostra):
+    # Tempo de leitura da amostra + tempo de decodificar o WKB e calcular o centroide localmente
+    expressao = expressao_geometria_sql({**config, "centroide": modo})
+    query = f"""
+        SELECT TOP ({amostra}) {expressao} AS geometry
+        FROM {config['nome_tabela']}
+        WHERE {config['coluna_geom']} IS NOT NULL AND {config['coluna_geom']}.STIsEmpty() = 0
+        ORDER BY qgs_fid;
+    """
+    inicio = time.time()
+    with conn.cursor() as cursor:
+        cursor.execute(query)
+        wkb = [linha[0] for linha in cursor.fetchall()]
+    t_leitura = time.time() - inicio
+
+    inicio = time.time()
+    shapely.centroid(shapely.from_wkb(wkb))
+    return t_leitura, time.time() - inicio, sum(len(w) for w in wkb if w is not None), len(wkb)
+
+def calibrar_centroide(conn, config):
+    # Mede os dois modos na mesma amostra (duas rodadas alternadas, fica o menor tempo de cada,
+    # para o cache de páginas do banco não favorecer quem roda por último) e devolve o mais rápido.
+    # A reprojeção custa o mesmo nos dois modos, então fica de fora da conta.
+    amostra = int(config.get("amostra_calibracao", AMOSTRA_CALIBRACAO))
+    custos = {}
+    for _ in range(2):
+        for modo in ("cliente", "servidor"):
+            medida = _medir_amostra(conn, config, modo, amostra)
+            anterior = custos.get(modo)
+            if anterior is None or medida[0] + medida[1] < anterior[0] + anterior[1]:
+                custos[modo] = medida
+
+    for modo, (t_leitura, t_calculo, n_bytes, n_registros) in custos.items():
+        print(f"   Calibração ({modo}): leitura {t_leitura:.3f} s + cálculo {t_calculo:.3f} s, {n_bytes} bytes em {n_registros} registros.")
+    escolhido = min(custos, key=lambda modo: custos[modo][0] + custos[modo][1])
+    print(f"   Centroide será calculado no {escolhido}.")
+    return escolhido
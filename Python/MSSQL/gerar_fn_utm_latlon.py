@@ -0,0 +1,152 @@
+#Matheus Dias de Aviz
+#Gerador de uma função T-SQL única (inline, um nível) para UTM -> Lat/Lon já calibrada
+#Substitui a cadeia fn_UTMtoLatLon_aux -> fn_UTMtoLatLon (8 CTEs que recalculam e2, ep2, e1... a cada ponto)
+#Todas as constantes do elipsoide, a correção por zona e a calibração viram literais FLOAT na função gerada
+#A mesma lista de expressões é avaliada em NumPy e conferida com utm_latlon_numpy e com o pyproj
+import math
+import os
+
+import numpy as np
+
+from utm_latlon_numpy import A, F, K0, CORRECOES_ZONA, COEFICIENTES_CALIBRACAO, constantes_tsql, constantes_float, utm_para_latlon
+
+def lit(valor):
+    # Literal com expoente: no SQL Server "0.0066" seria NUMERIC, "6.6E-03" é FLOAT
+    texto = f"{valor:.17E}"
+    return f"({texto})" if valor < 0 else texto
+
+def montar_passos(a=A, f=F, k0=K0, correcoes_zona=CORRECOES_ZONA, calibracao=COEFICIENTES_CALIBRACAO, precisao_tsql=True):
+    # Retorna grupos de (nome, expressão); cada grupo só usa nomes dos grupos anteriores.
+    # precisao_tsql=True reproduz as constantes truncadas pelo DECIMAL do SQL Server na função original
+    # (os coeficientes de calibração foram ajustados em cima delas); False usa o elipsoide exato.
+    if (a, f) == (A, F):
+        c = constantes_tsql() if precisao_tsql else constantes_float()
+    else:
+        b = a * (1.0 - f)
+        e2 = (a ** 2 - b ** 2) / a ** 2
+        c = {
+            "e2": e2,
+            "ep2": (a ** 2 - b ** 2) / b ** 2,
+            "denominador_mu": a * (1.0 - e2 / 4.0 - 3 * e2 ** 2 / 64.0 - 5 * e2 ** 3 / 256.0),
+            "a_1_menos_e2": a * (1.0 - e2),
+        }
+    e2, ep2 = c["e2"], c["ep2"]
+    e1 = (1.0 - math.sqrt(1.0 - e2)) / (1.0 + math.sqrt(1.0 - e2))
+    graus = 180.0 / math.pi
+
+    # Correção por zona + termo constante da calibração num único IIF
+    def por_zona(indice, constante):
+        expressao = lit(constante)
+        for zona, correcao in sorted(correcoes_zona.items()):
+            expressao = f"IIF(@zone = {zona}, {lit(correcao[indice] + constante)}, {expressao})"
+        return expressao
+
+    k = calibracao
+    return [
+        [("mu", f"(@y - @southHem * 1.0E7) * {lit(1.0 / (k0 * c['denominador_mu']))}"),
+         ("xr", "@x - 5.0E5")],
+        [("phi1", f"mu + {lit(3.0 * e1 / 2.0 - 27.0 * e1 ** 3 / 32.0)} * SIN(2.0E0 * mu)"
+                  f" + {lit(21.0 * e1 ** 2 / 16.0 - 55.0 * e1 ** 4 / 32.0)} * SIN(4.0E0 * mu)"
+                  f" + {lit(151.0 * e1 ** 3 / 96.0)} * SIN(6.0E0 * mu)"
+                  f" + {lit(1097.0 * e1 ** 4 / 512.0)} * SIN(8.0E0 * mu)")],
+        [("sen_phi", "SIN(phi1)"), ("cos_phi", "COS(phi1)"), ("tan_phi", "TAN(phi1)")],
+        [("w", f"1.0E0 - {lit(e2)} * sen_phi * sen_phi"),
+         ("T", "tan_phi * tan_phi"),
+         ("C", f"{lit(ep2)} * cos_phi * cos_phi")],
+        [("N1", f"{lit(a)} / SQRT(w)"),
+         ("R1", f"{lit(c['a_1_menos_e2'])} / (w * SQRT(w))")],
+        [("D", f"xr / (N1 * {lit(k0)})")],
+        [("D2", "D * D")],
+        [("Latitude",
+          f"(phi1 - (N1 * tan_phi / R1) * (D2 / 2.0E0"
+          f" - ({lit(5.0 - 9.0 * ep2)} + 3.0E0 * T + 1.0E1 * C - 4.0E0 * C * C) * D2 * D2 / 2.4E1"
+          f" + ({lit(61.0 - 252.0 * ep2)} + 9.0E1 * T + 2.98E2 * C + 4.5E1 * T * T - 3.0E0 * C * C) * D2 * D2 * D2 / 7.2E2)"
+          f") * {lit(graus)}"
+          f" + {por_zona(0, k['a_lat'])} + {lit(k['b_lat'])} * @x + {lit(k['c_lat'])} * @y"),
+         ("Longitude",
+          f"(@zone * 6 - 183)"
+          f" + (D - (1.0E0 + 2.0E0 * T + C) * D2 * D / 6.0E0"
+          f" + ({lit(5.0 + 8.0 * ep2)} - 2.0E0 * C + 2.8E1 * T - 3.0E0 * C * C + 2.4E1 * T * T) * D2 * D2 * D / 1.2E2"
+          f") / cos_phi * {lit(graus)}"
+          f" + {por_zona(1, k['a_lon'])} + {lit(k['b_lon'])} * @x + {lit(k['c_lon'])} * @y")],
+    ]
+
+def gerar_sql(passos, nome_funcao="[SCHEMA].[fn_UTMtoLatLon_Calibrada]", banco="id_banco"):
+    grupos = []
+    for i, grupo in enumerate(passos[:-1], start=1):
+        colunas = ",\n            ".join(f"{expressao} AS {nome}" for nome, expressao in grupo)
+        juncao = "FROM" if i == 1 else "CROSS APPLY"
+        grupos.append(f"    {juncao} (SELECT\n            {colunas}) AS p{i}")
+    final = ",\n        ".join(f"{expressao} AS {nome}" for nome, expressao in passos[-1])
+    return f"""USE [{banco}]
+GO
+
+-- Autor: Matheus Aviz
+-- ARQUIVO GERADO por Python/MSSQL/gerar_fn_utm_latlon.py - altere o gerador, não este arquivo
+-- UTM -> Lat/Lon (Krüger) com correção por zona e calibração de fn_UTMtoLatLon_aux já incorporadas.
+-- Constantes do elipsoide pré-calculadas como literais FLOAT; uma única consulta por ponto.
+
+CREATE OR ALTER FUNCTION {nome_funcao}
+(
+    @x FLOAT,
+    @y FLOAT,
+    @zone INT,
+    @southHem BIT
+)
+RETURNS TABLE
+WITH SCHEMABINDING
+AS
+RETURN
+(
+    SELECT
+        {final}
+{chr(10).join(grupos)}
+);
+GO
+"""
+
+def avaliar_passos(passos, x, y, zona, hemisferio_sul=True):
+    # Avalia as mesmas expressões do SQL em NumPy (só troca @param, "=" e as funções do T-SQL)
+    ambiente = {
+        "SIN": np.sin, "COS": np.cos, "TAN": np.tan, "SQRT": np.sqrt, "IIF": np.where,
+        "x": np.asarray(x, dtype=np.float64), "y": np.asarray(y, dtype=np.float64),
+        "zone": np.asarray(zona), "southHem": np.asarray(hemisferio_sul, dtype=np.float64),
+    }
+    for grupo in passos:
+        for nome, expressao in grupo:
+            ambiente[nome] = eval(expressao.replace("@", "").replace(" = ", " == "), {"__builtins__": {}}, ambiente)
+    return ambiente["Latitude"], ambiente["Longitude"]
+
+def conferir(passos, pontos_por_eixo=200):
+    # Diferença máxima (graus) contra a cadeia original (porte NumPy) e contra o pyproj, zonas 22 e 23
+    from pyproj import Transformer
+
+    x, y = np.meshgrid(np.linspace(170000, 830000, pontos_por_eixo), np.linspace(7180000, 7820000, pontos_por_eixo))
+    x, y = x.ravel(), y.ravel()
+    resultado = {}
+    for zona in sorted(CORRECOES_ZONA):
+        lat, lon = avaliar_passos(passos, x, y, zona)
+        lat_cadeia, lon_cadeia = utm_para_latlon(x, y, zona)
+        lon_ref, lat_ref = Transformer.from_crs(f"EPSG:{31960 + zona}", "EPSG:4674", always_xy=True).transform(x, y)
+        resultado[zona] = {
+            "cadeia": max(np.abs(lat - lat_cadeia).max(), np.abs(lon - lon_cadeia).max()),
+            "pyproj": max(np.abs(lat - lat_ref).max(), np.abs(lon - lon_ref).max()),
+        }
+    return resultado
+
+if __name__ == "__main__":
+    ARQUIVO_SAIDA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "T-SQL", "fn_UTMtoLatLon_Calibrada.sql")
+    TOLERANCIA_CADEIA = 1e-9  # graus (~0,1 mm); acima disso a função gerada não é gravada
+
+    passos = montar_passos()
+    conferencia = conferir(passos)
+    for zona, diferencas in conferencia.items():
+        print(f"Zona {zona}S | diferença máx. para fn_UTMtoLatLon_aux: {diferencas['cadeia']:.2e}°"
+              f" | para o pyproj: {diferencas['pyproj']:.2e}°")
+
+    if max(d["cadeia"] for d in conferencia.values()) > TOLERANCIA_CADEIA:
+        print("❌ A função gerada diverge da cadeia original; arquivo não gravado.")
+    else:
+        with open(ARQUIVO_SAIDA, "w", encoding="utf-8") as arquivo:
+            arquivo.write(gerar_sql(passos))
+        print(f"✅ Função gravada em {os.path.normpath(ARQUIVO_SAIDA)}")
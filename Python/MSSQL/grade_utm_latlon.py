@@ -0,0 +1,168 @@
+#Matheus Dias de Aviz
+#Grade pré-calculada (interpolação bilinear) para UTM -> Lat/Lon dentro da extensão do Estado de São Paulo
+#Os nós da grade saem da série de Krüger exata (utm_latlon_numpy); cada ponto passa a custar 4 leituras + 2 interpolações
+#Grade salva em .npy (aberta com memmap) + .json com origem, passo e o erro máximo medido na construção
+#Motores "grade" e "grade_tsql" do pipeline de centroides (ver MOTORES em utm_latlon_numpy.py)
+import json
+import os
+
+import numpy as np
+from pyproj import Transformer
+
+from utm_latlon_numpy import utm_para_latlon, MOTORES
+
+# Extensão de São Paulo (lon_min, lon_max, lat_min, lat_max) em graus
+EXTENSAO_SP = (-53.2, -44.1, -25.4, -19.7)
+# Faixa de longitude coberta por zona (a zona + 1° de folga), cortada pela extensão de SP
+FOLGA_ZONA_GRAUS = 1.0
+
+# Passo de 500 m: erro bilinear medido de ~2,4 mm nas duas zonas (cai com o quadrado do passo)
+PASSO_GRADE_M = 500.0
+# Erro máximo aceito na construção, em metros no terreno (limite inferior da calibração de Fn_UTMtoLatLon.sql: 0,3 cm)
+ERRO_MAXIMO_M = 0.003
+METROS_POR_GRAU = 111320.0
+
+DIRETORIO_GRADES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grades")
+
+_grades = {}
+
+def _arquivos(zona, motor_base):
+    nome = f"grade_{zona}S_{motor_base}"
+    return os.path.join(DIRETORIO_GRADES, nome + ".npy"), os.path.join(DIRETORIO_GRADES, nome + ".json")
+
+def extensao_utm(zona):
+    # Retângulo UTM que cobre a parte de SP na faixa da zona, com uma célula de folga
+    lon_min, lon_max, lat_min, lat_max = EXTENSAO_SP
+    meridiano = zona * 6 - 183
+    lon_min = max(lon_min, meridiano - 3 - FOLGA_ZONA_GRAUS)
+    lon_max = min(lon_max, meridiano + 3 + FOLGA_ZONA_GRAUS)
+    lon, lat = np.meshgrid(np.linspace(lon_min, lon_max, 200), np.linspace(lat_min, lat_max, 200))
+    x, y = Transformer.from_crs("EPSG:4674", f"EPSG:{31960 + zona}", always_xy=True).transform(lon.ravel(), lat.ravel())
+    return x.min() - PASSO_GRADE_M, x.max() + PASSO_GRADE_M, y.min() - PASSO_GRADE_M, y.max() + PASSO_GRADE_M
+
+def erro_em_metros(lat, lon, lat_ref, lon_ref):
+    dy = (lat - lat_ref) * METROS_POR_GRAU
+    dx = (lon - lon_ref) * METROS_POR_GRAU * np.cos(np.radians(lat_ref))
+    return np.hypot(dx, dy)
+
+def construir_grade(zona, motor_base="numpy", passo=PASSO_GRADE_M, amostra=200000, semente=42):
+    # Retorna (array [2, ny, nx] com lat/lon nos nós, metadados). O erro é medido nos centros das células
+    # (onde a interpolação bilinear mais se afasta de uma função suave) e numa amostra aleatória.
+    x_min, x_max, y_min, y_max = extensao_utm(zona)
+    nx = int(np.ceil((x_max - x_min) / passo)) + 1
+    ny = int(np.ceil((y_max - y_min) / passo)) + 1
+    xs = x_min + passo * np.arange(nx)
+    ys = y_min + passo * np.arange(ny)
+    x, y = np.meshgrid(xs, ys)
+    lat, lon = utm_para_latlon(x, y, zona, **MOTORES[motor_base])
+    grade = np.stack([lat, lon])
+
+    meta = {"zona": zona, "motor_base": motor_base, "x0": x_min, "y0": y_min, "passo": passo, "nx": nx, "ny": ny}
+
+    rng = np.random.default_rng(semente)
+    cx, cy = np.meshgrid(xs[:-1] + passo / 2, ys[:-1] + passo / 2)
+    px = np.concatenate([cx.ravel(), rng.uniform(xs[0], xs[-1], amostra)])
+    py = np.concatenate([cy.ravel(), rng.uniform(ys[0], ys[-1], amostra)])
+    lat_i, lon_i = interpolar(grade, meta, px, py)
+    lat_ref, lon_ref = utm_para_latlon(px, py, zona, **MOTORES[motor_base])
+    meta["erro_max_m"] = float(erro_em_metros(lat_i, lon_i, lat_ref, lon_ref).max())
+    return grade, meta
+
+def salvar_grade(grade, meta):
+    # Vários processos (pool, tasks mapeadas do Airflow) podem construir a mesma grade ao mesmo tempo:
+    # cada um grava em nomes temporários próprios e troca com os.replace; o .json vai por último,
+    # então quem encontra o .json já encontra o .npy completo
+    os.makedirs(DIRETORIO_GRADES, exist_ok=True)
+    arquivo_npy, arquivo_json = _arquivos(meta["zona"], meta["motor_base"])
+    sufixo = f".{os.getpid()}.tmp"
+    with open(arquivo_npy + sufixo, "wb") as f:
+        np.save(f, grade)
+    with open(arquivo_json + sufixo, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(arquivo_npy + sufixo, arquivo_npy)
+    os.replace(arquivo_json + sufixo, arquivo_json)
+
+def carregar_grade(zona, motor_base="numpy"):
+    # Abre a grade em memmap (as páginas só são lidas quando usadas); constrói e salva se ainda não existir.
+    # O .json só aparece depois do .npy completo (ver salvar_grade)
+    chave = (zona, motor_base)
+    if chave not in _grades:
+        arquivo_npy, arquivo_json = _arquivos(zona, motor_base)
+        if os.path.exists(arquivo_json):
+            with open(arquivo_json, encoding="utf-8") as f:
+                meta = json.load(f)
+            grade = np.load(arquivo_npy, mmap_mode="r")
+        else:
+            print(f"Construindo grade UTM->Lat/Lon da zona {zona}S ({motor_base})...")
+            grade, meta = construir_grade(zona, motor_base)
+            if meta["erro_max_m"] > ERRO_MAXIMO_M:
+                raise ValueError(f"Grade da zona {zona}S com erro de {meta['erro_max_m']:.4f} m (limite {ERRO_MAXIMO_M} m).")
+            try:
+                salvar_grade(grade, meta)
+            except OSError as e:
+                print(f"Grade mantida só em memória ({e}).")
+        _grades[chave] = (grade, meta)
+    return _grades[chave]
+
+def interpolar(grade, meta, x, y):
+    # Bilinear: posição fracionária na grade, 4 vizinhos, pesos tx/ty. Pontos fora da grade viram NaN.
+    fx = (np.asarray(x, dtype=np.float64) - meta["x0"]) / meta["passo"]
+    fy = (np.asarray(y, dtype=np.float64) - meta["y0"]) / meta["passo"]
+    dentro = (fx >= 0) & (fx <= meta["nx"] - 1) & (fy >= 0) & (fy <= meta["ny"] - 1)
+    i = np.clip(np.floor(fx).astype(np.int64), 0, meta["nx"] - 2)
+    j = np.clip(np.floor(fy).astype(np.int64), 0, meta["ny"] - 2)
+    tx = fx - i
+    ty = fy - j
+
+    resultado = []
+    for campo in grade:
+        v0 = campo[j, i]
+        v0 += (campo[j, i + 1] - v0) * tx
+        v1 = campo[j + 1, i]
+        v1 += (campo[j + 1, i + 1] - v1) * tx
+        v0 += (v1 - v0) * ty
+        v0[~dentro] = np.nan
+        resultado.append(v0)
+    return resultado[0], resultado[1]
+
+def latlon_por_grade(x, y, zona, motor="grade"):
+    # "grade" usa nós da série em float puro (~pyproj); "grade_tsql" usa nós iguais a fn_UTMtoLatLon_aux.
+    # Pontos fora da extensão de SP caem na série completa.
+    motor_base = "numpy_tsql" if motor == "grade_tsql" else "numpy"
+    grade, meta = carregar_grade(zona, motor_base)
+    lat, lon = interpolar(grade, meta, x, y)
+    fora = np.isnan(lat)
+    if fora.any():
+        x_fora = np.asarray(x, dtype=np.float64)[fora]
+        y_fora = np.asarray(y, dtype=np.float64)[fora]
+        lat[fora], lon[fora] = utm_para_latlon(x_fora, y_fora, zona, **MOTORES[motor_base])
+    return lat, lon
+
+# --- CONSTRUÇÃO DAS GRADES + CONFERÊNCIA DO ERRO E DO TEMPO ---
+if __name__ == "__main__":
+    import time
+
+    N_PONTOS = 2000000
+
+    for motor_base in ("numpy", "numpy_tsql"):
+        for zona in (22, 23):
+            inicio = time.time()
+            grade, meta = construir_grade(zona, motor_base)
+            salvar_grade(grade, meta)
+            situacao = "✅" if meta["erro_max_m"] <= ERRO_MAXIMO_M else "❌"
+            print(f"{situacao} Zona {zona}S ({motor_base}): {meta['nx']}x{meta['ny']} nós, passo {meta['passo']:.0f} m, "
+                  f"erro máx. {meta['erro_max_m'] * 1000:.2f} mm, {grade.nbytes / 1e6:.0f} MB, {time.time() - inicio:.1f} s")
+
+    rng = np.random.default_rng(7)
+    x = rng.uniform(300000, 800000, N_PONTOS)
+    y = rng.uniform(7200000, 7800000, N_PONTOS)
+    carregar_grade(23)
+
+    inicio = time.time()
+    lat_s, lon_s = utm_para_latlon(x, y, 23, **MOTORES["numpy"])
+    tempo_serie = time.time() - inicio
+    inicio = time.time()
+    lat_g, lon_g = latlon_por_grade(x, y, 23)
+    tempo_grade = time.time() - inicio
+    print(f"{N_PONTOS} pontos: série {tempo_serie:.2f} s | grade {tempo_grade:.2f} s ({tempo_serie / tempo_grade:.1f}x) | "
+          f"erro máx. {erro_em_metros(lat_g, lon_g, lat_s, lon_s).max() * 1000:.2f} mm")
@@ -0,0 +1,90 @@
+#Matheus Dias de Aviz
+#Leitura colunar (ODBC -> Arrow) das geometrias do MS SQL Server
+#Alternativa ao pd.read_sql quando "leitor": "arrow" está na config (pip install arrow-odbc pyarrow)
+#O driver preenche buffers contíguos do Arrow em lotes; o WKB de cada lote é decodificado e descartado em seguida,
+#então a tabela inteira nunca fica em memória como uma coluna de objetos bytes do Python
+#"comparar_leitores": True mede pd.read_sql e Arrow na mesma consulta, cada um num processo novo (tempo e pico de RSS)
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+from arrow_odbc import read_arrow_batches_from_odbc
+
+from metricas_centroide import bytes_wkb, pico_rss_mb
+
+# STAsBinary() devolve varbinary(max): o Arrow precisa de um tamanho máximo por valor para alocar o buffer.
+# Esse máximo vem do próprio dado (MAX(DATALENGTH) da consulta) e o lote é reduzido para o buffer caber no orçamento:
+# buffer por lote ~= tamanho do lote * maior WKB.
+TAMANHO_LOTE_ARROW = 8192
+ORCAMENTO_BUFFER_ARROW = 256 * 1024 * 1024
+
+def maior_wkb(conn_str, query):
+    # Maior WKB devolvido pela consulta de leitura (uma varredura no servidor, sem trafegar as geometrias)
+    consulta = f"SELECT MAX(DATALENGTH(geometry)) AS maior FROM ({query.strip().rstrip(';')}) AS leitura"
+    for lote in read_arrow_batches_from_odbc(query=consulta, connection_string=conn_str, batch_size=1):
+        return int(lote.column("maior")[0].as_py() or 0)
+    return 0
+
+def dimensionar_leitura(conn_str, query, config):
+    # (tamanho do lote, tamanho máximo do WKB); "tamanho_max_wkb" na config dispensa a consulta do máximo
+    tamanho_max = config.get("tamanho_max_wkb") or maior_wkb(conn_str, query)
+    tamanho_max = max(tamanho_max, 1)
+    orcamento = config.get("orcamento_buffer_arrow", ORCAMENTO_BUFFER_ARROW)
+    tamanho_lote = max(1, min(config.get("tamanho_lote_arrow", TAMANHO_LOTE_ARROW), orcamento // tamanho_max))
+    return tamanho_lote, tamanho_max
+
+def ler_geometrias_arrow(conn_str, query, config, decodificar=True):
+    # Retorna (DataFrame com qgs_fid, geometry [e zona], bytes de WKB lidos).
+    # decodificar=True: "geometry" já sai como GeoSeries (shapely), sem passar por uma coluna de bytes.
+    # decodificar=False: "geometry" fica como binário Arrow (pool de processos decodifica nos filhos).
+    tamanho_lote, tamanho_max = dimensionar_leitura(conn_str, query, config)
+    print(f"   Arrow: lotes de {tamanho_lote} registros, WKB de até {tamanho_max} bytes.")
+    leitor = read_arrow_batches_from_odbc(
+        query=query,
+        connection_string=conn_str,
+        batch_size=tamanho_lote,
+        max_binary_size=tamanho_max,
+    )
+
+    partes = []
+    bytes_lidos = 0
+    for lote in leitor:
+        wkb = lote.column("geometry")
+        bytes_lidos += wkb.nbytes
+        parte = lote.drop_columns(["geometry"]).to_pandas()
+        if decodificar:
+            # Os objetos bytes existem só durante o from_wkb deste lote
+            parte["geometry"] = gpd.GeoSeries(shapely.from_wkb(wkb.to_numpy(zero_copy_only=False)), index=parte.index)
+        else:
+            parte["geometry"] = pd.Series(pd.arrays.ArrowExtensionArray(wkb), index=parte.index)
+        partes.append(parte)
+
+    if not partes:
+        return pd.DataFrame(columns=["qgs_fid", "geometry"]), 0
+    return pd.concat(partes, ignore_index=True), bytes_lidos
+
+def _medir_leitor(leitor, conn_str, query, config):
+    # Roda num processo novo: o pico de RSS é só desta leitura
+    inicio = time.time()
+    if leitor == "arrow":
+        df, n_bytes = ler_geometrias_arrow(conn_str, query, config, decodificar=False)
+    else:
+        import pyodbc
+        with pyodbc.connect(conn_str, timeout=300) as conn:
+            df = pd.read_sql(query, conn)
+        n_bytes = bytes_wkb(df['geometry'])
+    return {"segundos": time.time() - inicio, "registros": len(df), "bytes": n_bytes, "pico_rss_mb": pico_rss_mb()}
+
+def comparar_leitores(conn_str, query, config, metricas):
+    # Etapas "leitura_pandas" e "leitura_arrow" nas métricas (sem decodificar o WKB em nenhum dos dois)
+    contexto = multiprocessing.get_context("spawn")
+    for leitor in ("pandas", "arrow"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+            r = executor.submit(_medir_leitor, leitor, conn_str, query, config).result()
+        etapa = f"leitura_{leitor}"
+        metricas.registrar(etapa, r["segundos"], r["registros"], r["bytes"])
+        metricas.etapas[etapa]["pico_rss_mb"] = r["pico_rss_mb"]
+        print(f"   Leitura {leitor}: {r['registros']} registros em {r['segundos']:.2f} s, pico de {r['pico_rss_mb']} MB.")
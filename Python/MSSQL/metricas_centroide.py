@@ -0,0 +1,92 @@
+#Matheus Dias de Aviz
+#Métricas por etapa do pipeline de centroides: leitura, decodificação WKB, centroide, reprojeção e update
+#Cada etapa vira uma linha JSON (registros, registros/s, bytes, pico de RSS); o resumo vai para o XCom no Airflow
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def pico_rss_mb():
+    # None no Windows (sem o módulo resource). ru_maxrss vem em KB no Linux e em bytes no macOS. RUSAGE_CHILDREN só conta processos já encerrados,
+    # então o pico dos processos do pool aparece depois que o pool é fechado.
+    if resource is None:
+        return None
+    fator = 1024 * 1024 if sys.platform == "darwin" else 1024
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(proprio, filhos) / fator, 1)
+
+def bytes_wkb(serie):
+    # Tamanho do WKB trafegado (sem contar o overhead do protocolo TDS)
+    return int(serie.map(len, na_action='ignore').sum())
+
+# Cada linha do UPDATE (ou da tabela de staging) envia qgs_fid (8 bytes) + lat e lon (float64, 8 bytes cada);
+# no modo incremental ("coluna_hash") vai junto o hash_geom (SHA2_256, 32 bytes)
+BYTES_POR_LINHA_UPDATE = 8 + 8 + 8
+BYTES_HASH_GEOM = 32
+
+def bytes_update(registros, config=None):
+    # Tamanho dos parâmetros enviados no UPDATE (sem contar o overhead do protocolo TDS)
+    por_linha = BYTES_POR_LINHA_UPDATE + (BYTES_HASH_GEOM if config and config.get("coluna_hash") else 0)
+    return registros * por_linha
+
+class MetricasEtapas:
+    def __init__(self, nome_tabela=None, arquivo=None):
+        self.nome_tabela = nome_tabela
+        self.arquivo = arquivo  # se informado, as linhas JSON também são anexadas neste arquivo
+        self.etapas = {}
+        self.inicio = time.time()
+        self.erro = None
+
+    def registrar(self, etapa, segundos, registros=0, bytes_etapa=0):
+        e = self.etapas.setdefault(etapa, {"segundos": 0.0, "registros": 0, "bytes": 0, "chamadas": 0})
+        e["segundos"] += segundos
+        e["registros"] += int(registros)
+        e["bytes"] += int(bytes_etapa)
+        e["chamadas"] += 1
+        e["pico_rss_mb"] = pico_rss_mb()
+
+    @contextmanager
+    def medir(self, etapa, registros=0, bytes_etapa=0):
+        # Os valores podem ser preenchidos dentro do bloco: with metricas.medir("leitura") as m: m["registros"] = ...
+        medida = {"registros": registros, "bytes": bytes_etapa}
+        inicio = time.time()
+        try:
+            yield medida
+        finally:
+            self.registrar(etapa, time.time() - inicio, medida["registros"], medida["bytes"])
+
+    def linhas(self):
+        for etapa, e in self.etapas.items():
+            yield {
+                "tabela": self.nome_tabela,
+                "etapa": etapa,
+                "segundos": round(e["segundos"], 4),
+                "registros": e["registros"],
+                "registros_por_s": round(e["registros"] / e["segundos"], 1) if e["segundos"] > 0 else None,
+                "bytes": e["bytes"],
+                "chamadas": e["chamadas"],
+                "pico_rss_mb": e["pico_rss_mb"],
+            }
+
+    def resumo(self):
+        return {
+            "tabela": self.nome_tabela,
+            "segundos_total": round(time.time() - self.inicio, 4),
+            "pico_rss_mb": pico_rss_mb(),
+            "erro": self.erro,
+            "etapas": {linha.pop("etapa"): linha for linha in self.linhas()},
+        }
+
+    def emitir(self):
+        linhas = [json.dumps(linha, ensure_ascii=False) for linha in self.linhas()]
+        for linha in linhas:
+            print(linha)
+        if self.arquivo:
+            with open(self.arquivo, "a", encoding="utf-8") as f:
+                f.write("\n".join(linhas) + "\n")
@@ -0,0 +1,179 @@
+#Matheus Dias de Aviz
+#Porte vetorizado (NumPy) de T-SQL/Fn_UTMtoLatLon.sql + T-SQL/fn_UTMtoLatLon_aux.sql
+#Série inversa de Krüger + correção por zona (22/23) + calibração linear a + b*X + c*Y
+#Converte arrays inteiros de (x, y, zona, hemisfério sul) de uma vez, sem pyproj
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+
+import numpy as np
+
+# --- CONSTANTES (mesmas do CTE "consts" da função SQL) ---
+A = 6378137.0
+F = 1.0 / 298.257222101
+K0 = 0.9996
+
+# Correção por zona: (latitude, longitude) em graus - Fn_UTMtoLatLon.sql
+CORRECOES_ZONA = {
+    23: (-0.00000660005, 0.0000000123),
+    22: (-0.00007341, 0.0000004662),
+}
+
+# Os 6 coeficientes de fn_UTMtoLatLon_aux.sql: Resultado_Final = Resultado_Bruto + (a + b*X + c*Y)
+COEFICIENTES_CALIBRACAO = {
+    "a_lat": -0.000311338159541348,
+    "b_lat": 1.58413908553208E-10,
+    "c_lat": 3.15225255775211E-11,
+    "a_lon": -1.02999564448405E-07,
+    "b_lon": -1.73997842401354E-20,
+    "c_lon": -5.7582410969698E-20,
+}
+
+def _arredondar(valor, casas):
+    return valor.quantize(Decimal(1).scaleb(-casas), rounding=ROUND_HALF_UP)
+
+def constantes_tsql():
+    # No SQL Server os literais (6378137.0, 1.0/298.257222101, 4.0, 64.0...) são NUMERIC, não FLOAT.
+    # e2, ep2 e o denominador de mu são calculados só com literais, então seguem as regras de
+    # precisão/escala do DECIMAL: quando a precisão passa de 38 dígitos a escala cai para 6.
+    # Aqui essas etapas são refeitas com Decimal para devolver exatamente os mesmos valores do banco.
+    with localcontext() as ctx:
+        ctx.prec = 76  # folga acima dos 38 dígitos do SQL Server para os produtos intermediários
+        return _constantes_tsql_decimal()
+
+def _constantes_tsql_decimal():
+    a = Decimal('6378137.0')
+    um = Decimal('1.0')
+    f = _arredondar(um / Decimal('298.257222101'), 14)          # numeric(24,14)
+    b = a * (um - f)                                            # numeric(34,15), exato
+    numerador = _arredondar(a ** 2 - _arredondar(b ** 2, 15), 1) # subtração reduzida para numeric(38,1)
+    e2 = _arredondar(numerador / a ** 2, 6)                     # divisão > 38 dígitos -> numeric(38,6)
+    ep2 = _arredondar(numerador / _arredondar(b ** 2, 15), 6)
+    fator_mu = _arredondar(
+        um
+        - _arredondar(e2 / Decimal('4.0'), 6)
+        - _arredondar(3 * _arredondar(e2 ** 2, 6) / Decimal('64.0'), 6)
+        - _arredondar(5 * _arredondar(e2 ** 3, 6) / Decimal('256.0'), 6),
+        6,
+    )
+    return {
+        "e2": float(e2),
+        "ep2": float(ep2),
+        "denominador_mu": float(_arredondar(a * fator_mu, 6)),
+        "a_1_menos_e2": float(_arredondar(a * (um - e2), 6)),
+    }
+
+def constantes_float():
+    # Mesmas fórmulas em FLOAT puro (elipsoide GRS80 sem truncamento)
+    b = A * (1.0 - F)
+    e2 = (A ** 2 - b ** 2) / A ** 2
+    ep2 = (A ** 2 - b ** 2) / b ** 2
+    return {
+        "e2": e2,
+        "ep2": ep2,
+        "denominador_mu": A * (1.0 - e2 / 4.0 - 3 * e2 ** 2 / 64.0 - 5 * e2 ** 3 / 256.0),
+        "a_1_menos_e2": A * (1.0 - e2),
+    }
+
+CONSTANTES_TSQL = constantes_tsql()
+CONSTANTES_FLOAT = constantes_float()
+
+# --- FUNÇÃO PRINCIPAL ---
+def utm_para_latlon(x, y, zona, hemisferio_sul=True, correcao_zona=True, calibracao=True, precisao_tsql=True):
+    # x, y: arrays (ou escalares) em metros; zona e hemisferio_sul podem ser escalares ou arrays do mesmo tamanho.
+    # correcao_zona reproduz fn_UTMtoLatLon; calibracao acrescenta a camada de fn_UTMtoLatLon_aux.
+    # Retorna (latitude, longitude) em graus decimais.
+    c = CONSTANTES_TSQL if precisao_tsql else CONSTANTES_FLOAT
+    e2, ep2 = c["e2"], c["ep2"]
+
+    x_utm = np.asarray(x, dtype=np.float64)
+    y_utm = np.asarray(y, dtype=np.float64)
+    zona = np.asarray(zona)
+    hemisferio_sul = np.asarray(hemisferio_sul, dtype=bool)
+
+    xr = x_utm - 500000.0
+    yr = np.where(hemisferio_sul, y_utm - 10000000.0, y_utm)
+    lon0_deg = (zona * 6 - 183).astype(np.float64)
+
+    mu = (yr / K0) / c["denominador_mu"]
+    raiz = np.sqrt(1.0 - e2)
+    e1 = (1.0 - raiz) / (1.0 + raiz)
+
+    phi1 = (mu
+            + (3.0 * e1 / 2.0 - 27.0 * e1 ** 3 / 32.0) * np.sin(2.0 * mu)
+            + (21.0 * e1 ** 2 / 16.0 - 55.0 * e1 ** 4 / 32.0) * np.sin(4.0 * mu)
+            + (151.0 * e1 ** 3 / 96.0) * np.sin(6.0 * mu)
+            + (1097.0 * e1 ** 4 / 512.0) * np.sin(8.0 * mu))
+
+    sen2 = np.sin(phi1) ** 2
+    cos_phi1 = np.cos(phi1)
+    N1 = A / np.sqrt(1.0 - e2 * sen2)
+    T1 = np.tan(phi1)
+    C1 = ep2 * cos_phi1 ** 2
+    R1 = c["a_1_menos_e2"] / (1.0 - e2 * sen2) ** 1.5
+    T1_2 = T1 * T1
+    graus = 180.0 / np.pi
+
+    latitude = (phi1
+                - (T1 * xr ** 2) / (2.0 * R1 * N1 * K0 * K0)
+                + (T1 * (5.0 + 3.0 * T1_2 + 10.0 * C1 - 4.0 * C1 * C1 - 9.0 * ep2) * xr ** 4) / (24.0 * R1 * N1 ** 3 * K0 ** 4)
+                - (T1 * (61.0 + 90.0 * T1_2 + 298.0 * C1 + 45.0 * T1_2 ** 2 - 252.0 * ep2 - 3.0 * C1 * C1) * xr ** 6) / (720.0 * R1 * N1 ** 5 * K0 ** 6)
+                ) * graus
+    longitude = lon0_deg + ((xr / (N1 * cos_phi1 * K0))
+                            - ((1.0 + 2.0 * T1_2 + C1) * xr ** 3) / (6.0 * N1 ** 3 * cos_phi1 * K0 ** 3)
+                            + ((5.0 - 2.0 * C1 + 28.0 * T1_2 - 3.0 * C1 * C1 + 8.0 * ep2 + 24.0 * T1_2 ** 2) * xr ** 5) / (120.0 * N1 ** 5 * cos_phi1 * K0 ** 5)
+                            ) * graus
+
+    # CAMADA 1: compensação por zona (CASE WHEN @zone = 23 / 22)
+    if correcao_zona:
+        for z, (corr_lat, corr_lon) in CORRECOES_ZONA.items():
+            na_zona = zona == z
+            latitude = np.where(na_zona, latitude + corr_lat, latitude)
+            longitude = np.where(na_zona, longitude + corr_lon, longitude)
+
+    # CAMADA 2: calibração linear de fn_UTMtoLatLon_aux (usa X/Y originais, não os deslocados)
+    if calibracao:
+        k = COEFICIENTES_CALIBRACAO
+        latitude = latitude + (k["a_lat"] + k["b_lat"] * x_utm + k["c_lat"] * y_utm)
+        longitude = longitude + (k["a_lon"] + k["b_lon"] * x_utm + k["c_lon"] * y_utm)
+
+    return latitude, longitude
+
+def zona_do_epsg(epsg):
+    # SIRGAS 2000 / UTM zona S: EPSG:31978 (18S) ... EPSG:31985 (25S)
+    codigo = int(str(epsg).upper().replace("EPSG:", ""))
+    if not 31978 <= codigo <= 31985:
+        raise ValueError(f"EPSG {epsg} não é SIRGAS 2000 / UTM hemisfério sul.")
+    return codigo - 31960
+
+# Opções do pipeline de centroides ("motor_reprojecao" na config)
+#   "numpy":      série de Krüger em float puro, equivalente ao pyproj (sem correções)
+#   "numpy_tsql": mesmo resultado de fn_UTMtoLatLon_aux no banco (DECIMAL + correção de zona + calibração)
+#   "grade" / "grade_tsql": interpolação numa grade pré-calculada sobre SP (grade_utm_latlon.py), erro < 3 mm
+MOTORES = {
+    "numpy": dict(correcao_zona=False, calibracao=False, precisao_tsql=False),
+    "numpy_tsql": dict(correcao_zona=True, calibracao=True, precisao_tsql=True),
+}
+MOTORES_GRADE = ("grade", "grade_tsql")
+
+def latlon_do_epsg(x, y, epsg_origem, motor="numpy"):
+    if motor in MOTORES_GRADE:
+        from grade_utm_latlon import latlon_por_grade  # importado aqui: grade_utm_latlon depende deste módulo
+        return latlon_por_grade(x, y, zona_do_epsg(epsg_origem), motor)
+    return utm_para_latlon(x, y, zona_do_epsg(epsg_origem), hemisferio_sul=True, **MOTORES[motor])
+
+# --- CONFERÊNCIA COM PYPROJ ---
+if __name__ == "__main__":
+    from pyproj import Transformer
+
+    x, y = np.meshgrid(np.linspace(170000, 830000, 200), np.linspace(7180000, 7820000, 200))
+    x, y = x.ravel(), y.ravel()
+
+    for zona in (22, 23):
+        lon_ref, lat_ref = Transformer.from_crs(f"EPSG:{31960 + zona}", "EPSG:4674", always_xy=True).transform(x, y)
+        for nome, opcoes in [
+            ("série pura (float)", dict(correcao_zona=False, calibracao=False, precisao_tsql=False)),
+            ("fn_UTMtoLatLon", dict(calibracao=False)),
+            ("fn_UTMtoLatLon_aux", dict()),
+        ]:
+            lat, lon = utm_para_latlon(x, y, zona, **opcoes)
+            print(f"Zona {zona}S | {nome:20s} | diferença máx. para pyproj: "
+                  f"lat {np.abs(lat - lat_ref).max():.2e}°  lon {np.abs(lon - lon_ref).max():.2e}°")
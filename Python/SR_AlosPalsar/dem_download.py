@@ -1,14 +1,130 @@
 #Use a lista de fileID gerada por footprints_search.py
+#Downloads simultâneos (downloads_simultaneos) com a mesma ASFSession autenticada em todas as threads;
+#cada zip baixado vai para a fila de extração enquanto os próximos continuam baixando.
+#O download em si continua sendo o do asf_search (redirecionamentos do Earthdata/S3); o progresso vem do tamanho do .part.
+#Falha em um grânulo não interrompe os demais: os nomes com erro ficam em falhas_download.txt para uma nova rodada
 import asf_search as asf
 from getpass import getpass
 import os
 import zipfile
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # --- CONFIGURAÇÕES ---
 download_path = 'temp_downloads'
 dem_path = 'dems_finais_sp'
 granule_list_file = 'list_img.txt'
+falhas_file = 'falhas_download.txt'
+downloads_simultaneos = 4     # 1 = um download por vez
+extracoes_simultaneas = 1     # extração é leitura/escrita local; 1 thread costuma bastar
+zips_em_espera = 2            # zips baixados aguardando extração; acima disso os downloads seguintes esperam
+intervalo_leitura = 2         # segundos entre as leituras do tamanho dos arquivos em download
+intervalo_progresso = 15      # segundos entre os relatórios de vazão total
+
+class Progresso:
+    # Bytes por arquivo e no total; uma thread lê o tamanho dos .part em download a cada intervalo_leitura
+    def __init__(self, total_arquivos):
+        self.lock = threading.Lock()
+        self.parar = threading.Event()
+        self.total_arquivos = total_arquivos
+        self.inicio = time.time()
+        self.ultimo_relatorio = self.inicio
+        self.bytes_concluidos = 0
+        self.iniciados = 0
+        self.arquivos = {}
+
+    def iniciar(self, nome, caminho, tamanho):
+        with self.lock:
+            self.iniciados += 1
+            self.arquivos[nome] = [caminho, tamanho, 0]  # arquivo parcial, tamanho, último quarto informado
+
+    def concluir(self, nome, n_bytes):
+        with self.lock:
+            self.arquivos.pop(nome, None)
+            self.bytes_concluidos += n_bytes
+
+    @property
+    def bytes_total(self):
+        with self.lock:
+            em_andamento = sum(self._baixado(caminho) for caminho, _, _ in self.arquivos.values())
+            return self.bytes_concluidos + em_andamento
+
+    @staticmethod
+    def _baixado(caminho):
+        try:
+            return os.path.getsize(caminho)
+        except OSError:
+            return 0
+
+    def acompanhar(self):
+        while not self.parar.wait(intervalo_leitura):
+            with self.lock:
+                for nome, arquivo in self.arquivos.items():
+                    caminho, tamanho, quarto = arquivo
+                    baixado = self._baixado(caminho)
+                    if tamanho and baixado * 4 // tamanho > quarto:
+                        arquivo[2] = baixado * 4 // tamanho
+                        print(f"    - {nome}: {baixado / 1e6:.0f}/{tamanho / 1e6:.0f} MB ({baixado / tamanho:.0%})")
+            agora = time.time()
+            if agora - self.ultimo_relatorio >= intervalo_progresso:
+                self.ultimo_relatorio = agora
+                print(f"    >> {self.bytes_total / 1e6:.0f} MB baixados | {self.vazao():.1f} MB/s | "
+                      f"{self.iniciados} de {self.total_arquivos} downloads iniciados")
+
+    def vazao(self):
+        segundos = time.time() - self.inicio
+        return self.bytes_total / 1e6 / segundos if segundos > 0 else 0
+
+def baixar(product, session, progresso, vagas):
+    # product.download (asf_search) grava num .part, renomeado só no fim (um zip incompleto nunca chega à extração).
+    # A vaga de zip em disco só é devolvida depois da extração (ou aqui, se o download falhar).
+    zip_filename = product.properties['fileName']
+    zip_filepath = os.path.join(download_path, zip_filename)
+    parcial = zip_filepath + '.part'
+    vagas.acquire()
+    try:
+        # O asf_search pula o download se o arquivo já existir: um .part de uma rodada interrompida é descartado
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        progresso.iniciar(zip_filename, parcial, product.properties.get('bytes'))
+        product.download(path=download_path, filename=os.path.basename(parcial), session=session)
+        progresso.concluir(zip_filename, os.path.getsize(parcial))
+        os.replace(parcial, zip_filepath)
+        return zip_filepath
+    except Exception:
+        progresso.concluir(zip_filename, 0)
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        vagas.release()
+        raise
+
+def extrair_dem(zip_filepath, vagas):
+    # Extrai só o DEM, apaga o zip e libera a vaga para o próximo download; devolve o caminho do DEM ou None se o zip não tiver DEM
+    zip_filename = os.path.basename(zip_filepath)
+    try:
+        with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
+            dem_files = [
+                name for name in zip_ref.namelist()
+                if name.lower().endswith('_dem.tif') or name.lower().endswith('.dem.tif')
+            ]
+
+            if not dem_files:
+                print(f"    - AVISO: Nenhum arquivo DEM (_dem.tif ou .dem.tif) encontrado em {zip_filename}.")
+                print(f"    - Conteúdo do zip: {zip_ref.namelist()}")
+                return None
+
+            full_dem_path_in_zip = dem_files[0]
+            dest_filepath = os.path.join(dem_path, os.path.basename(full_dem_path_in_zip))
+            with zip_ref.open(full_dem_path_in_zip) as source_file:
+                with open(dest_filepath, 'wb') as dest_file:
+                    shutil.copyfileobj(source_file, dest_file)
+            return dest_filepath
+    finally:
+        if os.path.exists(zip_filepath):
+            os.remove(zip_filepath)
+        vagas.release()
 
 os.makedirs(download_path, exist_ok=True)
 os.makedirs(dem_path, exist_ok=True)
@@ -20,10 +136,10 @@ try:
     print(f"\nLendo a lista de imagens do arquivo '{granule_list_file}'...")
     with open(granule_list_file, 'r') as f:
         lista_de_granulos = [line.strip() for line in f if line.strip()]
-    
+
     if not lista_de_granulos:
         raise ValueError("O arquivo 'list_img.txt' está vazio ou não foi encontrado.")
-        
+
     print(f"{len(lista_de_granulos)} imagens serão processadas.")
 
     # --- AUTENTICAÇÃO ---
@@ -40,49 +156,63 @@ try:
     print(f"Busca concluída. {total_files} produtos correspondentes encontrados.")
 
     if total_files > 0:
-        print("\nIniciando o processo de download e extração...")
-
-        for index, product in enumerate(results):
-            zip_filename = product.properties['fileName']
-            zip_filepath = os.path.join(download_path, zip_filename)
-            
-            print(f"\n({index + 1}/{total_files}) Processando: {zip_filename}")
-
-            try:
-                print(f"    - Baixando zip...")
-                product.download(path=download_path, session=session)
-                
-                print(f"    - Procurando por DEM no zip...")
-                with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
-                    dem_files = [
-                        name for name in zip_ref.namelist() 
-                        if name.lower().endswith('_dem.tif') or name.lower().endswith('.dem.tif')
-                    ]
-                  
-                    if dem_files:
-                        full_dem_path_in_zip = dem_files[0]
-                        dem_basename = os.path.basename(full_dem_path_in_zip)
-                        dest_filepath = os.path.join(dem_path, dem_basename)
-                        
-                        print(f"    - DEM encontrado: '{full_dem_path_in_zip}'. Extraindo...")
-                        
-                        with zip_ref.open(full_dem_path_in_zip) as source_file:
-                            with open(dest_filepath, 'wb') as dest_file:
-                                shutil.copyfileobj(source_file, dest_file)
-                        
-                        print(f"   ✅ - DEM salvo com sucesso!")
+        print(f"\nIniciando o download ({downloads_simultaneos} simultâneos) e a extração...")
+        progresso = Progresso(total_files)
+        acompanhamento = threading.Thread(target=progresso.acompanhar, daemon=True)
+        acompanhamento.start()
+        # Zips em disco (baixando, aguardando ou em extração) nunca passam deste limite
+        vagas = threading.Semaphore(downloads_simultaneos + zips_em_espera)
+        ids = {product.properties['fileName']: product.properties.get('fileID') or product.properties['fileName']
+               for product in results}
+        falhas = []
+        sem_dem = []
+        salvos = 0
+        concluidos = 0
+
+        with ThreadPoolExecutor(max_workers=downloads_simultaneos) as pool_download, \
+             ThreadPoolExecutor(max_workers=extracoes_simultaneas) as pool_extracao:
+            # Downloads e extrações no mesmo laço: cada resultado (ou erro) é informado assim que sai
+            pendentes = {pool_download.submit(baixar, product, session, progresso, vagas):
+                         ('download', product.properties['fileName']) for product in results}
+            while pendentes:
+                prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    etapa, zip_filename = pendentes.pop(futuro)
+                    if etapa == 'download':
+                        try:
+                            zip_filepath = futuro.result()
+                        except Exception as e:
+                            concluidos += 1
+                            falhas.append(zip_filename)
+                            print(f"   ❌ - ({concluidos}/{total_files}) ERRO ao baixar {zip_filename}: {e}")
+                            continue
+                        print(f"    - {zip_filename} baixado. Extraindo DEM...")
+                        pendentes[pool_extracao.submit(extrair_dem, zip_filepath, vagas)] = ('extracao', zip_filename)
+                        continue
+
+                    concluidos += 1
+                    try:
+                        dest_filepath = futuro.result()
+                    except Exception as e:
+                        falhas.append(zip_filename)
+                        print(f"   ❌ - ({concluidos}/{total_files}) ERRO ao extrair {zip_filename}: {e}")
+                        continue
+                    if dest_filepath is None:
+                        sem_dem.append(zip_filename)
                     else:
-                        print(f"    - AVISO: Nenhum arquivo DEM (_dem.tif ou .dem.tif) encontrado neste zip.")
-                        print(f"    - Conteúdo do zip: {zip_ref.namelist()}")
-
-            except Exception as e:
-                print(f"   ❌ - ERRO ao processar o arquivo {zip_filename}: {e}")
-            
-            finally:
-                if os.path.exists(zip_filepath):
-                    print(f"    - Deletando zip para liberar espaço...")
-                    os.remove(zip_filepath)
-        
+                        salvos += 1
+                        print(f"   ✅ - ({concluidos}/{total_files}) DEM salvo: {os.path.basename(dest_filepath)}")
+
+        progresso.parar.set()
+        segundos = time.time() - progresso.inicio
+        print(f"\n{progresso.bytes_total / 1e9:.2f} GB baixados em {segundos / 60:.1f} min ({progresso.vazao():.1f} MB/s)")
+        print(f"DEMs salvos: {salvos} | sem DEM: {len(sem_dem)} | falhas: {len(falhas)}")
+        if falhas:
+            # Mesmo formato do list_img.txt (fileID) para rodar de novo só o que falhou
+            with open(falhas_file, 'w') as f:
+                f.write("\n".join(ids[nome] for nome in falhas) + "\n")
+            print(f"Grânulos com falha listados em '{falhas_file}'.")
+
         print("\n\n 🆗 Processo concluído!")
 
 except Exception as e:
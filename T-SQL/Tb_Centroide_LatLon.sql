@@ -0,0 +1,62 @@
+USE [id_banco];
+GO
+
+-- Autor: Matheus Aviz
+-- Tabela materializada de centroides (substitui o recálculo da view de Query_Fn_UTMtoLatLon.sql)
+-- A view passa a ler esta tabela: cada SELECT vira uma busca por índice, sem MakeValid/STCentroid/trigonometria.
+-- Quem mantém a tabela é Python/MSSQL/centroide_materializado.py:
+--   "reconstruir": recalcula tudo em lotes (carga inicial ou após perda do histórico do Change Tracking)
+--   "incremental": recalcula só as linhas cuja geometria mudou desde a última versão sincronizada
+
+-- 1. CHANGE TRACKING (a tabela de origem precisa de chave primária - qgs_fid)
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_databases WHERE database_id = DB_ID())
+    ALTER DATABASE [id_banco] SET CHANGE_TRACKING = ON (CHANGE_RETENTION = 7 DAYS, AUTO_CLEANUP = ON);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('[TERRAS].[TbOrigemDados]'))
+    ALTER TABLE [TERRAS].[TbOrigemDados] ENABLE CHANGE_TRACKING WITH (TRACK_COLUMNS_UPDATED = ON);
+GO
+
+-- 2. TABELA MATERIALIZADA
+IF OBJECT_ID('[SCHEMA].[TbCentroideLatLon]', 'U') IS NULL
+CREATE TABLE [SCHEMA].[TbCentroideLatLon] (
+    ID INT NOT NULL,                        -- qgs_fid da tabela de origem
+    IDTERRENO INT NULL,
+    Centroide_Latitude FLOAT NULL,
+    Centroide_Longitude FLOAT NULL,
+    Centroide_LatLon_WKT VARCHAR(100) NULL,
+    DataAtualizacao DATETIME2(0) NOT NULL CONSTRAINT DF_TbCentroideLatLon_Data DEFAULT SYSDATETIME(),
+    CONSTRAINT PK_TbCentroideLatLon PRIMARY KEY CLUSTERED (ID)
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_TbCentroideLatLon_IDTERRENO')
+    CREATE NONCLUSTERED INDEX IX_TbCentroideLatLon_IDTERRENO
+        ON [SCHEMA].[TbCentroideLatLon] (IDTERRENO)
+        INCLUDE (Centroide_Latitude, Centroide_Longitude);
+GO
+
+-- 3. CONTROLE DE SINCRONIZAÇÃO (última versão do Change Tracking já aplicada)
+IF OBJECT_ID('[SCHEMA].[TbCentroideLatLon_Controle]', 'U') IS NULL
+CREATE TABLE [SCHEMA].[TbCentroideLatLon_Controle] (
+    TabelaOrigem SYSNAME NOT NULL PRIMARY KEY,
+    UltimaVersao BIGINT NOT NULL,
+    DataAtualizacao DATETIME2(0) NOT NULL DEFAULT SYSDATETIME()
+);
+GO
+
+-- 4. A VIEW CONTINUA COM O MESMO NOME E AS MESMAS COLUNAS, AGORA SÓ LENDO A TABELA
+IF OBJECT_ID('[SCHEMA].[nomeVWouTb]', 'V') IS NOT NULL
+    DROP VIEW [SCHEMA].[nomeVWouTb];
+GO
+
+CREATE VIEW [SCHEMA].[nomeVWouTb]
+AS
+SELECT
+    ID,
+    Centroide_Latitude,
+    Centroide_Longitude,
+    Centroide_LatLon_WKT
+FROM
+    [SCHEMA].[TbCentroideLatLon];
+GO
@@ -0,0 +1,45 @@
+USE [id_banco]
+GO
+
+-- Autor: Matheus Aviz
+-- ARQUIVO GERADO por Python/MSSQL/gerar_fn_utm_latlon.py - altere o gerador, não este arquivo
+-- UTM -> Lat/Lon (Krüger) com correção por zona e calibração de fn_UTMtoLatLon_aux já incorporadas.
+-- Constantes do elipsoide pré-calculadas como literais FLOAT; uma única consulta por ponto.
+
+CREATE OR ALTER FUNCTION [SCHEMA].[fn_UTMtoLatLon_Calibrada]
+(
+    @x FLOAT,
+    @y FLOAT,
+    @zone INT,
+    @southHem BIT
+)
+RETURNS TABLE
+WITH SCHEMABINDING
+AS
+RETURN
+(
+    SELECT
+        (phi1 - (N1 * tan_phi / R1) * (D2 / 2.0E0 - (4.93934899999999999E+00 + 3.0E0 * T + 1.0E1 * C - 4.0E0 * C * C) * D2 * D2 / 2.4E1 + (5.93017719999999997E+01 + 9.0E1 * T + 2.98E2 * C + 4.5E1 * T * T - 3.0E0 * C * C) * D2 * D2 * D2 / 7.2E2)) * 5.72957795130823229E+01 + IIF(@zone = 23, (-3.17938209541348009E-04), IIF(@zone = 22, (-3.84748159541347984E-04), (-3.11338159541347994E-04))) + 1.58413908553208008E-10 * @x + 3.15225255775210975E-11 * @y AS Latitude,
+        (@zone * 6 - 183) + (D - (1.0E0 + 2.0E0 * T + C) * D2 * D / 6.0E0 + (5.05391200000000040E+00 - 2.0E0 * C + 2.8E1 * T - 3.0E0 * C * C + 2.4E1 * T * T) * D2 * D2 * D / 1.2E2) / cos_phi * 5.72957795130823229E+01 + IIF(@zone = 23, (-9.06995644484050064E-08), IIF(@zone = 22, 3.63200435551594962E-07, (-1.02999564448405004E-07))) + (-1.73997842401354007E-20) * @x + (-5.75824109696979980E-20) * @y AS Longitude
+    FROM (SELECT
+            (@y - @southHem * 1.0E7) * 1.57111652752201354E-07 AS mu,
+            @x - 5.0E5 AS xr) AS p1
+    CROSS APPLY (SELECT
+            mu + 2.51868312884886243E-03 * SIN(2.0E0 * mu) + 3.70052748515939767E-06 * SIN(4.0E0 * mu) + 7.44654130273177619E-09 * SIN(6.0E0 * mu) + 1.70321125321889480E-11 * SIN(8.0E0 * mu) AS phi1) AS p2
+    CROSS APPLY (SELECT
+            SIN(phi1) AS sen_phi,
+            COS(phi1) AS cos_phi,
+            TAN(phi1) AS tan_phi) AS p3
+    CROSS APPLY (SELECT
+            1.0E0 - 6.69400000000000030E-03 * sen_phi * sen_phi AS w,
+            tan_phi * tan_phi AS T,
+            6.73900000000000020E-03 * cos_phi * cos_phi AS C) AS p4
+    CROSS APPLY (SELECT
+            6.37813700000000000E+06 / SQRT(w) AS N1,
+            6.33544175092200004E+06 / (w * SQRT(w)) AS R1) AS p5
+    CROSS APPLY (SELECT
+            xr / (N1 * 9.99600000000000044E-01) AS D) AS p6
+    CROSS APPLY (SELECT
+            D * D AS D2) AS p7
+);
+GO